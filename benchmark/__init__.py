@@ -0,0 +1,6 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
@@ -0,0 +1,270 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+"""
+Time each phase of the plugin against synthetic sites of increasing size
+
+    python -m benchmark.run --sizes 1000 10000 50000
+
+Fails if any phase is slower than the stored baseline by more than the
+allowed tolerance and a small absolute floor; record a new baseline with
+--update-baseline
+"""
+
+from argparse import ArgumentParser
+from itertools import chain
+from json import dumps, loads
+import logging
+from multiprocessing import get_context
+from pathlib import Path
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import tracemalloc
+
+from pelican.generators import ArticlesGenerator, StaticGenerator
+from pelican.plugins.enhanced_unfurls.metadata import enhance_metadata
+from pelican.plugins.enhanced_unfurls.oembed import OEmbedGenerator, add_sources
+from pelican.plugins.enhanced_unfurls.tagging import insert_tags
+from pelican.settings import read_settings
+
+from .sitegen import generate_site
+
+BASELINE = Path(__file__).with_name("baseline.json")
+
+# Differences below which a metric is never a regression, however small the
+# baseline, so that phases taking milliseconds are not failed by noise
+FLOORS = {"seconds": 0.25, "peak_kib": 512}
+
+
+def build_context(root, output, site):
+    """
+    Read a synthetic site the same way Pelican would before plugins run
+
+    :param root: (pathlib.Path) Directory the site was generated in
+    :param output: (pathlib.Path) Directory to write output to
+    :param site: (dict) Site layout, as returned by generate_site
+
+    :returns: (tuple) Static, articles and oEmbed generators
+    """
+    settings = read_settings(
+        override={
+            "PATH": str(root),
+            "OUTPUT_PATH": str(output),
+            "SITEURL": "http://example.com",
+            "SITENAME": "Benchmark",
+            "TIMEZONE": "UTC",
+            "ARTICLE_PATHS": site["articles"],
+            "STATIC_PATHS": site["static"],
+            "CACHE_CONTENT": False,
+            "LOAD_CONTENT_CACHE": False,
+            "ENHANCED_UNFURLS": {
+                "facebook": True,
+                "twitter": True,
+                "oembed": True,
+                "first_image_lede": True,
+            },
+        }
+    )
+    context = settings.copy()
+    context["generated_content"] = {}
+    context["static_links"] = set()
+    context["static_content"] = {}
+    context["localsiteurl"] = settings["SITEURL"]
+    kwargs = {
+        "context": context,
+        "settings": settings,
+        "path": str(root),
+        "theme": settings["THEME"],
+        "output_path": str(output),
+    }
+
+    generators = (
+        StaticGenerator(**kwargs),
+        ArticlesGenerator(**kwargs),
+        OEmbedGenerator(**kwargs),
+    )
+    generators[0].generate_context()
+    generators[1].generate_context()
+    add_sources(generators)
+
+    return generators
+
+
+def measure(phase, traced):
+    """
+    Measure the wall time or peak memory of a phase
+
+    :param phase: (callable) Phase to run
+    :param traced: (bool) Whether to trace allocations rather than time the
+                          phase, since tracing skews timing
+
+    :returns: (dict) Seconds taken, or peak memory allocated in KiB
+    """
+    if traced:
+        tracemalloc.start()
+        phase()
+        (_, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"peak_kib": peak // 1024}
+
+    start = perf_counter()
+    phase()
+    return {"seconds": round(perf_counter() - start, 4)}
+
+
+def run_phases(root, site, traced):
+    """
+    Run each phase of the plugin once against a freshly read site
+
+    :param root: (pathlib.Path) Directory the site was generated in
+    :param site: (dict) Site layout, as returned by generate_site
+    :param traced: (bool) Whether to trace allocations rather than time phases
+
+    :returns: (dict) Measurements, keyed by phase
+    """
+    with TemporaryDirectory() as output:
+        (stat_gen, art_gen, oembed_gen) = build_context(root, Path(output), site)
+
+        def _insert_tags():
+            # Tags are built when a template first reads them, so read them
+            for article in chain(art_gen.articles, art_gen.translations):
+                insert_tags(art_gen, article)
+                article.unfurl_html
+                getattr(article, "oembed_url", None)
+
+        phases = (
+            ("enhance_metadata", lambda: enhance_metadata([stat_gen, art_gen])),
+            ("insert_tags", _insert_tags),
+            ("generate_output", oembed_gen.generate_output),
+        )
+
+        return {name: measure(phase, traced) for (name, phase) in phases}
+
+
+def run_size(size, translations, images, static_files, repeats):
+    """
+    Benchmark each phase of the plugin against a site of the given size
+
+    Time and memory are measured in separate runs, each in a fresh process
+    with empty output, so neither sees the state the other leaves behind;
+    the fastest of the timed runs is kept, since slower ones only add noise
+
+    :param size: (int) Number of articles
+    :param translations: (float) Number of translations per article
+    :param images: (int) Number of images per article
+    :param static_files: (int) Number of static images
+    :param repeats: (int) Number of timed runs
+
+    :returns: (dict) Measurements, keyed by phase
+    """
+    results = {}
+
+    with TemporaryDirectory() as tmp:
+        root = Path(tmp).joinpath("content")
+        site = generate_site(
+            root,
+            articles=size,
+            translations=int(size * translations),
+            images=images,
+            static_files=static_files,
+        )
+
+        for traced in [False] * repeats + [True]:
+            with get_context("spawn").Pool(1) as pool:
+                measured = pool.apply(run_phases, (root, site, traced))
+
+            for (phase, result) in measured.items():
+                for (metric, value) in result.items():
+                    kept = results.setdefault(phase, {}).get(metric, value)
+                    results[phase][metric] = min(kept, value)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Find phases which are slower than the baseline allows
+
+    A phase regresses when it is worse than the baseline by both the
+    tolerance and the metric's floor
+
+    :param results: (dict) Measurements, keyed by size then phase
+    :param baseline: (dict) Baseline measurements, keyed by size then phase
+    :param tolerance: (float) Allowed slowdown, as a fraction of the baseline
+
+    :returns: (list) Descriptions of regressed phases
+    """
+    regressions = []
+
+    for (size, phases) in results.items():
+        for (phase, result) in phases.items():
+            base = baseline.get(size, {}).get(phase)
+
+            if base is None:
+                continue
+
+            for metric in ("seconds", "peak_kib"):
+                limit = max(
+                    base[metric] * (1 + tolerance), base[metric] + FLOORS[metric]
+                )
+
+                if result[metric] > limit:
+                    regressions.append(
+                        f"{phase} @ {size}: {metric} {result[metric]} > {limit:.4f}"
+                    )
+
+    return regressions
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 50000])
+    parser.add_argument("--translations", type=float, default=0.2)
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--static-files", type=int, default=500)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    results = {}
+
+    for size in args.sizes:
+        results[str(size)] = run_size(
+            size, args.translations, args.images, args.static_files, args.repeats
+        )
+
+        for (phase, result) in results[str(size)].items():
+            print(
+                f"{size:>7} {phase:<18} {result['seconds']:>10.4f}s "
+                f"{result['peak_kib']:>10} KiB peak"
+            )
+
+    if args.update_baseline:
+        baseline = loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update(results)
+        args.baseline.write_text(dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --update-baseline first")
+        return 0
+
+    regressions = compare(results, loads(args.baseline.read_text()), args.tolerance)
+
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from random import Random
+
+# Smallest valid PNG: a single transparent pixel
+PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082"
+)
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam"
+).split()
+
+ARTICLE = """<html>
+<head>
+<title>{title}</title>
+<meta name="date" content="{date}" />
+<meta name="category" content="{category}" />
+<meta name="slug" content="{slug}" />
+<meta name="lang" content="{lang}" />
+{extra}</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def paragraph(rng, words=60):
+    """
+    Generate a paragraph of filler text
+
+    :param rng: (random.Random) Random number generator
+    :param words: (int) Number of words in the paragraph
+
+    :returns: (str) Paragraph HTML
+    """
+    return f"<p>{' '.join(rng.choice(WORDS) for _ in range(words))}</p>"
+
+
+def generate_site(
+    root,
+    articles=1000,
+    translations=0,
+    images=1,
+    static_files=100,
+    paragraphs=10,
+    seed=0,
+):
+    """
+    Generate a synthetic Pelican site of HTML articles and static images
+
+    The same arguments always produce the same site
+
+    :param root: (pathlib.Path) Directory to generate the site in
+    :param articles: (int) Number of articles
+    :param translations: (int) Number of translations, spread over the articles
+    :param images: (int) Number of images linked from each article
+    :param static_files: (int) Number of static images
+    :param paragraphs: (int) Number of paragraphs in each article
+    :param seed: (int) Seed for generated content
+
+    :returns: (dict) Paths of the generated content and static directories
+    """
+    rng = Random(seed)
+    root = Path(root)
+    posts = root.joinpath("posts")
+    static = root.joinpath("images")
+    posts.mkdir(parents=True, exist_ok=True)
+    static.mkdir(parents=True, exist_ok=True)
+
+    for i in range(static_files):
+        static.joinpath(f"image-{i}.png").write_bytes(PNG)
+
+    start = datetime(2010, 1, 1)
+
+    def _write(i, lang, suffix=""):
+        body = [paragraph(rng) for _ in range(paragraphs)]
+
+        # Spread images through the article, leaving the first paragraph alone
+        for j in range(images):
+            image = rng.randrange(max(static_files, 1))
+            src = f"{{static}}/images/image-{image}.png"
+            body.insert(
+                1 + (j * paragraphs) // max(images, 1),
+                f'<img src="{src}" alt="Image {image}" />',
+            )
+
+        extra = ""
+        if i % 5 == 0:
+            extra = f'<meta name="lede" content="{{static}}/images/image-{i}.png" />\n'
+
+        posts.joinpath(f"article-{i}{suffix}.html").write_text(
+            ARTICLE.format(
+                title=f"Article {i} ({lang})",
+                date=(start + timedelta(hours=i)).strftime("%Y-%m-%d %H:%M"),
+                category=f"category-{i % 10}",
+                slug=f"article-{i}",
+                lang=lang,
+                extra=extra,
+                body="\n".join(body),
+            ),
+            encoding="utf-8",
+        )
+
+    for i in range(articles):
+        _write(i, "en")
+
+    for t in range(translations):
+        i = t % max(articles, 1)
+        lang = f"l{t // max(articles, 1)}"
+        _write(i, lang, f"-{lang}")
+
+    return {"content": root, "articles": ["posts"], "static": ["images"]}
@@ -7,12 +7,52 @@
 
 from pelican import signals
 
+from .cache import save_caches
+from .manifest import write_manifest
 from .metadata import enhance_metadata
-from .oembed import add_generator
-from .tagging import insert_tags
+from .oembed import add_generator, add_sources
+from .profiling import install_profiling, write_profiles
+from .sharding import write_shard
+from .stats import report_stats
+from .tagging import insert_tags, insert_unsignaled_tags, reset_plans
+from .tracking import reset_tracked
+from .validate import validate_output
+
+# Handlers which depend on each other's work, in the order they run; Pelican
+# before 4.9 makes no promise about the order of a signal's receivers
+GENERATORS_FINALIZED = (enhance_metadata, insert_unsignaled_tags, add_sources)
+FINALIZED = (
+    write_manifest,
+    validate_output,
+    write_shard,
+    reset_tracked,
+    reset_plans,
+    save_caches,
+    write_profiles,
+    report_stats,
+)
+
+
+def finalize_generators(generators):
+    """
+    :param generators: (list) Generators that have finished reading content
+    """
+    for handler in GENERATORS_FINALIZED:
+        handler(generators)
+
+
+def finalize(pelican):
+    """
+    :param pelican: (pelican.Pelican) Pelican instance that has finished a build
+    """
+    for handler in FINALIZED:
+        handler(pelican)
 
 
 def register():
-    signals.all_generators_finalized.connect(enhance_metadata)
+    signals.initialized.connect(install_profiling)
+    signals.all_generators_finalized.connect(finalize_generators)
     signals.article_generator_write_article.connect(insert_tags)
+    signals.page_generator_write_page.connect(insert_tags)
     signals.get_generators.connect(add_generator)
+    signals.finalized.connect(finalize)
@@ -0,0 +1,212 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+"""
+Consolidated oEmbed output: records are written into a few bundle files,
+sharded by a stable hash of their URL, alongside an index mapping each URL to
+the shard, offset and length of its record. A small reference handler serves
+individual records straight from the memory-mapped bundles.
+"""
+
+from contextlib import suppress
+from filecmp import cmp
+from json import dumps, loads
+from logging import getLogger
+from mmap import ACCESS_READ, mmap
+import os
+from pathlib import Path
+from urllib.parse import parse_qs, quote
+from zlib import crc32
+
+logger = getLogger(__name__)
+
+INDEX_NAME = "index.json"
+DEFAULT_SHARDS = 16
+
+
+def shard_name(shard):
+    """
+    :param shard: (int) Shard number
+
+    :returns: (str) Filename of the shard's bundle
+    """
+    return f"shard-{shard:03d}.bundle"
+
+
+def shard_for(url, shards):
+    """
+    Pick the shard a URL's record is stored in
+
+    :param url: (str) URL of the content
+    :param shards: (int) Number of shards
+
+    :returns: (int) Shard number
+    """
+    return crc32(url.encode("utf-8")) % shards
+
+
+def endpoint_url(endpoint, url):
+    """
+    Build the URL of a piece of content's record at an oEmbed endpoint
+
+    :param endpoint: (str) URL of the oEmbed endpoint
+    :param url: (str) URL of the content
+
+    :returns: (str) URL of the content's oEmbed info
+    """
+    return f"{endpoint}?url={quote(url, safe='')}&format=json"
+
+
+def _replace_if_changed(tmp_path, path):
+    """
+    Move a freshly written file into place, unless an identical file is
+    already there
+
+    :param tmp_path: (pathlib.Path) Freshly written file
+    :param path: (pathlib.Path) Final location of the file
+
+    :returns: (bool) Whether the file was replaced
+    """
+    if path.exists() and cmp(tmp_path, path, shallow=False):
+        tmp_path.unlink()
+        return False
+
+    os.replace(tmp_path, path)
+    return True
+
+
+def write_bundle(records, root, shards=DEFAULT_SHARDS):
+    """
+    Write oEmbed records into sharded bundles in a single streaming pass
+
+    :param records: (iterable) (URL, serialized record) pairs
+    :param root: (pathlib.Path) Directory to write bundles and index to
+    :param shards: (int) Number of shards
+
+    :returns: (dict) Number of records, bundles replaced and bytes written
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    tmp_paths = [
+        root.joinpath(f".{shard_name(i)}.{os.getpid()}") for i in range(shards)
+    ]
+    handles = []
+    index = {}
+    written = 0
+
+    try:
+        for tmp_path in tmp_paths:
+            handles.append(tmp_path.open("wb"))
+
+        for (url, data) in records:
+            shard = shard_for(url, shards)
+            index[url] = (shard, handles[shard].tell(), len(data))
+            handles[shard].write(data)
+            written += len(data)
+
+    except BaseException:
+        for handle in handles:
+            handle.close()
+
+        for tmp_path in tmp_paths:
+            with suppress(OSError):
+                tmp_path.unlink()
+
+        raise
+
+    for handle in handles:
+        handle.close()
+
+    replaced = sum(
+        _replace_if_changed(tmp_path, root.joinpath(shard_name(i)))
+        for (i, tmp_path) in enumerate(tmp_paths)
+    )
+
+    index_data = dumps(
+        {"shards": shards, "records": index}, sort_keys=True, separators=(",", ":")
+    ).encode("utf-8")
+    index_tmp = root.joinpath(f".{INDEX_NAME}.{os.getpid()}")
+    index_tmp.write_bytes(index_data)
+    replaced += _replace_if_changed(index_tmp, root.joinpath(INDEX_NAME))
+
+    return {
+        "records": len(index),
+        "replaced": replaced,
+        "bytes": written + len(index_data),
+    }
+
+
+class BundleReader:
+    """
+    Reference lookup of individual oEmbed records from sharded bundles
+    """
+
+    def __init__(self, root):
+        """
+        :param root: (pathlib.Path) Directory holding the bundles and index
+        """
+        self.root = Path(root)
+        index = loads(self.root.joinpath(INDEX_NAME).read_bytes())
+        self.records = index["records"]
+        self._maps = {}
+
+    def _shard(self, shard):
+        buf = self._maps.get(shard)
+
+        if buf is None:
+            with self.root.joinpath(shard_name(shard)).open("rb") as f:
+                buf = self._maps[shard] = mmap(f.fileno(), 0, access=ACCESS_READ)
+
+        return buf
+
+    def lookup(self, url):
+        """
+        :param url: (str) URL of the content
+
+        :returns: (bytes) Serialized oEmbed record, or None if there is none
+        """
+        location = self.records.get(url)
+
+        if location is None:
+            return None
+
+        (shard, offset, length) = location
+        return self._shard(shard)[offset : offset + length]
+
+    def close(self):
+        for buf in self._maps.values():
+            buf.close()
+
+        self._maps.clear()
+
+    def __call__(self, environ, start_response):
+        """
+        Serve records as a WSGI application, following the oEmbed spec:
+        GET ?url=<content URL>[&format=json]
+        """
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        url = query.get("url", [None])[0]
+        fmt = query.get("format", ["json"])[0]
+
+        if fmt != "json":
+            start_response("501 Not Implemented", [("Content-Length", "0")])
+            return [b""]
+
+        record = None if url is None else self.lookup(url)
+
+        if record is None:
+            start_response("404 Not Found", [("Content-Length", "0")])
+            return [b""]
+
+        start_response(
+            "200 OK",
+            [
+                ("Content-Type", "application/json"),
+                ("Content-Length", str(len(record))),
+            ],
+        )
+        return [record]
@@ -0,0 +1,377 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from hashlib import sha1
+from logging import getLogger
+import os
+from time import time
+
+from pelican.cache import FileDataCacher, FileStampDataCacher
+
+from .images import fingerprint_file, probe_image
+from .static import get_static_index
+
+logger = getLogger(__name__)
+
+CACHE_NAME = "enhanced_unfurls"
+IMAGE_CACHE_NAME = "enhanced_unfurls_images"
+DIGEST_CACHE_NAME = "enhanced_unfurls_digests"
+REMOTE_CACHE_NAME = "enhanced_unfurls_remote"
+CACHE_VERSION = 8
+
+# Seconds the results of checking remote ledes are trusted for; failures are
+# kept briefly, so ledes which were only unreachable for a moment come back
+DEFAULT_REMOTE_TTL = 86400
+DEFAULT_REMOTE_FAILURE_TTL = 300
+
+# Site settings outside ENHANCED_UNFURLS which influence computed unfurls
+KEY_SETTINGS = (
+    "SITEURL",
+    "SITENAME",
+    "LOCALE",
+    "SUMMARY_MAX_LENGTH",
+    "SUMMARY_END_SUFFIX",
+    "DEFAULT_DATE_FORMAT",
+    "DATE_FORMATS",
+)
+
+# Unfurl settings naming files, relative to the content root, whose contents
+# change what is computed; cards are named after the files they are drawn with
+FILE_SETTINGS = ("card_background", "card_font")
+
+# Unfurl settings which only change how a build does its work, or what it
+# reports, not the metadata and tags it computes; changing them keeps the cache
+UNKEYED_SETTINGS = (
+    # Parallelism
+    "card_workers",
+    "derivative_workers",
+    "oembed_workers",
+    "validate_workers",
+    # Writing oEmbed output
+    "oembed_compress",
+    "oembed_compress_min_size",
+    "oembed_shards",
+    "oembed_bundle_path",
+    # Checking remote ledes, whose results are cached on their own
+    "remote_concurrency",
+    "remote_per_host",
+    "remote_timeout",
+    "remote_ttl",
+    "remote_failure_ttl",
+    "remote_min_size",
+    "remote_probe_bytes",
+    # Reporting
+    "stats",
+    "profile",
+    "profile_top",
+    "manifest",
+    "validate",
+    # Sharding
+    "shard_index",
+    "shard_count",
+    "shard_merge",
+    "shard_path",
+)
+
+_open_caches = {}
+
+
+class UnfurlCache(FileStampDataCacher):
+    """
+    Persistent store of computed unfurl metadata and tags, keyed on the
+    source path of each piece of content and invalidated when the source,
+    the relevant settings or any static content the unfurls used changes,
+    or when the check of a remote lede the unfurls used expires
+    """
+
+    def __init__(self, settings):
+        super().__init__(
+            settings,
+            CACHE_NAME,
+            settings.get("CACHE_CONTENT", False),
+            settings.get("LOAD_CONTENT_CACHE", False),
+        )
+
+    def static_stamp(self, link_obj):
+        """
+        Generate a stamp for a piece of static content
+
+        :param link_obj: (pelican.contents.Static) Static content, or None
+                                                   if it could not be found
+
+        :returns: Stamp of the static content's source file, or None
+        """
+        if link_obj is None:
+            return None
+
+        return self._get_file_stamp(link_obj.source_path)
+
+    def get_entry(self, content, key):
+        """
+        Retrieve the cached entry for a piece of content
+
+        :param content: (pelican.contents.Content) Content to look up
+        :param key: (str) Settings key the entry must have been computed with
+
+        :returns: (dict) Cached entry, or None if missing or stale
+        """
+        entry = self.get_cached_data(content.source_path)
+
+        if entry is None or entry["key"] != entry_key(content, key):
+            return None
+
+        index = get_static_index(content._context)
+        for (path, stamp) in entry["static"].items():
+            if self.static_stamp(index.paths.get(path)) != stamp:
+                return None
+
+        eu_settings = content._context.get("ENHANCED_UNFURLS", {})
+        now = time()
+        for (checked, ok) in entry["remote"].values():
+            if remote_expired(checked, ok, eu_settings, now):
+                return None
+
+        return entry
+
+    def new_entry(self, content, key, metadata, static_deps, remote_deps=None):
+        """
+        Cache freshly computed metadata for a piece of content
+
+        :param content: (pelican.contents.Content) Content the metadata is for
+        :param key: (str) Settings key the metadata was computed with
+        :param metadata: (dict) Computed metadata
+        :param static_deps: (dict) Static content used to compute
+                                   the metadata, keyed by static path
+        :param remote_deps: (dict) When each remote lede used to compute the
+                                   metadata was checked, and whether it was
+                                   available, keyed by URL
+
+        :returns: (dict) New cache entry
+        """
+        entry = {
+            "key": entry_key(content, key),
+            "static": {
+                path: self.static_stamp(link_obj)
+                for (path, link_obj) in static_deps.items()
+            },
+            "remote": dict(remote_deps or {}),
+            "metadata": metadata,
+            "translations": (None, None),
+            "tags": None,
+        }
+        self.cache_data(content.source_path, entry)
+        return entry
+
+
+class ImageCache(FileDataCacher):
+    """
+    Store of image dimensions, types and fingerprints, keyed on image path
+    and invalidated when the image's size or modification time changes
+
+    Probed images are always remembered for the rest of the build,
+    but only persisted between builds if content caching is enabled
+    """
+
+    def __init__(self, settings):
+        super().__init__(
+            settings,
+            IMAGE_CACHE_NAME,
+            True,
+            settings.get("LOAD_CONTENT_CACHE", False),
+        )
+        self._persist = settings.get("CACHE_CONTENT", False)
+
+    def _stamped(self, key, path, compute):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        stamp = (st.st_size, st.st_mtime_ns)
+        (cached_stamp, val) = self.get_cached_data(key, (None, None))
+
+        if cached_stamp != stamp:
+            val = compute(path)
+            self.cache_data(key, (stamp, val))
+
+        return val
+
+    def image_info(self, path):
+        """
+        Get the dimensions and type of an image, probing it if necessary
+
+        :param path: (str) Path to the image
+
+        :returns: (tuple) Width, height and MIME type, or None if unknown
+        """
+        return self._stamped(path, path, probe_image)
+
+    def fingerprint(self, path):
+        """
+        Get the content fingerprint of an image, hashing it if necessary
+
+        :param path: (str) Path to the image
+
+        :returns: (str) Fingerprint, or None if the image could not be read
+        """
+        return self._stamped(("fingerprint", path), path, fingerprint_file)
+
+    def save_cache(self):
+        if self._persist:
+            super().save_cache()
+
+
+class DigestCache(FileDataCacher):
+    """
+    Digests of the unfurls of every URL in the last build, and the images
+    each one uses, always kept between builds so changes can be reported
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings, DIGEST_CACHE_NAME, True, True)
+
+    @property
+    def digests(self):
+        """
+        :returns: (dict) (digest, images) pairs keyed by URL
+        """
+        return self._cache
+
+    def replace(self, digests):
+        """
+        Replace the stored digests with those of the current build
+
+        :param digests: (dict) (digest, images) pairs keyed by URL
+        """
+        self._cache = digests
+
+
+class RemoteCache(FileDataCacher):
+    """
+    Results of checking remote ledes, keyed by URL and always kept between
+    builds, so ledes are only requested again once their results expire
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings, REMOTE_CACHE_NAME, True, True)
+
+
+def remote_expired(checked, ok, settings, now=None):
+    """
+    :param checked: (float) When a remote lede was checked
+    :param ok: (bool) Whether the lede was available
+    :param settings: (dict) Enhanced unfurls settings
+    :param now: (float) Current time
+
+    :returns: (bool) Whether the result of the check has expired
+    """
+    ttl = settings.get("remote_ttl", DEFAULT_REMOTE_TTL)
+
+    if not ok:
+        ttl = min(ttl, settings.get("remote_failure_ttl", DEFAULT_REMOTE_FAILURE_TTL))
+
+    return (time() if now is None else now) - checked >= ttl
+
+
+def settings_key(settings):
+    """
+    Condense the settings that influence computed unfurls into a single key
+
+    :param settings: (dict) Pelican settings or generator context
+
+    :returns: (str) Settings key
+    """
+    eu_settings = settings.get("ENHANCED_UNFURLS", {})
+    keyed = [(k, v) for (k, v) in eu_settings.items() if k not in UNKEYED_SETTINGS]
+    parts = [CACHE_VERSION, sorted(keyed)]
+    parts.extend(settings.get(name) for name in KEY_SETTINGS)
+
+    for name in FILE_SETTINGS:
+        path = os.path.join(settings.get("PATH", ""), eu_settings.get(name) or "")
+
+        if os.path.isfile(path):
+            parts.append(get_image_cache(settings).fingerprint(path))
+
+    return sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def entry_key(content, key):
+    """
+    Combine a settings key with the output location of a piece of content
+
+    :param content: (pelican.contents.Content) Content to generate a key for
+    :param key: (str) Settings key
+
+    :returns: (tuple) Entry key
+    """
+    return (key, content.url, content.save_as)
+
+
+def get_cache(settings):
+    """
+    Open the unfurl cache for the current build
+
+    :param settings: (dict) Pelican settings or generator context
+
+    :returns: (UnfurlCache) Unfurl cache, or None if caching is disabled
+    """
+    if not (settings.get("CACHE_CONTENT") or settings.get("LOAD_CONTENT_CACHE")):
+        return None
+
+    return _open_cache(settings, UnfurlCache)
+
+
+def get_image_cache(settings):
+    """
+    Open the image cache for the current build
+
+    :param settings: (dict) Pelican settings or generator context
+
+    :returns: (ImageCache) Image cache
+    """
+    return _open_cache(settings, ImageCache)
+
+
+def get_digest_cache(settings):
+    """
+    Open the digest cache for the current build
+
+    :param settings: (dict) Pelican settings or generator context
+
+    :returns: (DigestCache) Digest cache
+    """
+    return _open_cache(settings, DigestCache)
+
+
+def get_remote_cache(settings):
+    """
+    Open the remote lede cache for the current build
+
+    :param settings: (dict) Pelican settings or generator context
+
+    :returns: (RemoteCache) Remote lede cache
+    """
+    return _open_cache(settings, RemoteCache)
+
+
+def _open_cache(settings, cache_cls):
+    cache_id = (settings["CACHE_PATH"], cache_cls)
+
+    if cache_id not in _open_caches:
+        _open_caches[cache_id] = cache_cls(settings)
+
+    return _open_caches[cache_id]
+
+
+def save_caches(*args, **kwargs):
+    """
+    Persist and close all caches opened during the current build
+    """
+    while _open_caches:
+        (_, cache) = _open_caches.popitem()
+        cache.save_cache()
+        logger.debug(f"Saved unfurl cache {cache._cache_path}")
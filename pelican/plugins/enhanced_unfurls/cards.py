@@ -0,0 +1,232 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+"""
+Social card images, rendered for content without a lede: the content's title,
+date and site name drawn over a background. Cards are named by a hash of
+everything drawn on them and kept in CACHE_PATH, so each one is only rendered
+once, however many builds it appears in.
+"""
+
+from functools import partial
+from hashlib import sha1
+from logging import getLogger
+import os
+
+from markupsafe import Markup
+
+from .cache import get_image_cache
+from .rendering import publish_rendered
+from .stats import stats
+
+try:
+    from PIL import Image, ImageColor, ImageDraw, ImageFont, ImageOps
+except ImportError:
+    Image = None
+
+logger = getLogger(__name__)
+
+CARD_CACHE_NAME = "enhanced_unfurls_cards"
+CARD_VERSION = 1
+CARD_SIZE = (1200, 630)
+CARD_MARGIN = 80
+CARD_TITLE_LINES = 4
+
+DEFAULT_CARD_PATH = "images/cards"
+DEFAULT_BACKGROUND = "#1e293b"
+DEFAULT_FOREGROUND = "#ffffff"
+
+_warned_unavailable = False
+
+
+def cards_enabled(settings):
+    """
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (bool) Whether cards should be rendered
+    """
+    global _warned_unavailable
+
+    if not settings.get("social_cards", False):
+        return False
+
+    if Image is None:
+        if not _warned_unavailable:
+            logger.warning("Pillow is not installed; social cards will not be made")
+            _warned_unavailable = True
+
+        return False
+
+    return True
+
+
+def background_is_color(background):
+    """
+    :param background: (str) Card background setting
+
+    :returns: (bool) Whether the background is a color, rather than an image
+    """
+    try:
+        ImageColor.getrgb(background)
+    except ValueError:
+        return False
+
+    return True
+
+
+def card_spec(content, settings):
+    """
+    Gather everything drawn on a piece of content's card
+
+    :param content: (pelican.contents.Content) Content the card is for
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (tuple) Card spec
+    """
+    context = content._context
+    background = settings.get("card_background", DEFAULT_BACKGROUND)
+    background_stamp = None
+    font = settings.get("card_font")
+    font_stamp = None
+
+    # Backgrounds which are not colors are images, relative to the content root
+    if not background_is_color(background):
+        background = os.path.join(context["PATH"], background)
+        background_stamp = get_image_cache(context).fingerprint(background)
+
+    if font is not None:
+        font = os.path.join(context["PATH"], font)
+        font_stamp = get_image_cache(context).fingerprint(font)
+
+    return (
+        CARD_VERSION,
+        Markup(content.title).striptags(),
+        Markup(context.get("SITENAME", "")).striptags(),
+        getattr(content, "locale_date", ""),
+        background,
+        background_stamp,
+        settings.get("card_foreground", DEFAULT_FOREGROUND),
+        font,
+        font_stamp,
+    )
+
+
+def card_path(spec, settings):
+    """
+    :param spec: (tuple) Card spec
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (str) Path of the card, relative to the output path
+    """
+    name = sha1(repr(spec).encode("utf-8")).hexdigest()[:20]
+    return f"{settings.get('card_path', DEFAULT_CARD_PATH)}/{name}.png"
+
+
+def _load_font(path, size):
+    if path is not None:
+        return ImageFont.truetype(path, size)
+
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Versions of Pillow before 10.1 only have a fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+def _wrap(draw, text, font, width, max_lines):
+    lines = []
+    line = ""
+
+    for word in text.split():
+        candidate = f"{line} {word}".strip()
+
+        if line and draw.textlength(candidate, font=font) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+
+    if line:
+        lines.append(line)
+
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] += " …"
+
+    return lines
+
+
+def render_card(spec, path):
+    """
+    Render a card to a PNG file
+
+    :param spec: (tuple) Card spec
+    :param path: (pathlib.Path) File to render the card to
+
+    :returns: (bool) Whether the card was rendered
+    """
+    (_, title, site, date, background, _, foreground, font_path, _) = spec
+    (width, height) = CARD_SIZE
+    text_width = width - 2 * CARD_MARGIN
+
+    try:
+        if background_is_color(background):
+            image = Image.new("RGB", CARD_SIZE, background)
+        else:
+            with Image.open(background) as source:
+                image = ImageOps.fit(source.convert("RGB"), CARD_SIZE)
+
+        draw = ImageDraw.Draw(image)
+        title_font = _load_font(font_path, 64)
+        small_font = _load_font(font_path, 32)
+
+        draw.text((CARD_MARGIN, CARD_MARGIN), site, fill=foreground, font=small_font)
+
+        y = CARD_MARGIN + 96
+        for line in _wrap(draw, title, title_font, text_width, CARD_TITLE_LINES):
+            draw.text((CARD_MARGIN, y), line, fill=foreground, font=title_font)
+            y += 80
+
+        draw.text(
+            (CARD_MARGIN, height - CARD_MARGIN - 32),
+            date,
+            fill=foreground,
+            font=small_font,
+        )
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}")
+        image.save(tmp_path, "PNG", optimize=True)
+        os.replace(tmp_path, path)
+
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not render social card for {title!r}: {e}")
+        return False
+
+    return True
+
+
+def ensure_cards(contents, context, settings):
+    """
+    Make sure the cards used by content exist in the output,
+    rendering those not already in the render cache
+
+    :param contents: (iterable) Content to check the cards of
+    :param context: (dict) Generator context
+    :param settings: (dict) Enhanced unfurls settings
+    """
+    cards = (
+        (content.metadata["lede_card"], partial(card_spec, content, settings))
+        for content in contents
+        if "lede_card" in content.metadata
+    )
+    (rendered, cached) = publish_rendered(
+        cards, render_card, CARD_CACHE_NAME, context, settings.get("card_workers")
+    )
+
+    stats.count("cards_rendered", rendered)
+    stats.count("cards_cached", cached)
@@ -0,0 +1,86 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+"""
+The content Pelican writes: published, hidden and draft articles and pages,
+along with their translations. Content is iterated where the generators keep
+it, rather than copied into new lists, however large the site.
+"""
+
+from itertools import chain
+
+from pelican.generators import ArticlesGenerator, PagesGenerator
+
+# Generator attributes holding the content each generator writes, in the groups
+# Pelican finds translations within, and the setting translations are found by
+CONTENT_GROUPS = (
+    (
+        ArticlesGenerator,
+        "ARTICLE_TRANSLATION_ID",
+        (
+            ("articles", "translations"),
+            ("hidden_articles", "hidden_translations"),
+            ("drafts", "drafts_translations"),
+        ),
+    ),
+    (
+        PagesGenerator,
+        "PAGE_TRANSLATION_ID",
+        (
+            ("pages", "translations"),
+            ("hidden_pages", "hidden_translations"),
+            ("draft_pages", "draft_translations"),
+        ),
+    ),
+)
+
+# Generator attributes holding content written without a signal being sent
+UNSIGNALED_CONTENT = ((ArticlesGenerator, ("drafts", "drafts_translations")),)
+
+
+def _content(generator, names):
+    return chain.from_iterable(getattr(generator, name, ()) for name in names)
+
+
+def content_groups(generator):
+    """
+    :param generator: (pelican.generators.Generator) Generator to look in
+
+    :returns: (generator) (translation ID, iterator) pairs, one per group of
+                          content translations are found within
+    """
+    for (cls, translation_id, groups) in CONTENT_GROUPS:
+        if isinstance(generator, cls):
+            for names in groups:
+                yield (
+                    generator.settings.get(translation_id),
+                    _content(generator, names),
+                )
+
+
+def written_content(generators):
+    """
+    :param generators: (iterable) Generators to look in
+
+    :returns: (generator) Every piece of content the generators write
+    """
+    for generator in generators:
+        for (_, contents) in content_groups(generator):
+            yield from contents
+
+
+def unsignaled_content(generator):
+    """
+    :param generator: (pelican.generators.Generator) Generator to look in
+
+    :returns: (iterator) Content the generator writes without sending a signal
+    """
+    for (cls, names) in UNSIGNALED_CONTENT:
+        if isinstance(generator, cls):
+            return _content(generator, names)
+
+    return iter(())
@@ -0,0 +1,161 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+"""
+Lede derivatives: static lede images larger than a platform recommends are
+cropped and scaled down to that platform's size, and tags point at the copy.
+Derivatives are named by a fingerprint of their source, so they are only
+rendered again when the source changes.
+"""
+
+from logging import getLogger
+import os
+from pathlib import PurePosixPath
+
+from .rendering import publish_rendered
+from .stats import stats
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = getLogger(__name__)
+
+DERIVATIVE_CACHE_NAME = "enhanced_unfurls_derivatives"
+DEFAULT_DERIVATIVE_PATH = "images/ledes"
+
+# Size recommended by each platform, keyed by the tag group it is used for
+DEFAULT_LEDE_SIZES = {"og": (1200, 630), "twitter": (1200, 600)}
+
+# Derivatives keep JPEG ledes as JPEG; everything else becomes PNG
+DERIVATIVE_EXTS = {"image/jpeg": ".jpg"}
+
+_warned_unavailable = False
+
+
+def derivatives_enabled(settings):
+    """
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (bool) Whether lede derivatives should be made
+    """
+    global _warned_unavailable
+
+    if not settings.get("lede_derivatives", False):
+        return False
+
+    if Image is None:
+        if not _warned_unavailable:
+            logger.warning("Pillow is not installed; lede derivatives will not be made")
+            _warned_unavailable = True
+
+        return False
+
+    return True
+
+
+def derivative_specs(source, info, fingerprint, settings):
+    """
+    Plan the derivatives of a lede image
+
+    :param source: (str) Path to the lede image
+    :param info: (tuple) Width, height and MIME type of the lede image
+    :param fingerprint: (str) Fingerprint of the lede image
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (dict) (path relative to the output path, source, size, MIME type)
+                     tuples, keyed by tag group; groups whose size the image
+                     is already, or would have to be scaled up to, have none
+    """
+    (width, height, mime) = info
+    sizes = dict(DEFAULT_LEDE_SIZES)
+    sizes.update(settings.get("lede_sizes", {}))
+    root = settings.get("derivative_path", DEFAULT_DERIVATIVE_PATH)
+    ext = DERIVATIVE_EXTS.get(mime, ".png")
+    stem = PurePosixPath(source.replace("\\", "/")).stem
+    specs = {}
+
+    for (group, size) in sizes.items():
+        if size is None:
+            continue
+
+        (w, h) = size
+
+        # Derivatives are only ever cropped and scaled down
+        if width < w or height < h or (width, height) == (w, h):
+            continue
+
+        path = f"{root}/{stem}-{fingerprint}-{w}x{h}{ext}"
+        specs[group] = (path, source, (w, h), "image/png" if ext == ".png" else mime)
+
+    return specs
+
+
+def render_derivative(spec, path):
+    """
+    Crop and scale an image down to a derivative
+
+    :param spec: (tuple) Source image and size of the derivative
+    :param path: (pathlib.Path) File to render the derivative to
+
+    :returns: (bool) Whether the derivative was rendered
+    """
+    (source, size) = spec
+    fmt = "JPEG" if path.suffix == ".jpg" else "PNG"
+
+    try:
+        with Image.open(source) as image:
+            # Only decode JPEGs at the smallest scale still larger than needed
+            image.draft("RGB", size)
+            image = ImageOps.fit(
+                image.convert("RGB" if fmt == "JPEG" else "RGBA"),
+                size,
+                Image.LANCZOS,
+            )
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}")
+
+        if fmt == "JPEG":
+            image.save(tmp_path, fmt, quality=85, optimize=True, progressive=True)
+        else:
+            image.save(tmp_path, fmt, optimize=True)
+
+        os.replace(tmp_path, path)
+
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not make lede derivative of {source}: {e}")
+        return False
+
+    return True
+
+
+def ensure_derivatives(contents, context, settings):
+    """
+    Make sure the lede derivatives used by content exist in the output,
+    rendering those not already in the render cache
+
+    :param contents: (iterable) Content to check the derivatives of
+    :param context: (dict) Generator context
+    :param settings: (dict) Enhanced unfurls settings
+    """
+    derivatives = (
+        (path, lambda source=source, size=size: (source, size))
+        for content in contents
+        for (path, source, size) in content.metadata.get("lede_derivatives", ())
+    )
+    (rendered, cached) = publish_rendered(
+        derivatives,
+        render_derivative,
+        DERIVATIVE_CACHE_NAME,
+        context,
+        settings.get("derivative_workers"),
+    )
+
+    stats.count("derivatives_rendered", rendered)
+    stats.count("derivatives_cached", cached)
@@ -0,0 +1,55 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from logging import getLogger
+from sys import intern
+
+from markupsafe import Markup
+
+logger = getLogger(__name__)
+
+# Longest description each tag group is given, in characters
+DESCRIPTION_LIMITS = {"og": 200, "twitter": 200}
+
+ELLIPSIS = "…"
+
+# Punctuation left dangling at the end of a truncated description
+TRAILING_PUNCTUATION = " ,;:.-–—"
+
+
+def plain_text(summary):
+    """
+    Convert a summary into plain text, with whitespace collapsed
+
+    :param summary: (str) Summary, which may contain HTML
+
+    :returns: (str) Plain text of the summary
+    """
+    return Markup(summary).striptags()
+
+
+def truncate(text, limit):
+    """
+    Truncate text on a word boundary
+
+    :param text: (str) Plain text
+    :param limit: (int) Maximum length of the result, including the ellipsis
+                        marking it as truncated, or None for no limit
+
+    :returns: (str) Truncated text, interned so that every tag given the same
+                    description shares one string
+    """
+    if limit is not None and len(text) > limit:
+        cut = text[: max(limit - len(ELLIPSIS), 0) + 1]
+
+        # The character after the cut tells whether it split a word
+        if cut[-1:] != " " and " " in cut:
+            cut = cut.rsplit(" ", 1)[0]
+
+        text = cut[: limit - len(ELLIPSIS)].rstrip(TRAILING_PUNCTUATION) + ELLIPSIS
+
+    return intern(text)
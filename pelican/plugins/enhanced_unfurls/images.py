@@ -0,0 +1,172 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from hashlib import blake2b
+from logging import getLogger
+from mmap import ACCESS_READ, mmap
+import os
+from struct import unpack_from
+
+logger = getLogger(__name__)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+GIF_SIGNATURES = (b"GIF87a", b"GIF89a")
+JPEG_SIGNATURE = b"\xff\xd8"
+
+# Length of image fingerprints, in hex digits
+FINGERPRINT_LENGTH = 12
+
+# JPEG start-of-frame markers, which hold the image dimensions
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# JPEG markers which stand alone, without a length or payload
+JPEG_STANDALONE_MARKERS = frozenset(range(0xD0, 0xD9)) | {0x01}
+
+
+def probe_png(buf):
+    """
+    :param buf: (bytes) Start of a PNG file
+
+    :returns: (tuple) Width, height and MIME type, or None if unknown
+    """
+    if buf[12:16] != b"IHDR" or len(buf) < 24:
+        return None
+
+    (width, height) = unpack_from(">II", buf, 16)
+    return (width, height, "image/png")
+
+
+def probe_gif(buf):
+    """
+    :param buf: (bytes) Start of a GIF file
+
+    :returns: (tuple) Width, height and MIME type, or None if unknown
+    """
+    if len(buf) < 10:
+        return None
+
+    (width, height) = unpack_from("<HH", buf, 6)
+    return (width, height, "image/gif")
+
+
+def probe_jpeg(buf):
+    """
+    :param buf: (bytes) JPEG file, walked marker by marker up to
+                        the first start-of-frame
+
+    :returns: (tuple) Width, height and MIME type, or None if unknown
+    """
+    pos = 2
+    end = len(buf)
+
+    while pos + 4 <= end:
+        if buf[pos] != 0xFF:
+            return None
+
+        marker = buf[pos + 1]
+
+        # Markers may be preceded by any amount of fill bytes
+        if marker == 0xFF:
+            pos += 1
+            continue
+
+        if marker in JPEG_STANDALONE_MARKERS:
+            pos += 2
+            continue
+
+        (length,) = unpack_from(">H", buf, pos + 2)
+
+        if marker in JPEG_SOF_MARKERS:
+            if pos + 9 > end:
+                return None
+
+            (height, width) = unpack_from(">HH", buf, pos + 5)
+            return (width, height, "image/jpeg")
+
+        pos += 2 + length
+
+    return None
+
+
+def probe_bytes(buf):
+    """
+    Read the dimensions and type of an image from the start of its data
+
+    :param buf: (bytes) Start of the image; JPEG dimensions may only be
+                        found after the first few kilobytes
+
+    :returns: (tuple) Width, height and MIME type, or None if unknown
+    """
+    if buf.startswith(PNG_SIGNATURE):
+        return probe_png(buf)
+
+    if buf.startswith(GIF_SIGNATURES):
+        return probe_gif(buf)
+
+    if buf.startswith(JPEG_SIGNATURE):
+        return probe_jpeg(buf)
+
+    return None
+
+
+def probe_image(path):
+    """
+    Read the dimensions and type of an image from its header,
+    without decoding the image itself
+
+    Only the bytes needed are read; JPEG files, whose dimensions may follow
+    large metadata segments, are memory-mapped rather than read in full
+
+    :param path: (str) Path to the image
+
+    :returns: (tuple) Width, height and MIME type, or None if unknown
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(32)
+
+            if head.startswith(PNG_SIGNATURE):
+                return probe_png(head)
+
+            if head.startswith(GIF_SIGNATURES):
+                return probe_gif(head)
+
+            if head.startswith(JPEG_SIGNATURE):
+                with mmap(f.fileno(), 0, access=ACCESS_READ) as buf:
+                    return probe_jpeg(buf)
+
+    except (OSError, ValueError) as e:
+        logger.debug(f"Could not probe image {path}: {e}")
+
+    return None
+
+
+def fingerprint_file(path):
+    """
+    Hash the contents of a file into a short fingerprint, which changes
+    whenever the file does
+
+    The file is memory-mapped and hashed in place, rather than read
+
+    :param path: (str) Path to the file
+
+    :returns: (str) Fingerprint, or None if the file could not be read
+    """
+    digest = blake2b(digest_size=FINGERPRINT_LENGTH // 2)
+
+    try:
+        with open(path, "rb") as f:
+            # Empty files cannot be memory-mapped, and have nothing to hash
+            if os.fstat(f.fileno()).st_size > 0:
+                with mmap(f.fileno(), 0, access=ACCESS_READ) as buf:
+                    digest.update(buf)
+
+    except (OSError, ValueError) as e:
+        logger.debug(f"Could not fingerprint {path}: {e}")
+        return None
+
+    return digest.hexdigest()
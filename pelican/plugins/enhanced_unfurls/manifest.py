@@ -0,0 +1,134 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+"""
+Change manifest: a digest of each URL's final unfurl tags and oEmbed record
+is kept between builds, and every build writes the URLs whose unfurls were
+added, changed or removed, one JSON object per line, along with the images
+they use, so deploys can purge and re-scrape only those.
+"""
+
+from collections import Counter
+from contextlib import suppress
+from hashlib import sha1
+from json import dumps
+from logging import getLogger
+import os
+from pathlib import Path
+
+from .cache import get_digest_cache
+from .oembed import oembed_info, serialize
+from .sharding import shard_config
+from .stats import stats, timed
+from .tracking import tracked
+
+logger = getLogger(__name__)
+
+MANIFEST_NAME = "enhanced_unfurls_manifest.jsonl"
+
+ADDED = "added"
+CHANGED = "changed"
+REMOVED = "removed"
+
+
+def unfurl_digest(content, oembed):
+    """
+    Digest the final unfurl tags and oEmbed record of a piece of content
+
+    :param content: (pelican.contents.Content) Tagged content
+    :param oembed: (bool) Whether the oEmbed record is part of the unfurl
+
+    :returns: (str) Digest of the unfurl
+    """
+    digest = sha1(str(content.unfurl_html).encode("utf-8"))
+
+    if oembed:
+        digest.update(serialize(oembed_info(content, content.settings["SITENAME"])))
+
+    return digest.hexdigest()
+
+
+def unfurl_images(content):
+    """
+    :param content: (pelican.contents.Content) Tagged content
+
+    :returns: (list) Images the unfurl of the content uses
+    """
+    lede = content.metadata.get("lede")
+    return [] if lede is None else [lede]
+
+
+@timed("write_manifest")
+def write_manifest(pelican):
+    """
+    Write the URLs whose unfurls changed since the last build,
+    then remember the current unfurls for the next build
+
+    :param pelican: (pelican.Pelican) Pelican instance that ran the build
+    """
+    settings = pelican.settings
+    eu_settings = settings.get("ENHANCED_UNFURLS", {})
+    destination = eu_settings.get("manifest")
+    if destination not in ("output", "cache") or shard_config(eu_settings):
+        return
+
+    root = settings["OUTPUT_PATH" if destination == "output" else "CACHE_PATH"]
+    manifest_path = Path(root).joinpath(MANIFEST_NAME)
+    tmp_path = manifest_path.with_name(f".{MANIFEST_NAME}.{os.getpid()}")
+    oembed = eu_settings.get("oembed", False)
+    cache = get_digest_cache(settings)
+    previous = cache.digests
+    current = {}
+    counts = Counter()
+
+    try:
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with tmp_path.open("w", encoding="utf-8") as f:
+            for (url, content) in tracked().items():
+                (digest, images) = current[url] = (
+                    unfurl_digest(content, oembed),
+                    unfurl_images(content),
+                )
+                (previous_digest, _) = previous.get(url, (None, None))
+
+                if previous_digest is None:
+                    status = ADDED
+                elif previous_digest != digest:
+                    status = CHANGED
+                else:
+                    continue
+
+                f.write(dumps({"status": status, "url": url, "images": images}))
+                f.write("\n")
+                counts[status] += 1
+
+            for (url, (_, images)) in previous.items():
+                if url not in current:
+                    f.write(dumps({"status": REMOVED, "url": url, "images": images}))
+                    f.write("\n")
+                    counts[REMOVED] += 1
+
+        os.replace(tmp_path, manifest_path)
+
+    except OSError as e:
+        logger.warning(f"Could not write unfurl manifest to {manifest_path}: {e}")
+
+        with suppress(OSError):
+            tmp_path.unlink()
+
+        return
+
+    cache.replace(current)
+
+    for status in (ADDED, CHANGED, REMOVED):
+        stats.count(f"manifest_{status}", counts[status])
+
+    logger.info(
+        f"Unfurl manifest: {counts[ADDED]} added, {counts[CHANGED]} changed, "
+        f"{counts[REMOVED]} removed"
+    )
@@ -6,82 +6,227 @@
 ################################################################################
 
 from logging import getLogger
-
-from pelican.generators import ArticlesGenerator
+import os
+from urllib.parse import urlparse
+
+from pelican.contents import Page
+
+from .cache import get_cache, get_image_cache, settings_key
+from .cards import CARD_SIZE, card_path, card_spec, cards_enabled, ensure_cards
+from .contents import content_groups
+from .derivatives import derivative_specs, derivatives_enabled, ensure_derivatives
+from .profiling import profiled_as
+from .reading import get_label_inputs, resolve_labels
+from .remote import remote_enabled, verify_inputs
+from .sharding import collect, in_shard, merged_entry, shard_config
+from .static import get_static_index, is_static_link
+from .stats import stats, timed
+from .translations import group_translations, og_locale
 
 logger = getLogger(__name__)
 VALID_EXTS = ["jpg", "jpeg", "png", "gif"]
 
+# Content metadata which, if present, is not overridden
+INPUT_KEYS = ("type", "card_type", "locale", "tl1", "td1", "tl2", "td2")
+
 
-def get_metadata(logger, content, settings, siteurl, locale):
+def first_image(content):
     """
-    Prepare raw content metadata to be used downstream,
-    and pull additional metadata from elsewhere as necessary
+    Find the first image the content links to as static content
 
-    :param logger: (logging.Logger) Service logger
-    :param content: (pelican.contents.Content) Content to gather
-                                               metadata of/for
+    Links are scanned in document order, and scanning stops
+    as soon as an image is found
+
+    :param content: (pelican.contents.Content) Content to scan
+
+    :returns: (str) Path of the image relative to the content root, or None
+    """
+    hrefs = content._get_intrasite_link_regex()
+
+    for m in hrefs.finditer(content._content):
+        if m.group("what") not in ("static", "attach"):
+            continue
+
+        path = urlparse(m.group("value")).path
+
+        if path.rsplit(".", 1)[-1].lower() not in VALID_EXTS:
+            continue
+
+        if path.startswith("/"):
+            path = path[1:]
+        else:
+            # Relative to the source path of this content
+            path = content.get_relative_source_path(
+                os.path.join(content.relative_dir, path)
+            )
+
+        return path.replace("%20", " ")
+
+    return None
+
+
+def get_inputs(content, settings, static_deps=None):
+    """
+    Gather everything about a piece of content needed to compute its metadata,
+    as plain values independent of the content itself
+
+    :param content: (pelican.contents.Content) Content to gather inputs for
     :param settings: (dict) Enhanced unfurls settings
-    :param siteurl: (str) Root URL of site
-    :param locale: (list) Locale(s) of site
+    :param static_deps: (dict) If provided, filled with the static content
+                               consulted, keyed by path
 
-    :returns: (dict) New and updated metadata
+    :returns: (dict) Metadata inputs
     """
 
-    def _static_to_url(link):
-        result = None
-        raw_path = link.strip("{static}").lstrip("/")
-        link_obj = content._context["static_content"].get(raw_path)
+    def _static_url(resolved):
+        (path, link_obj) = resolved
 
-        if siteurl and link_obj is not None:
-            result = f"{siteurl}/{link_obj.url}"
+        if static_deps is not None:
+            static_deps[path] = link_obj
 
-        return result
+        if link_obj is None:
+            stats.count("static_lookups_missed")
+            return None
 
-    default_lede = settings.get("default_lede")
-    default_card_type = settings.get("default_card_type")
+        inputs["lede_info"] = image_cache.image_info(link_obj.source_path)
 
-    metadata = {}
+        if settings.get("fingerprint_ledes", False):
+            inputs["lede_fingerprint"] = image_cache.fingerprint(link_obj.source_path)
 
-    # The content has explicitly specified a lede image
-    if "lede" in content.metadata:
+        if inputs["lede_info"] is not None and derivatives_enabled(settings):
+            inputs["derivatives"] = derivative_specs(
+                link_obj.source_path,
+                inputs["lede_info"],
+                image_cache.fingerprint(link_obj.source_path),
+                settings,
+            )
 
-        # The provided lede image is only a link
-        if content.metadata["lede"].startswith("{static}"):
-            lede_url = _static_to_url(content.metadata["lede"])
+        return link_obj.url
 
-            if lede_url is not None:
-                metadata["lede"] = lede_url
+    default_lede = settings.get("default_lede")
+    image_cache = get_image_cache(content._context)
+    index = get_static_index(content._context)
+    strategy = None
+    inputs = {
+        "lede": None,
+        "static_lede": None,
+        "lede_info": None,
+        "lede_fingerprint": None,
+        "derivatives": None,
+        "card": None,
+        "present": tuple(k for k in INPUT_KEYS if k in content.metadata),
+        "og_type": "website" if isinstance(content, Page) else "article",
+        "lang": None,
+        "labels": get_label_inputs(content, settings),
+        "url": content.url,
+    }
+
+    # Translations are unfurled in their own language
+    if content.lang != content.settings.get("DEFAULT_LANG", content.lang):
+        inputs["lang"] = content.lang
 
-        # The provided lede image is assumed to be a full URL
-        else:
-            metadata["lede"] = content.metadata["lede"]
+    # The content has explicitly specified a lede image
+    if "lede" in content.metadata:
+        strategy = "explicit"
 
     # The default image specified in the settings should be used
     elif default_lede:
+        strategy = "default"
 
-        # The provided lede image is only a link
-        if default_lede.startswith("{static}"):
-            lede_url = _static_to_url(default_lede)
+    if strategy is not None:
+        lede = content.metadata.get("lede", default_lede)
 
-            if lede_url is not None:
-                metadata["lede"] = lede_url
+        # The provided lede image is only a link
+        if is_static_link(lede):
+            inputs["static_lede"] = _static_url(index.resolve(lede, content))
 
         # The provided lede image is assumed to be a full URL
         else:
-            metadata["lede"] = default_lede
+            inputs["lede"] = lede
 
     # The first image in the content should be used as the lede
     elif settings.get("first_image_lede", False):
-        for f in content.get_static_links():
-            if siteurl and f.split(".")[-1] in VALID_EXTS:
-                metadata["lede"] = f"{siteurl}/{f}"
-                break
+        strategy = "first_image"
+        image_path = first_image(content)
+
+        if image_path is not None:
+            inputs["static_lede"] = _static_url(index.get(image_path))
+
+    if inputs["lede"] is not None or inputs["static_lede"] is not None:
+        stats.count(f"ledes_{strategy}")
+
+    # Content without a usable lede gets a card made for it
+    elif cards_enabled(settings):
+        stats.count("ledes_card")
+        inputs["card"] = card_path(card_spec(content, settings), settings)
+
+    return inputs
+
+
+def resolve_metadata(inputs, settings, siteurl, locale):
+    """
+    Compute metadata from the inputs gathered for a piece of content
+
+    :param inputs: (dict) Metadata inputs, as returned by get_inputs
+    :param settings: (dict) Enhanced unfurls settings
+    :param siteurl: (str) Root URL of site
+    :param locale: (list) Locale(s) of site
 
-    if "type" not in content.metadata:
-        metadata["type"] = "article"
+    :returns: (dict) New and updated metadata
+    """
+    default_card_type = settings.get("default_card_type")
+    present = inputs["present"]
 
-    if "card_type" not in content.metadata:
+    metadata = {}
+
+    if inputs["lede"] is not None:
+        metadata["lede"] = inputs["lede"]
+
+        if inputs["lede_info"] is not None:
+            (
+                metadata["lede_width"],
+                metadata["lede_height"],
+                metadata["lede_type"],
+            ) = inputs["lede_info"]
+
+    elif siteurl and inputs["static_lede"] is not None:
+        metadata["lede"] = f"{siteurl}/{inputs['static_lede']}"
+
+        if inputs["lede_fingerprint"] is not None:
+            metadata["lede"] += f"?v={inputs['lede_fingerprint']}"
+
+        if inputs["lede_info"] is not None:
+            (
+                metadata["lede_width"],
+                metadata["lede_height"],
+                metadata["lede_type"],
+            ) = inputs["lede_info"]
+
+        if inputs["derivatives"]:
+            derivatives = inputs["derivatives"]
+            metadata["lede_derivatives"] = tuple(
+                (path, source, size) for (path, source, size, _) in derivatives.values()
+            )
+
+            if "og" in derivatives:
+                (path, _, size, mime) = derivatives["og"]
+                metadata["lede"] = f"{siteurl}/{path}"
+                (metadata["lede_width"], metadata["lede_height"]) = size
+                metadata["lede_type"] = mime
+
+            if "twitter" in derivatives:
+                metadata["twitter_lede"] = f"{siteurl}/{derivatives['twitter'][0]}"
+
+    elif siteurl and inputs["card"] is not None:
+        metadata["lede"] = f"{siteurl}/{inputs['card']}"
+        metadata["lede_card"] = inputs["card"]
+        (metadata["lede_width"], metadata["lede_height"]) = CARD_SIZE
+        metadata["lede_type"] = "image/png"
+
+    if "type" not in present:
+        metadata["type"] = inputs["og_type"]
+
+    if "card_type" not in present:
         if default_card_type:
             metadata["card_type"] = default_card_type
 
@@ -91,18 +236,62 @@ def get_metadata(logger, content, settings, siteurl, locale):
         else:
             metadata["card_type"] = "summary"
 
-    if locale[0] and "locale" not in content.metadata:
-        metadata["locale"] = locale[0].split(".")[0]
+    if "locale" not in present:
+        if inputs["lang"] is not None:
+            metadata["locale"] = og_locale(inputs["lang"])
+
+        elif locale[0]:
+            metadata["locale"] = locale[0].split(".")[0]
+
+    metadata.update(resolve_labels(inputs["labels"], present, settings))
 
     if siteurl:
-        metadata["url"] = f"{siteurl}/{content.url}"
+        metadata["url"] = f"{siteurl}/{inputs['url']}"
 
     return metadata
 
 
+def get_metadata(logger, content, settings, siteurl, locale, static_deps=None):
+    """
+    Prepare raw content metadata to be used downstream,
+    and pull additional metadata from elsewhere as necessary
+
+    :param logger: (logging.Logger) Service logger
+    :param content: (pelican.contents.Content) Content to gather
+                                               metadata of/for
+    :param settings: (dict) Enhanced unfurls settings
+    :param siteurl: (str) Root URL of site
+    :param locale: (list) Locale(s) of site
+    :param static_deps: (dict) If provided, filled with the static content
+                               consulted, keyed by path
+
+    :returns: (dict) New and updated metadata
+    """
+    inputs = get_inputs(content, settings, static_deps)
+    return resolve_metadata(inputs, settings, siteurl, locale)
+
+
+def apply_metadata(content, metadata, shard=None):
+    """
+    Update the metadata of a piece of content with that computed for it
+
+    :param content: (pelican.contents.Content) Content to update
+    :param metadata: (dict) Metadata computed for the content
+    :param shard: (tuple) Index and count of the shard being built, or None
+    """
+    content.metadata.update(metadata)
+
+    # Shard builds keep what they computed, for their artifact
+    if shard is not None:
+        collect(content, metadata)
+
+
+@timed("enhance_metadata")
+@profiled_as("enhance_metadata")
 def enhance_metadata(generators):
     """
-    Update content metadata for use in tagging
+    Update the metadata of all written content for use in tagging,
+    whether published, hidden or a draft
 
     :param generators: (list) Generators to update content for
     """
@@ -113,10 +302,11 @@ def enhance_metadata(generators):
     lede_note = "Default lede images not using {{static}} assumed to be full URLs"
 
     for gen in generators:
-        content = []
         locale = gen.context.get("LOCALE", [""])
         siteurl = gen.context.get("SITEURL")
         eu_settings = gen.context.get("ENHANCED_UNFURLS", {})
+        cache = get_cache(gen.context)
+        key = settings_key(gen.context)
 
         if not warned_missing_siteurl and not siteurl:
             logger.warning(no_siteurl)
@@ -126,13 +316,82 @@ def enhance_metadata(generators):
         if (
             not warned_default_lede_url
             and isinstance(default_lede, str)
-            and not default_lede.startswith("{static}")
+            and not is_static_link(default_lede)
         ):
             logger.info(lede_note)
             warned_default_lede_url = True
 
-        if isinstance(gen, ArticlesGenerator):
-            content = gen.articles + gen.translations
+        shard = shard_config(eu_settings)
+        remote = remote_enabled(eu_settings)
+        pending = []
+
+        # Content is walked once: translations are grouped among all of it,
+        # and images only made for the content processed here
+        groups = []
+        processed = []
+
+        for (translation_id, contents) in content_groups(gen):
+            members = []
+            groups.append((translation_id, members))
+
+            for c in contents:
+                members.append(c)
+
+                # Shard builds only compute their own content
+                if not in_shard(c, shard):
+                    continue
+
+                processed.append(c)
+                stats.count("content_processed")
+                entry = None if cache is None else cache.get_entry(c, key)
+
+                if entry is not None:
+                    stats.count("metadata_cached")
+
+                else:
+                    entry = merged_entry(c, gen.context)
+
+                    if entry is not None:
+                        stats.count("metadata_merged")
+
+                if entry is not None:
+                    apply_metadata(c, entry["metadata"], shard)
+                    continue
+
+                static_deps = None if cache is None else {}
+                inputs = get_inputs(c, eu_settings, static_deps)
+
+                # Remote ledes are checked together once all are known, so only
+                # their inputs are held until then
+                if remote:
+                    pending.append((c, inputs, static_deps))
+                    continue
+
+                metadata = resolve_metadata(inputs, eu_settings, siteurl, locale)
+
+                if cache is not None:
+                    cache.new_entry(c, key, metadata, static_deps)
+
+                apply_metadata(c, metadata, shard)
+
+        if pending:
+            remote_deps = verify_inputs(
+                [inputs for (_, inputs, _) in pending], gen.context, eu_settings
+            )
+
+            for ((c, inputs, static_deps), deps) in zip(pending, remote_deps):
+                metadata = resolve_metadata(inputs, eu_settings, siteurl, locale)
+
+                if cache is not None:
+                    cache.new_entry(c, key, metadata, static_deps, deps)
+
+                apply_metadata(c, metadata, shard)
+
+        for (translation_id, members) in groups:
+            group_translations(members, translation_id)
+
+        if cards_enabled(eu_settings):
+            ensure_cards(processed, gen.context, eu_settings)
 
-        for c in content:
-            c.metadata.update(get_metadata(logger, c, eu_settings, siteurl, locale))
+        if derivatives_enabled(eu_settings):
+            ensure_derivatives(processed, gen.context, eu_settings)
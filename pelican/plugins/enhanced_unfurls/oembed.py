@@ -5,12 +5,238 @@
 #       Released under version 3.0 of the Non-Profit Open Source License       #
 ################################################################################
 
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from gzip import GzipFile
+from io import BytesIO
 from json import dumps
 from logging import getLogger
+import os
 from pathlib import Path
+from threading import get_ident
+
+from .bundle import DEFAULT_SHARDS, write_bundle
+from .contents import written_content
+from .profiling import profiled_as
+from .sharding import shard_config
+from .stats import stats, timed
+
+try:
+    from brotli import compress as brotli_compress
+except ImportError:
+    brotli_compress = None
 
 logger = getLogger(__name__)
 
+WRITTEN = "written"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+# Files smaller than this rarely shrink enough to be worth compressing
+COMPRESS_MIN_SIZE = 256
+
+
+def _gzip(data):
+    # A fixed mtime keeps output identical for identical input; written through
+    # GzipFile, as gzip.compress() only takes an mtime from Python 3.8
+    buf = BytesIO()
+
+    with GzipFile(fileobj=buf, mode="wb", compresslevel=9, mtime=0) as f:
+        f.write(data)
+
+    return buf.getvalue()
+
+
+def get_compressors(formats):
+    """
+    Get the compressors for the requested precompressed formats
+
+    :param formats: (list) Requested formats ("gzip" and/or "brotli")
+
+    :returns: (tuple) (file extension, compression function) pairs
+    """
+    compressors = []
+
+    for fmt in formats:
+        if fmt == "gzip":
+            compressors.append((".gz", _gzip))
+
+        elif fmt == "brotli" and brotli_compress is not None:
+            compressors.append((".br", brotli_compress))
+
+        elif fmt == "brotli":
+            logger.warning("Brotli is not installed; .br files will not be written")
+
+        else:
+            logger.warning(f"Unknown compression format {fmt}")
+
+    return tuple(compressors)
+
+
+def serialize(info):
+    """
+    Serialize oEmbed info deterministically, so unchanged info
+    always produces identical bytes
+
+    :param info: (dict) oEmbed info
+
+    :returns: (bytes) Serialized oEmbed info
+    """
+    return dumps(info, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def write_if_changed(path, data):
+    """
+    Atomically write data to a file, unless the file already holds that data
+
+    :param path: (pathlib.Path) File to write
+    :param data: (bytes) Data to write
+
+    :returns: (str) Outcome of the write
+    """
+    try:
+        if path.read_bytes() == data:
+            return SKIPPED
+    except OSError:
+        pass
+
+    # Created by hand rather than via tempfile so the umask is respected
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{get_ident()}")
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+
+        os.replace(tmp_path, path)
+
+    except OSError as e:
+        logger.warning(f"Could not write {path}: {e}")
+
+        with suppress(OSError):
+            tmp_path.unlink()
+
+        return FAILED
+
+    return WRITTEN
+
+
+def write_variants(path, data, outcome, compressors, min_size):
+    """
+    Keep the precompressed variants of a file in step with the file itself
+
+    Variants are only compressed if the file changed or a variant is missing,
+    and removed if the file became too small to be worth compressing
+
+    :param path: (pathlib.Path) File the variants are of
+    :param data: (bytes) Contents of the file
+    :param outcome: (str) Outcome of writing the file
+    :param compressors: (tuple) (file extension, compression function) pairs
+    :param min_size: (int) Smallest file size worth compressing
+    """
+    for (ext, compress) in compressors:
+        variant = path.with_name(path.name + ext)
+
+        if len(data) < min_size:
+            with suppress(OSError):
+                variant.unlink()
+
+        elif outcome == WRITTEN or not variant.exists():
+            write_if_changed(variant, compress(data))
+
+
+def write_file(path, data, compressors=(), min_size=COMPRESS_MIN_SIZE):
+    """
+    Write a file if it changed, along with its precompressed variants
+
+    :param path: (pathlib.Path) File to write
+    :param data: (bytes) Data to write
+    :param compressors: (tuple) (file extension, compression function) pairs
+    :param min_size: (int) Smallest file size worth compressing
+
+    :returns: (str) Outcome of the write
+    """
+    outcome = write_if_changed(path, data)
+
+    if outcome != FAILED and compressors:
+        write_variants(path, data, outcome, compressors, min_size)
+
+    return outcome
+
+
+def write_files(files, workers=None, compressors=(), min_size=COMPRESS_MIN_SIZE):
+    """
+    Write files through a bounded thread pool, skipping unchanged files
+
+    :param files: (iterable) (pathlib.Path, bytes) pairs to write
+    :param workers: (int) Maximum number of writer threads
+    :param compressors: (tuple) (file extension, compression function) pairs
+                                used to write precompressed variants
+    :param min_size: (int) Smallest file size worth compressing
+
+    :returns: (collections.Counter) Number of files per write outcome,
+                                    plus the number of bytes written
+    """
+    results = Counter({WRITTEN: 0, SKIPPED: 0, FAILED: 0, "bytes": 0})
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        def _collect():
+            (future, size) = pending.popleft()
+            outcome = future.result()
+            results[outcome] += 1
+
+            if outcome == WRITTEN:
+                results["bytes"] += size
+
+        for (path, data) in files:
+            future = pool.submit(write_file, path, data, compressors, min_size)
+            pending.append((future, len(data)))
+
+            # Keep memory bounded no matter how many files are written
+            if len(pending) >= workers * 4:
+                _collect()
+
+        while pending:
+            _collect()
+
+    return results
+
+
+def oembed_info(content, provider_name=None):
+    """
+    Generate the oEmbed info for a piece of content
+
+    :param content: (pelican.contents.Content) Content to describe
+    :param provider_name: (str) Name of the site providing the content
+
+    :returns: (dict) oEmbed info
+    """
+    info = {
+        "type": "link",
+        "version": "1.0",
+        "url": content.metadata["url"],
+        "title": content.metadata["title"],
+    }
+
+    if provider_name:
+        info["provider_name"] = provider_name
+
+    # Thumbnails are only valid alongside their dimensions
+    if "lede_width" in content.metadata:
+        info["thumbnail_url"] = content.metadata["lede"]
+        info["thumbnail_width"] = content.metadata["lede_width"]
+        info["thumbnail_height"] = content.metadata["lede_height"]
+
+    logger.debug(f"Content: {info['url']}")
+    logger.debug(f"oEmbed info: {getattr(content, 'oembed_url', None)}")
+    return info
+
 
 class OEmbedGenerator:
     def __init__(self, *args, **kwargs):
@@ -18,28 +244,98 @@ class OEmbedGenerator:
         self.settings = kwargs["settings"].get("ENHANCED_UNFURLS", {})
         self.out_root = Path(kwargs["output_path"])
 
+        # Generators of the content described, set once all are finalized
+        self.sources = ()
+
+    @timed("generate_output")
+    @profiled_as("generate_output")
     def generate_output(self, *args, **kwargs):
         """
         Write oEmbed files for specified content
         """
-        if self.settings.get("oembed", False):
-            for content in self.context["articles"]:
-                oembed_path = self.out_root.joinpath(content.oembed_save_as)
-                provider_name = self.context.get("SITENAME")
-                info = {
-                    "type": "link",
-                    "version": "1.0",
-                    "url": content.metadata["url"],
-                    "title": content.metadata["title"],
-                }
+        if not self.settings.get("oembed", False):
+            return
+
+        # Shard builds only hold part of the site; the merge build writes it all
+        if shard_config(self.settings) is not None:
+            return
+
+        if self.settings.get("oembed_mode", "files") == "bundle":
+            bundle_root = self.out_root.joinpath(
+                self.settings.get("oembed_bundle_path", "oembed")
+            )
+            results = write_bundle(
+                self.oembed_records(),
+                bundle_root,
+                self.settings.get("oembed_shards", DEFAULT_SHARDS),
+            )
 
-                if provider_name:
-                    info["provider_name"] = provider_name
+            logger.info(
+                f"oEmbed bundle: {results['records']} records, "
+                f"{results['replaced']} file(s) updated in {bundle_root}"
+            )
+            stats.count("oembed_bytes_written", results["bytes"])
 
-                oembed_path.write_text(dumps(info))
-                logger.debug(f"Content: {info['url']}")
-                logger.debug(f"oEmbed info: {content.oembed_url}")
+        else:
+            results = write_files(
+                self.oembed_files(),
+                self.settings.get("oembed_workers"),
+                get_compressors(self.settings.get("oembed_compress", ())),
+                self.settings.get("oembed_compress_min_size", COMPRESS_MIN_SIZE),
+            )
+
+            logger.info(
+                f"oEmbed files: {results[WRITTEN]} written, "
+                f"{results[SKIPPED]} unchanged, {results[FAILED]} failed"
+            )
+            stats.count("oembed_files_written", results[WRITTEN])
+            stats.count("oembed_bytes_written", results["bytes"])
+
+    def oembed_info(self, content):
+        """
+        Generate the oEmbed info for a piece of content
+
+        :param content: (pelican.contents.Content) Content to describe
+
+        :returns: (dict) oEmbed info
+        """
+        return oembed_info(content, self.context.get("SITENAME"))
+
+    def oembed_files(self):
+        """
+        Generate the oEmbed files for specified content
+
+        :returns: (generator) (pathlib.Path, bytes) pairs to write
+        """
+        for content in written_content(self.sources):
+            oembed_save_as = getattr(content, "oembed_save_as", None)
+
+            if oembed_save_as is not None:
+                oembed_path = self.out_root.joinpath(oembed_save_as)
+                yield (oembed_path, serialize(self.oembed_info(content)))
+
+    def oembed_records(self):
+        """
+        Generate the oEmbed records for specified content
+
+        :returns: (generator) (URL, bytes) pairs to bundle
+        """
+        for content in written_content(self.sources):
+            if "url" in content.metadata:
+                info = self.oembed_info(content)
+                yield (info["url"], serialize(info))
 
 
 def add_generator(generators):
     return OEmbedGenerator
+
+
+def add_sources(generators):
+    """
+    Give the oEmbed generator the generators of the content it describes
+
+    :param generators: (list) All generators of the build
+    """
+    for gen in generators:
+        if isinstance(gen, OEmbedGenerator):
+            gen.sources = generators
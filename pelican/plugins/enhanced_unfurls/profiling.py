@@ -0,0 +1,243 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+"""
+Profiling of the plugin's handlers inside a full Pelican build. Handlers are
+decorated with the profile they are recorded in, which only records anything
+once profiling is enabled as Pelican starts; handlers stay connected as they
+are, so profiling never changes the order they run in.
+
+Each handler has a single profile, accumulated over all of its calls; lazily
+computed tags are counted with insert_tags, wherever their computation is
+triggered. Profiles are written to CACHE_PATH at the end of every build:
+
+- ``<handler>.pstats``, readable with the standard pstats module
+- ``<handler>.allocations.txt``, the peak traced memory of the handler's
+  calls, and the allocations they made which were still live as they returned
+
+Allocations are only traced while a handler runs, so everything traced can be
+put down to it without recording, and slowly walking, whole call stacks.
+"""
+
+import cProfile
+from functools import wraps
+from logging import getLogger
+from pathlib import Path
+import tracemalloc
+
+logger = getLogger(__name__)
+
+PROFILE_NAME = "enhanced_unfurls_profile"
+PROFILE_MODES = ("cpu", "memory")
+
+DEFAULT_TOP = 25
+
+# Profiles handlers are recorded in; lazily computed tags are recorded
+# with insert_tags
+PROFILED_HANDLERS = ("enhance_metadata", "insert_tags", "generate_output")
+
+_profilers = {}
+_active = []
+
+
+class HandlerProfile:
+    """
+    Profile of one handler, accumulated over all of its calls in a build
+    """
+
+    def __init__(self, name, cpu, memory):
+        """
+        :param name: (str) Name of the handler
+        :param cpu: (bool) Whether to profile with cProfile
+        :param memory: (bool) Whether to profile with tracemalloc
+        """
+        self.name = name
+        self.cpu = cpu
+        self.memory = memory
+        self.reset()
+
+    def reset(self):
+        """
+        Discard everything recorded so far
+        """
+        self.profile = cProfile.Profile() if self.cpu else None
+        self.calls = 0
+        self.peak = 0
+        self.sites = {}
+
+    def resume(self):
+        if self.memory:
+            tracemalloc.start()
+
+        if self.profile is not None:
+            self.profile.enable()
+
+    def pause(self):
+        if self.profile is not None:
+            self.profile.disable()
+
+        if self.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+            for stat in snapshot.statistics("lineno"):
+                site = (stat.traceback[0].filename, stat.traceback[0].lineno)
+                (size, count) = self.sites.get(site, (0, 0))
+                self.sites[site] = (size + stat.size, count + stat.count)
+
+
+def profiled_as(name):
+    """
+    Record the calls of a handler in the profile of the given name,
+    while profiling is enabled
+
+    Profiles cannot be nested, so a profile active when the handler is
+    called is paused until it returns
+
+    :param name: (str) Name of the profile
+
+    :returns: (callable) Decorator
+    """
+
+    def _decorator(func):
+        @wraps(func)
+        def _wrapper(*args, **kwargs):
+            profile = _profilers.get(name)
+
+            if profile is None:
+                return func(*args, **kwargs)
+
+            return _call(func, profile, args, kwargs)
+
+        return _wrapper
+
+    return _decorator
+
+
+def _call(func, profile, args, kwargs):
+    outer = _active[-1] if _active else None
+
+    if outer is profile:
+        return func(*args, **kwargs)
+
+    if outer is not None:
+        outer.pause()
+
+    _active.append(profile)
+    profile.calls += 1
+    profile.resume()
+
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.pause()
+        _active.pop()
+
+        if outer is not None:
+            outer.resume()
+
+
+def profile_modes(settings):
+    """
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (set) Profiling modes enabled
+    """
+    modes = settings.get("profile") or ()
+
+    if isinstance(modes, str):
+        modes = (modes,)
+
+    unknown = set(modes) - set(PROFILE_MODES)
+
+    if unknown:
+        logger.warning(f"Unknown profile modes ignored: {', '.join(sorted(unknown))}")
+
+    return set(modes) & set(PROFILE_MODES)
+
+
+def install_profiling(pelican):
+    """
+    Start recording the profiles of the plugin's handlers,
+    if profiling is enabled
+
+    :param pelican: (pelican.Pelican) Pelican instance about to build
+    """
+    modes = profile_modes(pelican.settings.get("ENHANCED_UNFURLS", {}))
+
+    if not modes or _profilers:
+        return
+
+    if "memory" in modes and tracemalloc.is_tracing():
+        logger.warning("tracemalloc is already in use; memory will not be profiled")
+        modes.discard("memory")
+
+    (cpu, memory) = ("cpu" in modes, "memory" in modes)
+
+    for name in PROFILED_HANDLERS:
+        _profilers[name] = HandlerProfile(name, cpu, memory)
+
+    logger.info(f"Profiling unfurl handlers ({', '.join(sorted(modes))})")
+
+
+def allocation_report(profile, top=DEFAULT_TOP):
+    """
+    :param profile: (HandlerProfile) Profile of the handler
+    :param top: (int) Number of allocation sites to report
+
+    :returns: (str) Peak memory and top allocation sites of the handler
+    """
+    lines = [
+        f"{profile.name}: {profile.calls} call(s), "
+        f"peak traced memory {profile.peak / 1024:.1f} KiB",
+        f"Top {top} sites of allocations live as calls returned:",
+    ]
+    ranked = sorted(profile.sites.items(), key=lambda item: item[1][0], reverse=True)
+
+    for ((filename, lineno), (size, count)) in ranked[:top]:
+        lines.append(f"{filename}:{lineno}: size={size} B, count={count}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_profiles(pelican):
+    """
+    Write the profiles recorded during a build, then reset them for the next
+
+    :param pelican: (pelican.Pelican) Pelican instance that ran the build
+    """
+    if not _profilers:
+        return
+
+    settings = pelican.settings
+    top = settings.get("ENHANCED_UNFURLS", {}).get("profile_top", DEFAULT_TOP)
+    root = Path(settings["CACHE_PATH"]).joinpath(PROFILE_NAME)
+
+    try:
+        root.mkdir(parents=True, exist_ok=True)
+
+        for profile in _profilers.values():
+            if not profile.calls:
+                continue
+
+            if profile.profile is not None:
+                profile.profile.dump_stats(root.joinpath(f"{profile.name}.pstats"))
+
+            if profile.memory:
+                root.joinpath(f"{profile.name}.allocations.txt").write_text(
+                    allocation_report(profile, top)
+                )
+
+    except OSError as e:
+        logger.warning(f"Could not write unfurl profiles to {root}: {e}")
+
+    else:
+        logger.info(f"Unfurl profiles written to {root}")
+
+    for profile in _profilers.values():
+        profile.reset()
@@ -0,0 +1,133 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+"""
+Automatic Twitter labels: the reading time of content, from a count of the
+words in its HTML, and who it was written by. Words are counted in a single
+pass which skips over tags, scripts and styles rather than parsing the HTML,
+and counts are remembered by a checksum of the content they were taken from.
+"""
+
+from hashlib import blake2b
+import re
+
+from .stats import stats
+
+DEFAULT_WORDS_PER_MINUTE = 230
+
+READING_TIME_LABEL = "Reading time"
+WRITTEN_BY_LABEL = "Written by"
+
+# Label/data metadata pairs, in the order automatic labels fill them
+LABEL_SLOTS = (("tl1", "td1"), ("tl2", "td2"))
+
+# Matches elements whose text is not read, comments, tags, entities and words;
+# only words are captured, so everything else is found as an empty string, and
+# punctuation standing on its own is not matched at all
+_TOKENS = re.compile(
+    r"<(?:script|style)\b.*?</(?:script|style)\s*>|<!--.*?-->|<[^>]*>|&#?\w+;"
+    r"|(\w[^\s<]*)",
+    re.DOTALL | re.IGNORECASE,
+)
+
+_word_counts = {}
+
+
+def count_words(html):
+    """
+    :param html: (str) HTML to count the words of
+
+    :returns: (int) Number of words in the text of the HTML
+    """
+    tokens = _TOKENS.findall(html)
+    return len(tokens) - tokens.count("")
+
+
+def word_count(html):
+    """
+    Count the words of HTML, reusing the count of identical HTML
+
+    :param html: (str) HTML to count the words of
+
+    :returns: (int) Number of words in the text of the HTML
+    """
+    key = blake2b(html.encode("utf-8"), digest_size=16).digest()
+    count = _word_counts.get(key)
+
+    if count is None:
+        stats.count("word_counts")
+        count = _word_counts[key] = count_words(html)
+    else:
+        stats.count("word_counts_cached")
+
+    return count
+
+
+def reading_time(words, words_per_minute=DEFAULT_WORDS_PER_MINUTE):
+    """
+    :param words: (int) Number of words in the content
+    :param words_per_minute: (int) Reading speed
+
+    :returns: (str) Reading time, to the nearest minute
+    """
+    return f"{max(1, round(words / words_per_minute))} min read"
+
+
+def get_label_inputs(content, settings):
+    """
+    Gather what the automatic labels of a piece of content are made from
+
+    :param content: (pelican.contents.Content) Content to gather inputs for
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (tuple) Number of words (or None) and authors (or None)
+    """
+    words = None
+    authors = None
+
+    if settings.get("reading_time", False):
+        words = word_count(content._content or "")
+
+    if settings.get("written_by", False):
+        names = [str(author) for author in getattr(content, "authors", ())]
+        authors = ", ".join(names) or None
+
+    return (words, authors)
+
+
+def resolve_labels(label_inputs, present, settings):
+    """
+    Fill the first free label slots with the automatic labels
+
+    :param label_inputs: (tuple) As returned by get_label_inputs
+    :param present: (tuple) Label metadata the content already has
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (dict) Label metadata
+    """
+    (words, authors) = label_inputs
+    labels = []
+    metadata = {}
+
+    if words is not None:
+        wpm = settings.get("words_per_minute", DEFAULT_WORDS_PER_MINUTE)
+        labels.append((READING_TIME_LABEL, reading_time(words, wpm)))
+
+    if authors is not None:
+        labels.append((WRITTEN_BY_LABEL, authors))
+
+    slots = (
+        (label, data)
+        for (label, data) in LABEL_SLOTS
+        if label not in present and data not in present
+    )
+
+    for ((label, data), (label_text, data_text)) in zip(slots, labels):
+        metadata[label] = label_text
+        metadata[data] = data_text
+
+    return metadata
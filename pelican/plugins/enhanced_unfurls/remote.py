@@ -0,0 +1,291 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+"""
+Verification of ledes given as full URLs: each distinct lede is checked
+concurrently over a pooled HTTP client, with a HEAD request to see it exists
+and a ranged GET fetching only enough of it to read its dimensions and type.
+Results are cached between builds, and revalidated with their ETag or
+modification time once they expire; failures expire sooner, so ledes which
+were only briefly unreachable are not dropped for long.
+"""
+
+import asyncio
+from logging import getLogger
+from time import time
+
+from .cache import get_remote_cache, remote_expired
+from .images import probe_bytes
+from .stats import stats, timed
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = getLogger(__name__)
+
+USER_AGENT = "pelican-enhanced-unfurls"
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_PER_HOST = 4
+DEFAULT_TIMEOUT = 10
+
+# Enough of an image to find the dimensions of all but the most
+# metadata-laden JPEGs
+PROBE_BYTES = 65536
+
+# Smallest image platforms will show as a lede
+MIN_SIZE = (200, 200)
+
+_warned_unavailable = False
+
+
+def remote_enabled(settings):
+    """
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (bool) Whether remote ledes should be verified
+    """
+    global _warned_unavailable
+
+    if not settings.get("verify_remote_ledes", False):
+        return False
+
+    if aiohttp is None:
+        if not _warned_unavailable:
+            logger.warning("aiohttp is not installed; remote ledes will not be checked")
+            _warned_unavailable = True
+
+        return False
+
+    return True
+
+
+def is_remote(lede):
+    """
+    :param lede: (str) Lede image URL
+
+    :returns: (bool) Whether the lede can be checked over HTTP
+    """
+    return lede.startswith(("http://", "https://"))
+
+
+async def _read_head(resp, size):
+    buf = b""
+
+    while len(buf) < size:
+        chunk = await resp.content.read(size - len(buf))
+
+        if not chunk:
+            break
+
+        buf += chunk
+
+    return buf
+
+
+async def check_lede(session, url, previous=None, probe_size=PROBE_BYTES):
+    """
+    Check a remote lede exists, and read its dimensions and type
+
+    :param session: (aiohttp.ClientSession) Session to make requests with
+    :param url: (str) URL of the lede
+    :param previous: (dict) Previous result for the lede, used to revalidate it
+    :param probe_size: (int) Maximum number of bytes of the lede to fetch
+
+    :returns: (dict) Result of the check
+    """
+    result = {
+        "checked": time(),
+        "ok": False,
+        "error": None,
+        "etag": None,
+        "last_modified": None,
+        "info": None,
+    }
+    headers = {}
+
+    if previous is not None and previous["ok"]:
+        if previous["etag"] is not None:
+            headers["If-None-Match"] = previous["etag"]
+
+        if previous["last_modified"] is not None:
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+    try:
+        async with session.head(url, headers=headers, allow_redirects=True) as resp:
+            if resp.status == 304 and headers:
+                stats.count("remote_ledes_revalidated")
+                return dict(previous, checked=result["checked"])
+
+            status = resp.status
+            content_type = resp.headers.get("Content-Type")
+            result["etag"] = resp.headers.get("ETag")
+            result["last_modified"] = resp.headers.get("Last-Modified")
+
+        # Servers which do not support HEAD are asked for the lede outright
+        if status < 400 or status in (405, 501):
+            headers = {"Range": f"bytes=0-{probe_size - 1}"}
+
+            async with session.get(url, headers=headers, allow_redirects=True) as resp:
+                status = resp.status
+
+                if status < 400:
+                    content_type = resp.headers.get("Content-Type", content_type)
+                    result["etag"] = result["etag"] or resp.headers.get("ETag")
+                    result["info"] = probe_bytes(await _read_head(resp, probe_size))
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        result["error"] = str(e) or type(e).__name__
+        return result
+
+    if status >= 400:
+        result["error"] = f"HTTP {status}"
+
+    elif content_type is not None and not content_type.startswith("image/"):
+        result["error"] = f"not an image ({content_type})"
+
+    else:
+        result["ok"] = True
+
+    return result
+
+
+async def check_ledes(urls, previous, settings):
+    """
+    Check many remote ledes concurrently, over a shared connection pool
+
+    :param urls: (list) URLs of the ledes
+    :param previous: (dict) Previous results, keyed by URL
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (dict) Results, keyed by URL
+    """
+    connector = aiohttp.TCPConnector(
+        limit=settings.get("remote_concurrency", DEFAULT_CONCURRENCY),
+        limit_per_host=settings.get("remote_per_host", DEFAULT_PER_HOST),
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=settings.get("remote_timeout", DEFAULT_TIMEOUT)
+    )
+    probe_size = settings.get("remote_probe_bytes", PROBE_BYTES)
+
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=timeout, headers={"User-Agent": USER_AGENT}
+    ) as session:
+        results = await asyncio.gather(
+            *(check_lede(session, url, previous.get(url), probe_size) for url in urls)
+        )
+
+    return dict(zip(urls, results))
+
+
+@timed("verify_ledes")
+def verify_ledes(urls, context, settings):
+    """
+    Get the results of checking remote ledes,
+    only making requests for those whose cached results have expired
+
+    :param urls: (iterable) URLs of the ledes, which may repeat
+    :param context: (dict) Generator context
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (dict) Results, keyed by URL
+    """
+    cache = get_remote_cache(context)
+    now = time()
+    results = {}
+    previous = {}
+
+    for url in dict.fromkeys(urls):
+        entry = cache.get_cached_data(url, None)
+
+        if entry is not None and not remote_expired(
+            entry["checked"], entry["ok"], settings, now
+        ):
+            results[url] = entry
+        else:
+            previous[url] = entry
+
+    stats.count("remote_ledes_cached", len(results))
+
+    if previous:
+        logger.debug(f"Checking {len(previous)} remote ledes")
+
+        # asyncio.run() is not available before Python 3.7
+        loop = asyncio.new_event_loop()
+
+        try:
+            checked = loop.run_until_complete(
+                check_ledes(list(previous), previous, settings)
+            )
+        finally:
+            loop.close()
+
+        stats.count("remote_ledes_checked", len(checked))
+
+        for (url, result) in checked.items():
+            cache.cache_data(url, result)
+
+        results.update(checked)
+
+    return results
+
+
+def verify_inputs(inputs, context, settings):
+    """
+    Verify the remote ledes of content about to have its metadata computed,
+    dropping those which are unavailable and filling in the dimensions
+    and type of the rest
+
+    :param inputs: (list) Metadata inputs, as returned by get_inputs
+    :param context: (dict) Generator context
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (list) For each input, when its remote lede was checked and
+                     whether it was available, keyed by URL
+    """
+    results = verify_ledes(
+        (i["lede"] for i in inputs if i["lede"] is not None and is_remote(i["lede"])),
+        context,
+        settings,
+    )
+    (min_width, min_height) = settings.get("remote_min_size", MIN_SIZE)
+    warned = set()
+    remote_deps = []
+
+    for i in inputs:
+        url = i["lede"]
+        result = results.get(url)
+        remote_deps.append({})
+
+        if result is None:
+            continue
+
+        remote_deps[-1][url] = (result["checked"], result["ok"])
+
+        if not result["ok"]:
+            stats.count("remote_ledes_unavailable")
+            i["lede"] = None
+
+            if url not in warned:
+                logger.warning(f"Lede {url} is unavailable: {result['error']}")
+
+        elif result["info"] is not None:
+            i["lede_info"] = result["info"]
+            (width, height, _) = result["info"]
+
+            if (width < min_width or height < min_height) and url not in warned:
+                logger.warning(
+                    f"Lede {url} is only {width}x{height}, smaller than "
+                    f"the {min_width}x{min_height} platforms require"
+                )
+
+        warned.add(url)
+
+    return remote_deps
@@ -0,0 +1,89 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+"""
+Images rendered by the plugin are named by a hash of what they were rendered
+from, rendered once into a render cache in CACHE_PATH, and copied from there
+into the output of every build that uses them.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+from pathlib import Path
+from shutil import copyfile
+
+logger = getLogger(__name__)
+
+
+def render_all(render, jobs, workers=None):
+    """
+    Render images, in a process pool if there is more than one
+
+    :param render: (callable) Picklable function rendering a spec to a path,
+                              returning whether it succeeded
+    :param jobs: (dict) Specs, keyed by the file to render them to
+    :param workers: (int) Maximum number of processes to render images in
+
+    :returns: (int) Number of images rendered
+    """
+    if len(jobs) < 2:
+        return sum(render(spec, path) for (path, spec) in jobs.items())
+
+    logger.debug(f"Rendering {len(jobs)} images")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(render, jobs.values(), jobs.keys()))
+
+
+def publish_rendered(images, render, cache_name, context, workers=None):
+    """
+    Make sure rendered images exist in the output,
+    rendering those not already in the render cache
+
+    :param images: (iterable) (path relative to the output path, spec factory)
+                              pairs; factories are only called for images
+                              which need rendering
+    :param render: (callable) Picklable function rendering a spec to a path
+    :param cache_name: (str) Directory within CACHE_PATH to render images to
+    :param context: (dict) Generator context
+    :param workers: (int) Maximum number of processes to render images in
+
+    :returns: (tuple) Number of images rendered, and taken from the cache
+    """
+    output_root = Path(context["OUTPUT_PATH"])
+    cache_root = Path(context["CACHE_PATH"]).joinpath(cache_name)
+    jobs = {}
+    copies = {}
+
+    for (path, get_spec) in images:
+        output_path = output_root.joinpath(path)
+
+        # Images are named by what they were rendered from,
+        # so an existing image is current
+        if output_path in copies or output_path.exists():
+            continue
+
+        cached_path = cache_root.joinpath(Path(path).name)
+
+        if not cached_path.exists():
+            jobs[cached_path] = get_spec()
+
+        copies[output_path] = cached_path
+
+    if not copies:
+        return (0, 0)
+
+    rendered = render_all(render, jobs, workers)
+
+    for (output_path, cached_path) in copies.items():
+        try:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            copyfile(cached_path, output_path)
+        except OSError as e:
+            logger.warning(f"Could not copy rendered image to {output_path}: {e}")
+
+    return (rendered, len(copies) - len(jobs))
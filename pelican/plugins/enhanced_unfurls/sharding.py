@@ -0,0 +1,339 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+"""
+Sharded builds: the unfurl work of a large site split across build nodes.
+Content is partitioned by a stable hash of its source path; each shard build,
+given a shard_index and shard_count, only computes the metadata, tags and
+oEmbed output of its own content, and writes what it computed to an artifact.
+A final build with shard_merge takes results from every artifact rather than
+computing them, then writes the complete output and manifest. Results missing
+from the artifacts, or computed from a different source file, are computed as
+usual, so the output always matches that of a single build.
+"""
+
+from contextlib import suppress
+from hashlib import sha1
+from json import dump, load
+from logging import getLogger
+import os
+from pathlib import Path
+from zlib import crc32
+
+from .cache import settings_key
+from .stats import stats, timed
+
+logger = getLogger(__name__)
+
+SHARD_PATH = "enhanced_unfurls_shards"
+ARTIFACT_VERSION = 2
+
+# Content computed by the current shard build, with the metadata computed
+_collected = []
+
+# Entries of the artifacts being merged, keyed by content, and those entries
+# already checked against the content's source file
+_merged = None
+_checked = {}
+
+_warned_invalid = False
+
+
+def shard_config(settings):
+    """
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (tuple) Index and count of the shard to build,
+                      or None if the build is not sharded
+    """
+    global _warned_invalid
+
+    count = settings.get("shard_count") or 1
+    index = settings.get("shard_index")
+
+    if count < 2 or index is None:
+        return None
+
+    if not 0 <= index < count:
+        if not _warned_invalid:
+            logger.error(
+                f"shard_index {index} is not between 0 and {count - 1}; "
+                "building every shard"
+            )
+            _warned_invalid = True
+
+        return None
+
+    return (index, count)
+
+
+def content_key(content):
+    """
+    :param content: (pelican.contents.Content) Content to identify
+
+    :returns: (str) Source path of the content relative to the content root,
+                    the same on every build node
+    """
+    return content.relative_source_path.replace(os.sep, "/")
+
+
+def shard_of(key, count):
+    """
+    :param key: (str) Key of the content
+    :param count: (int) Number of shards
+
+    :returns: (int) Shard the content belongs to
+    """
+    return crc32(key.encode("utf-8")) % count
+
+
+def in_shard(content, config):
+    """
+    :param content: (pelican.contents.Content) Content to place
+    :param config: (tuple) Index and count of the shard being built, or None
+
+    :returns: (bool) Whether the content is part of the shard being built
+    """
+    return config is None or shard_of(content_key(content), config[1]) == config[0]
+
+
+def source_checksum(path):
+    """
+    :param path: (str) Source file of a piece of content
+
+    :returns: (str) Checksum of the file, or None if it could not be read
+    """
+    try:
+        with open(path, "rb") as f:
+            return sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def shard_root(settings):
+    """
+    :param settings: (dict) Pelican settings
+
+    :returns: (pathlib.Path) Directory shard artifacts are kept in
+    """
+    path = settings.get("ENHANCED_UNFURLS", {}).get("shard_path")
+
+    if path is None:
+        return Path(settings["CACHE_PATH"]).joinpath(SHARD_PATH)
+
+    return Path(path)
+
+
+def artifact_name(index, count):
+    """
+    :param index: (int) Index of the shard
+    :param count: (int) Number of shards
+
+    :returns: (str) Filename of the shard's artifact
+    """
+    return f"shard-{index:03d}-of-{count:03d}.json"
+
+
+def collect(content, metadata):
+    """
+    Remember a piece of content computed by the current shard build
+
+    :param content: (pelican.contents.Content) Content in the shard
+    :param metadata: (dict) Metadata computed for the content
+    """
+    _collected.append((content, metadata))
+
+
+def load_artifacts(settings):
+    """
+    Read the entries of every shard artifact computed with the same settings
+
+    :param settings: (dict) Pelican settings
+
+    :returns: (dict) Entries, keyed by content
+    """
+    root = shard_root(settings)
+    key = settings_key(settings)
+    entries = {}
+    shards = {}
+
+    for path in sorted(root.glob("shard-*-of-*.json")):
+        try:
+            with path.open(encoding="utf-8") as f:
+                artifact = load(f, object_hook=_restore_tuples)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read shard artifact {path}: {e}")
+            continue
+
+        if artifact.get("version") != ARTIFACT_VERSION or artifact["key"] != key:
+            logger.warning(f"Shard artifact {path} was built with other settings")
+            continue
+
+        (index, count) = artifact["shard"]
+        shards.setdefault(count, set()).add(index)
+        entries.update(artifact["entries"])
+
+    if not shards:
+        logger.warning(f"No shard artifacts found in {root}")
+
+    for (count, indexes) in shards.items():
+        missing = sorted(set(range(count)) - indexes)
+
+        if missing:
+            logger.warning(
+                f"Shard artifacts missing for shard(s) "
+                f"{', '.join(map(str, missing))} of {count}; "
+                "their content will be computed here"
+            )
+
+    stats.count("shard_entries_loaded", len(entries))
+    return entries
+
+
+def merged_entry(content, settings):
+    """
+    Get the results computed for a piece of content by a shard build
+
+    :param content: (pelican.contents.Content) Content to look up
+    :param settings: (dict) Pelican settings
+
+    :returns: (dict) Entry of the content, or None if it is missing or was
+                     computed from a different source file
+    """
+    global _merged
+
+    if not settings.get("ENHANCED_UNFURLS", {}).get("shard_merge", False):
+        return None
+
+    key = content_key(content)
+
+    if key in _checked:
+        return _checked[key]
+
+    if _merged is None:
+        _merged = load_artifacts(settings)
+
+    entry = _merged.get(key)
+
+    if entry is not None and entry["checksum"] != source_checksum(content.source_path):
+        stats.count("shard_entries_stale")
+        entry = None
+
+    _checked[key] = entry
+    return entry
+
+
+def _restore_tuples(obj):
+    # Computed metadata and tags only ever hold tuples, which JSON stores as lists
+    return {
+        key: _tuple(val) if isinstance(val, list) else val for (key, val) in obj.items()
+    }
+
+
+def _tuple(val):
+    return tuple(_tuple(v) if isinstance(v, list) else v for v in val)
+
+
+def artifact_tags(tags):
+    """
+    Convert the tags computed for a piece of content into plain values
+
+    :param tags: (dict) Computed values, keyed by step then content attribute
+
+    :returns: (dict) Tags with the unfurl record replaced by its tag values
+    """
+    if tags is None or "record" not in tags:
+        return tags
+
+    return {**tags, "record": {"unfurl": tags["record"]["unfurl"].values}}
+
+
+def write_artifact(path, artifact):
+    """
+    Atomically write a shard artifact
+
+    Artifacts are JSON, so are safe to read whichever node wrote them;
+    values JSON cannot hold are written as the text they are rendered as
+
+    :param path: (pathlib.Path) File to write
+    :param artifact: (dict) Shard artifact
+
+    :returns: (bool) Whether the artifact was written
+    """
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}")
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with tmp_path.open("w", encoding="utf-8") as f:
+            dump(artifact, f, default=str)
+
+        os.replace(tmp_path, path)
+
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not write shard artifact to {path}: {e}")
+
+        with suppress(OSError):
+            tmp_path.unlink()
+
+        return False
+
+    return True
+
+
+@timed("write_shard")
+def write_shard(pelican):
+    """
+    Write what the shard build computed to its artifact,
+    then forget the shard state of the build
+
+    :param pelican: (pelican.Pelican) Pelican instance that ran the build
+    """
+    global _merged
+
+    settings = pelican.settings
+    config = shard_config(settings.get("ENHANCED_UNFURLS", {}))
+
+    if config is not None:
+        entries = {}
+
+        for (content, metadata) in _collected:
+            state = content.__dict__.get("_unfurl_state")
+            tags = None
+
+            if state is not None:
+                # Tags are only computed when read, and may not all have been
+                for attr in ("unfurl", "oembed_url", "unfurl_html"):
+                    getattr(content, attr, None)
+
+                tags = artifact_tags(state.entry["tags"])
+
+            entries[content_key(content)] = {
+                "checksum": source_checksum(content.source_path),
+                "metadata": metadata,
+                "translations": (
+                    content.metadata.get("locale_alternates"),
+                    content.metadata.get("alternates"),
+                ),
+                "tags": tags,
+            }
+
+        artifact = {
+            "version": ARTIFACT_VERSION,
+            "shard": config,
+            "key": settings_key(settings),
+            "entries": entries,
+        }
+        path = shard_root(settings).joinpath(artifact_name(*config))
+
+        if write_artifact(path, artifact):
+            stats.count("shard_entries_written", len(entries))
+            logger.info(f"Shard {config[0]} of {config[1]}: {len(entries)} entries")
+
+    _collected.clear()
+    _checked.clear()
+    _merged = None
@@ -0,0 +1,129 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from logging import getLogger
+from posixpath import join, normpath
+
+logger = getLogger(__name__)
+
+# Prefixes marking a link to static content, rather than a full URL
+LINK_PREFIXES = ("{static}", "{attach}", "|static|", "|attach|")
+
+_index = None
+
+
+def normalize(path):
+    """
+    Normalize a static content path, so every way of writing it matches
+
+    :param path: (str) Static content path
+
+    :returns: (str) Normalized path
+    """
+    return normpath(path.replace("\\", "/").replace("%20", " ")).lstrip("/")
+
+
+def is_static_link(link):
+    """
+    :param link: (str) Lede image link
+
+    :returns: (bool) Whether the link refers to static content
+    """
+    return link.startswith(LINK_PREFIXES)
+
+
+class StaticIndex:
+    """
+    Static content keyed by normalized path, resolving every form a lede may
+    be written in with a single lookup
+    """
+
+    def __init__(self, static_content):
+        """
+        :param static_content: (dict) Static content keyed by path,
+                                      as found in the generator context
+        """
+        self.static_content = static_content
+        self.size = len(static_content)
+        self.paths = {normalize(path): obj for (path, obj) in static_content.items()}
+        self._links = {}
+
+    def get(self, path):
+        """
+        :param path: (str) Path of static content, relative to the content root
+
+        :returns: (tuple) Normalized path and static content, which is None
+                          if no content exists at the path
+        """
+        path = normalize(path)
+        return (path, self.paths.get(path))
+
+    def resolve(self, link, content=None):
+        """
+        Resolve a static content link to the content it refers to
+
+        Links starting with "/" are relative to the content root, those
+        starting with "./" or "../" to the directory of the linking content;
+        links starting with neither are looked up relative to the content root
+        first, then the linking content. Links not relative to the linking
+        content are only resolved once.
+
+        :param link: (str) Link, with or without a {static}/{attach} prefix
+        :param content: (pelican.contents.Content) Content containing the link
+
+        :returns: (tuple) Normalized path and static content, which is None
+                          if no content exists at the path
+        """
+        result = self._links.get(link)
+
+        if result is not None:
+            return result
+
+        path = link
+
+        for prefix in LINK_PREFIXES:
+            if path.startswith(prefix):
+                path = path[len(prefix) :]
+                break
+
+        relative = path.startswith(("./", "../"))
+
+        if not relative:
+            result = self.get(path)
+
+            if result[1] is not None or path.startswith("/") or content is None:
+                self._links[link] = result
+                return result
+
+        if content is None:
+            return self.get(path)
+
+        relative_dir = content.relative_dir.replace("\\", "/")
+        return self.get(join(relative_dir, path))
+
+
+def get_static_index(context):
+    """
+    Get the static content index of the current build,
+    building it if the static content has changed
+
+    :param context: (dict) Generator context
+
+    :returns: (StaticIndex) Static content index
+    """
+    global _index
+    static_content = context.get("static_content", {})
+
+    if (
+        _index is None
+        or _index.static_content is not static_content
+        or _index.size != len(static_content)
+    ):
+        _index = StaticIndex(static_content)
+        logger.debug(f"Indexed {_index.size} static files")
+
+    return _index
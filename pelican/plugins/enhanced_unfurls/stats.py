@@ -0,0 +1,126 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from collections import Counter
+from functools import wraps
+from json import dumps
+from logging import getLogger
+from pathlib import Path
+from time import perf_counter
+
+logger = getLogger(__name__)
+
+STATS_NAME = "enhanced_unfurls_stats.json"
+
+
+class BuildStats:
+    """
+    Wall time and call counts of signal handlers,
+    plus counters of work done, over a single build
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Discard everything recorded so far
+        """
+        self.timings = {}
+        self.counters = Counter()
+
+    def count(self, name, amount=1):
+        """
+        Increment a counter
+
+        :param name: (str) Name of the counter
+        :param amount: (int) Amount to increment the counter by
+        """
+        self.counters[name] += amount
+
+    def record(self, name, seconds):
+        """
+        Record a call to a signal handler
+
+        :param name: (str) Name of the handler
+        :param seconds: (float) Wall time the call took
+        """
+        (calls, total) = self.timings.get(name, (0, 0.0))
+        self.timings[name] = (calls + 1, total + seconds)
+
+    def as_dict(self):
+        """
+        :returns: (dict) Everything recorded, in a JSON-serializable form
+        """
+        return {
+            "timings": {
+                name: {"calls": calls, "seconds": round(total, 6)}
+                for (name, (calls, total)) in sorted(self.timings.items())
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+
+stats = BuildStats()
+
+
+def timed(name):
+    """
+    Record the wall time and call count of a signal handler
+
+    :param name: (str) Name to record the handler under
+
+    :returns: (callable) Decorator
+    """
+
+    def _decorator(func):
+        @wraps(func)
+        def _wrapper(*args, **kwargs):
+            start = perf_counter()
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.record(name, perf_counter() - start)
+
+        return _wrapper
+
+    return _decorator
+
+
+def report_stats(pelican):
+    """
+    Log the stats recorded during a build, optionally saving them as JSON,
+    then reset them for the next build
+
+    :param pelican: (pelican.Pelican) Pelican instance that ran the build
+    """
+    settings = pelican.settings
+    destination = settings.get("ENHANCED_UNFURLS", {}).get("stats")
+    recorded = stats.as_dict()
+    stats.reset()
+
+    if not recorded["timings"]:
+        return
+
+    for (name, timing) in recorded["timings"].items():
+        logger.info(f"{name}: {timing['calls']} call(s) in {timing['seconds']:.3f}s")
+
+    if recorded["counters"]:
+        logger.info(
+            ", ".join(f"{name}: {val}" for (name, val) in recorded["counters"].items())
+        )
+
+    if destination in ("output", "cache"):
+        root = settings["OUTPUT_PATH" if destination == "output" else "CACHE_PATH"]
+        stats_path = Path(root).joinpath(STATS_NAME)
+
+        try:
+            stats_path.parent.mkdir(parents=True, exist_ok=True)
+            stats_path.write_text(dumps(recorded, indent=2) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write unfurl stats to {stats_path}: {e}")
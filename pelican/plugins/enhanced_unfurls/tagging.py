@@ -5,12 +5,91 @@
 #       Released under version 3.0 of the Non-Profit Open Source License       #
 ################################################################################
 
+from collections import ChainMap
+from collections.abc import Mapping
 from datetime import datetime
+from functools import partial
+from inspect import getattr_static
 from logging import getLogger
 from pathlib import Path
 
+from markupsafe import Markup, escape
+
+from .bundle import endpoint_url
+from .cache import get_cache, settings_key
+from .contents import unsignaled_content
+from .description import DESCRIPTION_LIMITS, plain_text, truncate
+from .profiling import profiled_as
+from .sharding import in_shard, merged_entry, shard_config
+from .stats import stats, timed
+from .tracking import track, tracking_enabled
+
 logger = getLogger(__name__)
 
+# Groups of tags, in output order, with the setting that enables each group
+# and the meta tag attribute the group's tag names are placed in
+GROUPS = (
+    ("og", None, "property"),
+    ("fb", "facebook", "property"),
+    ("twitter", "twitter", "name"),
+)
+
+# Metadata which holds dates, and should be output as such
+DATE_SOURCES = ("date", "modified")
+
+TAG_MAPS = {
+    "og": {
+        "type": "og:type",
+        "url": "og:url",
+        "title": "og:title",
+        "summary": "og:description",
+        "lede": "og:image",
+        "lede_width": "og:image:width",
+        "lede_height": "og:image:height",
+        "lede_type": "og:image:type",
+        "locale": "og:locale",
+        "locale_alternates": "og:locale:alternate",
+        "date": "article:published_time",
+        "modified": "article:modified_time",
+    },
+    "fb": {
+        "fb_app_id": "fb:app_id",
+    },
+    "twitter": {
+        "card_type": "twitter:card",
+        "url": "twitter:url",
+        "title": "twitter:title",
+        "summary": "twitter:description",
+        "lede": "twitter:image",
+        "lede_desc": "twitter:image:alt",
+        "author_twitter": "twitter:creator",
+        "site_twitter": "twitter:site",
+        "tl1": "twitter:label1",
+        "td1": "twitter:data1",
+        "tl2": "twitter:label2",
+        "td2": "twitter:data2",
+    },
+}
+
+# Metadata read instead of that named in a group's tag map, when present
+SOURCE_OVERRIDES = {"twitter": {"lede": "twitter_lede"}}
+
+_plans = {}
+
+
+def to_date(val):
+    """
+    Convert a datetime into the date format used by unfurl tags
+
+    :param val: Metadata value
+
+    :returns: Date portion of the value in ISO format, or the value unchanged
+    """
+    if isinstance(val, datetime):
+        return val.date().isoformat()
+
+    return val
+
 
 def map_to_tags(metadata, tag_map):
     """
@@ -27,75 +106,403 @@ def map_to_tags(metadata, tag_map):
         val = metadata.get(src)
 
         if val is not None:
-            if isinstance(val, datetime):
-                result[dst] = val.date().isoformat()
-            else:
-                result[dst] = val
+            result[dst] = to_date(val)
 
     return result
 
 
-def insert_tags(generator, content):
+class UnfurlPlan:
+    """
+    Tag mappings compiled once from the settings, and applied to each
+    piece of content to produce its unfurl record
     """
-    Convert content metadata into key/value pairs
-    to be consumed by third parties
 
-    :param generator: (pelican.generators.Generator) Content generator
-    :param content: (pelican.contents.Content) Content to be tagged
+    def __init__(self, settings):
+        """
+        :param settings: (dict) Pelican settings
+        """
+        eu_settings = settings.get("ENHANCED_UNFURLS", {})
+        user_maps = eu_settings.get("tag_maps", {})
+        limits = dict(DESCRIPTION_LIMITS)
+        limits.update(eu_settings.get("description_limits", {}))
+        entries = []
+        groups = {}
+        described = set()
+
+        for (group, setting, _) in GROUPS:
+            if setting is not None and not eu_settings.get(setting, False):
+                continue
+
+            tag_map = dict(TAG_MAPS[group])
+            tag_map.update(user_maps.get(group, {}))
+            overrides = SOURCE_OVERRIDES.get(group, {})
+            start = len(entries)
+
+            for (src, dst) in tag_map.items():
+                if dst is None:
+                    continue
+
+                src = overrides.get(src, src)
+
+                if src == "summary":
+                    described.add(len(entries))
+                    converter = partial(truncate, limit=limits.get(group))
+                elif src in DATE_SOURCES:
+                    converter = to_date
+                else:
+                    converter = None
+
+                entries.append((src, dst, converter))
+
+            groups[group] = (start, len(entries))
+
+        self.entries = tuple(entries)
+        self.groups = groups
+        self.described = frozenset(described)
+        self.siteurl = settings.get("SITEURL")
+        self.oembed = eu_settings.get("oembed", False)
+        self.oembed_mode = eu_settings.get("oembed_mode", "files")
+        self.oembed_endpoint = eu_settings.get("oembed_endpoint")
+        self.alternate_links = eu_settings.get("alternate_links", False)
+        self.track = tracking_enabled(eu_settings)
+        self.key = settings_key(settings)
+
+    def apply(self, metadata, summary=None):
+        """
+        Map the metadata of a piece of content to its tags
+
+        The summary is converted to plain text once, then truncated to each
+        group's description limit; neither it nor the metadata is modified
+
+        :param metadata: (dict) Content metadata
+        :param summary: (str) Summary to describe the content with,
+                              instead of the one in its metadata
+
+        :returns: (UnfurlRecord) Content metadata mapped to tags
+        """
+        if summary is None:
+            summary = metadata.get("summary")
+
+        sources = {"summary": None if summary is None else plain_text(summary)}
+
+        for group_overrides in SOURCE_OVERRIDES.values():
+            for (src, override) in group_overrides.items():
+                sources[override] = metadata.get(override, metadata.get(src))
+        get = ChainMap(sources, metadata).get
+        values = []
+
+        for (src, _, converter) in self.entries:
+            val = get(src)
+
+            if val is not None and converter is not None:
+                val = converter(val)
+
+            values.append(val)
+
+        values = tuple(values)
+
+        return UnfurlRecord(self, values)
+
+
+class UnfurlRecord:
+    """
+    Tag values of a piece of content, stored alongside the plan they came from
     """
-    settings = generator.settings
-    siteurl = settings.get("SITEURL")
-    eu_settings = settings.get("ENHANCED_UNFURLS", {})
-    fb_support = eu_settings.get("facebook", False)
-    twitter_support = eu_settings.get("twitter", False)
-    oembed_support = eu_settings.get("oembed", False)
 
-    og_map = {
-        "type": "og:type",
-        "url": "og:url",
-        "title": "og:title",
-        "summary": "og:description",
-        "lede": "og:image",
-        "locale": "og:locale",
-        "date": "article:published_time",
-        "modified": "article:modified_time",
-    }
+    __slots__ = ("plan", "values")
 
-    fb_map = {
-        "fb_app_id": "fb:app_id",
-    }
+    def __init__(self, plan, values):
+        """
+        :param plan: (UnfurlPlan) Plan the values were computed with
+        :param values: (tuple) Tag values, in plan entry order
+        """
+        self.plan = plan
+        self.values = values
 
-    twitter_map = {
-        "card_type": "twitter:card",
-        "url": "twitter:url",
-        "title": "twitter:title",
-        "summary": "twitter:description",
-        "lede": "twitter:image",
-        "lede_desc": "twitter:image:alt",
-        "author_twitter": "twitter:creator",
-        "site_twitter": "twitter:site",
-        "tl1": "twitter:label1",
-        "td1": "twitter:data1",
-        "tl2": "twitter:label2",
-        "td2": "twitter:data2",
-    }
+    def group(self, name):
+        """
+        Get the tags of one group
 
-    if siteurl is not None:
-        content.metadata["summary"] = content.get_summary(siteurl)
+        :param name: (str) Name of the group
 
-    content.unfurl_og = map_to_tags(content.metadata, og_map)
+        :returns: (TagView) Tags of the group, or None if it is disabled
+        """
+        bounds = self.plan.groups.get(name)
 
-    if fb_support:
-        tags = map_to_tags(content.metadata, fb_map)
-        if tags:
-            content.unfurl_fb = tags
+        if bounds is None:
+            return None
+
+        return TagView(self, *bounds)
+
+    def texts(self):
+        """
+        Get the plain text of each tag, as it appears in rendered HTML
+
+        Values are stripped of markup once each,
+        no matter how many tags they appear in
+
+        :returns: (generator) (meta attribute, tag name, text) tuples
+        """
+        stripped = {}
+        entries = self.plan.entries
+        described = self.plan.described
+
+        for (group, _, attr) in GROUPS:
+            bounds = self.plan.groups.get(group)
+
+            if bounds is None:
+                continue
+
+            for i in range(*bounds):
+                val = self.values[i]
+
+                if val is None:
+                    continue
+
+                # Tags given several values are repeated, once for each
+                for item in val if isinstance(val, tuple) else (val,):
+                    key = str(item)
+
+                    if key not in stripped:
+                        # Descriptions are already plain text
+                        stripped[key] = (
+                            key if i in described else Markup(key).striptags()
+                        )
+
+                    yield (attr, entries[i][1], stripped[key])
+
+    def html(self, oembed_url=None, alternates=()):
+        """
+        Render the tags as HTML, ready to be placed in a page's head
+
+        Values are stripped of markup and escaped once each,
+        no matter how many tags they appear in
+
+        :param oembed_url: (str) URL of the content's oEmbed info, if any
+        :param alternates: (tuple) (language, URL) pairs of the content's
+                                   translations, to be linked to
+
+        :returns: (markupsafe.Markup) Rendered tags
+        """
+        escaped = {}
+        lines = []
+
+        if oembed_url is not None:
+            lines.append(
+                '<link rel="alternate" type="application/json+oembed" '
+                f'href="{escape(oembed_url)}" />'
+            )
+
+        for (lang, url) in alternates:
+            lines.append(
+                f'<link rel="alternate" hreflang="{escape(lang)}" '
+                f'href="{escape(url)}" />'
+            )
+
+        for (attr, tag, text) in self.texts():
+            if text not in escaped:
+                escaped[text] = escape(text)
+
+            lines.append(f'<meta {attr}="{escape(tag)}" content="{escaped[text]}" />')
+
+        return Markup("\n".join(lines))
+
+    @property
+    def og(self):
+        return self.group("og")
+
+    @property
+    def fb(self):
+        return self.group("fb")
+
+    @property
+    def twitter(self):
+        return self.group("twitter")
+
+
+class TagView(Mapping):
+    """
+    Read-only mapping of tag names to the values present in one group
+    """
+
+    __slots__ = ("record", "start", "stop")
+
+    def __init__(self, record, start, stop):
+        self.record = record
+        self.start = start
+        self.stop = stop
+
+    def items(self):
+        entries = self.record.plan.entries
+        values = self.record.values
+
+        for i in range(self.start, self.stop):
+            if values[i] is not None:
+                yield (entries[i][1], values[i])
+
+    def tags(self):
+        """
+        Get the tags of the group as they are output, for templates which
+        render each tag themselves
+
+        :returns: (generator) (tag name, value) pairs, with tags given several
+                              values repeated, once for each
+        """
+        for (tag, val) in self.items():
+            for item in val if isinstance(val, tuple) else (val,):
+                yield (tag, item)
+
+    def __getitem__(self, key):
+        for (tag, val) in self.items():
+            if tag == key:
+                return val
+
+        raise KeyError(key)
+
+    def __iter__(self):
+        return (tag for (tag, _) in self.items())
+
+    def __len__(self):
+        return sum(1 for _ in self.items())
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+def get_plan(settings):
+    """
+    Get the unfurl plan for the given settings, compiling it if necessary
+
+    Pelican hands every handler the same settings for a whole build, so the
+    plan and its settings key are compiled once per build
+
+    :param settings: (dict) Pelican settings
+
+    :returns: (UnfurlPlan) Unfurl plan
+    """
+    # Holding the settings keeps their ID from being reused during the build
+    (held, plan) = _plans.get(id(settings), (None, None))
+
+    if held is not settings:
+        plan = UnfurlPlan(settings)
+        _plans[id(settings)] = (settings, plan)
+
+    return plan
+
+
+def reset_plans(*args, **kwargs):
+    """
+    Forget the unfurl plans compiled during the build that just finished
+    """
+    _plans.clear()
+
+
+def restore_tags(tags, plan):
+    """
+    Rebuild the tags of an entry read from a shard artifact, which holds
+    plain values rather than the objects they were computed as
+
+    :param tags: (dict) Computed values, keyed by step then content attribute
+    :param plan: (UnfurlPlan) Plan the tags were computed with
+    """
+    record = tags.get("record")
+    html = tags.get("html")
+
+    if record is not None and not isinstance(record["unfurl"], UnfurlRecord):
+        record["unfurl"] = UnfurlRecord(plan, record["unfurl"])
+
+    if html is not None:
+        html["unfurl_html"] = Markup(html["unfurl_html"])
+
+
+def attach_record(content, record):
+    """
+    Attach an unfurl record and its tag groups to a piece of content
+
+    :param content: (pelican.contents.Content) Content to be tagged
+    :param record: (UnfurlRecord) Tags of the content
+    """
+    content.unfurl = record
+    content.unfurl_og = record.og
+
+    for name in ("fb", "twitter"):
+        tags = record.group(name)
 
-    if twitter_support:
-        tags = map_to_tags(content.metadata, twitter_map)
         if tags:
-            content.unfurl_twitter = tags
+            setattr(content, f"unfurl_{name}", tags)
+
+
+class UnfurlState:
+    """
+    What is needed to compute the unfurl attributes of a piece of content,
+    and which of them have been computed so far
+    """
+
+    __slots__ = ("plan", "entry", "done")
+
+    def __init__(self, plan, entry):
+        """
+        :param plan: (UnfurlPlan) Plan to compute tags with
+        :param entry: (dict) Cache entry to store computed attributes in
+        """
+        self.plan = plan
+        self.entry = entry
+        self.done = set()
+
+
+class LazyAttribute:
+    """
+    Content attribute computed, along with the rest of its step,
+    the first time it is read and then stored on the content itself
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, content, owner=None):
+        if content is None:
+            return self
+
+        state = content.__dict__.get("_unfurl_state")
+
+        if state is not None:
+            compute_step(content, state, ATTR_STEPS[self.name])
+
+            if self.name in content.__dict__:
+                return content.__dict__[self.name]
+
+        raise AttributeError(
+            f"{type(content).__name__!r} object has no attribute {self.name!r}"
+        )
+
+
+def tag_record(content, plan):
+    """
+    :returns: (dict) Unfurl record of the content
+    """
+    summary = None
+
+    if plan.siteurl is not None:
+        stats.count("summaries_computed")
+        summary = content.get_summary(plan.siteurl)
+
+    return {"unfurl": plan.apply(content.metadata, summary)}
+
+
+def tag_oembed(content, plan):
+    """
+    :returns: (dict) Location of the content's oEmbed info, if any
+    """
+    values = {}
+
+    # Bundled records can only be linked to if they are served from an endpoint
+    if plan.oembed and plan.oembed_mode == "bundle":
+        if plan.oembed_endpoint is not None and "url" in content.metadata:
+            values["oembed_url"] = endpoint_url(
+                plan.oembed_endpoint, content.metadata["url"]
+            )
 
-    if oembed_support:
+    elif plan.oembed:
         content_path = Path(content.save_as)
         oembed_path = None
 
@@ -105,6 +512,163 @@ def insert_tags(generator, content):
         elif content_path.suffix != "":
             oembed_path = content_path.with_suffix(".json")
 
-        if oembed_path is not None and siteurl is not None:
-            content.oembed_url = f"{siteurl}/{str(oembed_path)}"
-            content.oembed_save_as = str(oembed_path)
+        if oembed_path is not None and plan.siteurl is not None:
+            values["oembed_url"] = f"{plan.siteurl}/{str(oembed_path)}"
+            values["oembed_save_as"] = str(oembed_path)
+
+    return values
+
+
+def tag_html(content, plan):
+    """
+    :returns: (dict) Rendered unfurl tags of the content
+    """
+    alternates = ()
+
+    if plan.alternate_links:
+        alternates = content.metadata.get("alternates", ())
+
+    oembed_url = getattr(content, "oembed_url", None)
+    return {"unfurl_html": content.unfurl.html(oembed_url, alternates)}
+
+
+# Steps computing unfurl attributes, and the attributes each step computes
+STEPS = {
+    "record": tag_record,
+    "oembed": tag_oembed,
+    "html": tag_html,
+}
+
+ATTR_STEPS = {
+    "unfurl": "record",
+    "unfurl_og": "record",
+    "unfurl_fb": "record",
+    "unfurl_twitter": "record",
+    "oembed_url": "oembed",
+    "oembed_save_as": "oembed",
+    "unfurl_html": "html",
+}
+
+
+def apply_step(content, values):
+    """
+    Set the attributes computed by a step on a piece of content
+
+    :param content: (pelican.contents.Content) Content to be tagged
+    :param values: (dict) Computed values, keyed by content attribute
+    """
+    for (attr, val) in values.items():
+        if attr == "unfurl":
+            attach_record(content, val)
+        else:
+            setattr(content, attr, val)
+
+
+@timed("lazy_tags")
+@profiled_as("insert_tags")
+def _run_step(content, state, step):
+    values = STEPS[step](content, state.plan)
+    apply_step(content, values)
+
+    if state.entry is not None:
+        if state.entry["tags"] is None:
+            state.entry["tags"] = {}
+
+        state.entry["tags"][step] = values
+
+
+def compute_step(content, state, step):
+    """
+    Compute the attributes of a step, unless they have been already
+
+    :param content: (pelican.contents.Content) Content to be tagged
+    :param state: (UnfurlState) Unfurl state of the content
+    :param step: (str) Name of the step
+    """
+    if step not in state.done:
+        state.done.add(step)
+        _run_step(content, state, step)
+
+
+def install_lazy_attributes(cls):
+    """
+    Make unfurl attributes of a content class computed on first access
+
+    :param cls: (type) Content class
+    """
+    for attr in ATTR_STEPS:
+        if not isinstance(getattr_static(cls, attr, None), LazyAttribute):
+            setattr(cls, attr, LazyAttribute(attr))
+
+
+@timed("insert_tags")
+@profiled_as("insert_tags")
+def insert_tags(generator, content):
+    """
+    Prepare content to have its metadata converted into key/value pairs
+    to be consumed by third parties
+
+    Tags are only computed when first read, typically by a template
+
+    :param generator: (pelican.generators.Generator) Content generator
+    :param content: (pelican.contents.Content) Content to be tagged
+    """
+    settings = generator.settings
+    shard = shard_config(settings.get("ENHANCED_UNFURLS", {}))
+
+    # Shard builds only tag their own content
+    if not in_shard(content, shard):
+        return
+
+    plan = get_plan(settings)
+    cache = get_cache(settings)
+    entry = None
+
+    if cache is not None:
+        entry = cache.get_entry(content, plan.key)
+
+    if entry is None:
+        entry = merged_entry(content, settings)
+
+        if entry is not None and entry["tags"] is not None:
+            restore_tags(entry["tags"], plan)
+
+    # Translations are grouped anew every build, and are not part of the key
+    # the entry was cached under
+    translations = (
+        content.metadata.get("locale_alternates"),
+        content.metadata.get("alternates"),
+    )
+
+    # Shard builds keep the tags they compute, for their artifact
+    if entry is None and shard is not None:
+        entry = {"translations": translations, "tags": None}
+
+    install_lazy_attributes(type(content))
+    state = content._unfurl_state = UnfurlState(plan, entry)
+
+    if plan.track:
+        track(content)
+
+    if entry is not None and entry.get("translations") != translations:
+        entry["tags"] = None
+        entry["translations"] = translations
+
+    if entry is not None and entry["tags"] is not None:
+        stats.count("tags_cached")
+
+        for (step, values) in entry["tags"].items():
+            state.done.add(step)
+            apply_step(content, values)
+
+
+def insert_unsignaled_tags(generators):
+    """
+    Prepare content Pelican writes without sending a signal, such as article
+    drafts, to be tagged like the rest
+
+    :param generators: (list) Generators to prepare content of
+    """
+    for gen in generators:
+        for content in unsignaled_content(gen):
+            insert_tags(gen, content)
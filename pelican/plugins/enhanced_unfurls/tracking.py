@@ -0,0 +1,48 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+# Content tagged during the current build, keyed by URL
+_tracked = {}
+
+
+def tracking_enabled(settings):
+    """
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (bool) Whether tagged content is needed after the build
+    """
+    return settings.get("manifest") is not None or settings.get("validate", False)
+
+
+def track(content):
+    """
+    Remember a piece of tagged content until the end of the build
+
+    :param content: (pelican.contents.Content) Tagged content
+    """
+    url = content.metadata.get("url")
+
+    if url is not None:
+        _tracked[url] = content
+
+
+def tracked():
+    """
+    :returns: (dict) Content tagged during the current build, keyed by URL
+    """
+    return _tracked
+
+
+def reset_tracked(*args, **kwargs):
+    """
+    Forget the content tagged during the build that just finished
+    """
+    _tracked.clear()
@@ -0,0 +1,116 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from locale import normalize
+from logging import getLogger
+from operator import attrgetter
+
+from .stats import stats
+
+logger = getLogger(__name__)
+
+
+def translation_key(translation_id):
+    """
+    Build a function identifying which translations a piece of content
+    belongs with, as Pelican does
+
+    :param translation_id: (str) Attribute, or collection of attributes,
+                                 shared by translations of the same content
+
+    :returns: (callable) Function returning the translation key of a piece of
+                         content, or None if translations are not identified
+    """
+    if not translation_id:
+        return None
+
+    if isinstance(translation_id, str):
+        translation_id = (translation_id,)
+
+    getter = attrgetter(*translation_id)
+
+    def _key(content):
+        try:
+            return getter(content)
+        except AttributeError:
+            return None
+
+    return _key
+
+
+def og_locale(lang):
+    """
+    :param lang: (str) Language of a piece of content, such as "fr" or "pt-br"
+
+    :returns: (str) The language as the ll_TT locale OG expects; bare language
+                    codes take the territory of the system's locale alias for
+                    them, and are left as they are if there is none
+    """
+    normalized = normalize(lang.replace("-", "_")).split(".")[0].split("@")[0]
+    (language, _, territory) = normalized.partition("_")
+
+    if not territory:
+        return lang
+
+    return f"{language}_{territory.upper()}"
+
+
+def content_locale(content):
+    """
+    :param content: (pelican.contents.Content) Content with enhanced metadata
+
+    :returns: (str) Locale the content is unfurled with
+    """
+    return content.metadata.get("locale") or og_locale(content.lang)
+
+
+def group_translations(contents, translation_id):
+    """
+    Give every piece of content the locales and URLs of its translations,
+    grouping all content in a single pass
+
+    :param contents: (iterable) Content with enhanced metadata, including
+                                translations
+    :param translation_id: (str) Attribute, or collection of attributes,
+                                 shared by translations of the same content
+    """
+    key = translation_key(translation_id)
+
+    if key is None:
+        return
+
+    groups = {}
+
+    for content in contents:
+        content_key = key(content)
+
+        if content_key is not None:
+            groups.setdefault(content_key, []).append(content)
+
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+
+        stats.count("translation_groups")
+        versions = [
+            (content_locale(member), member.lang, member.metadata.get("url"))
+            for member in members
+        ]
+
+        for (member, (own_locale, _, _)) in zip(members, versions):
+            # Content advertised by its translations advertises itself the same
+            member.metadata.setdefault("locale", own_locale)
+            member.metadata["locale_alternates"] = tuple(
+                dict.fromkeys(
+                    locale for (locale, _, _) in versions if locale != own_locale
+                )
+            )
+            member.metadata["alternates"] = tuple(
+                (lang, url)
+                for (other, (_, lang, url)) in zip(members, versions)
+                if other is not member and url is not None
+            )
@@ -0,0 +1,308 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+"""
+Post-build validation of the unfurl tags in generated pages. Only the head of
+each page is read, through an incremental parser which stops at </head>, and
+pages are checked in parallel. Run at the end of a build with the validate
+setting, pages are also checked against the tags computed for them; run from
+the command line, any generated site can be checked:
+
+    python -m pelican.plugins.enhanced_unfurls.validate OUTPUT_PATH SITEURL
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from logging import basicConfig, getLogger
+import os
+from pathlib import Path
+import sys
+from urllib.parse import unquote, urlsplit
+
+from .description import DESCRIPTION_LIMITS
+from .sharding import shard_config
+from .stats import stats, timed
+from .tracking import tracked
+
+logger = getLogger(__name__)
+
+CHUNK_SIZE = 16384
+
+# Minimum number of pages before they are checked in parallel
+PARALLEL_THRESHOLD = 256
+
+OEMBED_TYPE = "application/json+oembed"
+
+REQUIRED_TAGS = ("og:url", "og:title", "og:type")
+IMAGE_TAGS = ("og:image", "twitter:image")
+DESCRIPTION_TAGS = {"og:description": "og", "twitter:description": "twitter"}
+
+
+class HeadParser(HTMLParser):
+    """
+    Collects the meta tags and oEmbed links of a page's head,
+    and notices when the head has ended
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+        self.oembed = []
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+
+        if tag == "meta":
+            attrs = dict(attrs)
+            name = attrs.get("property") or attrs.get("name")
+
+            if name is not None and attrs.get("content") is not None:
+                self.meta.setdefault(name, []).append(attrs["content"])
+
+        elif tag == "link":
+            attrs = dict(attrs)
+
+            if attrs.get("type") == OEMBED_TYPE and attrs.get("href"):
+                self.oembed.append(attrs["href"])
+
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.done = True
+
+
+def parse_head(path, chunk_size=CHUNK_SIZE):
+    """
+    Parse the head of a page, reading no further than its end
+
+    :param path: (pathlib.Path) Page to parse
+    :param chunk_size: (int) Number of characters to read at a time
+
+    :returns: (HeadParser) Parsed head
+    """
+    parser = HeadParser()
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        while not parser.done:
+            chunk = f.read(chunk_size)
+
+            if not chunk:
+                break
+
+            parser.feed(chunk)
+
+    return parser
+
+
+def local_path(url, siteurl, output_root):
+    """
+    :param url: (str) URL found in a page
+    :param siteurl: (str) Root URL of the site
+    :param output_root: (pathlib.Path) Directory the site was generated to
+
+    :returns: (pathlib.Path) File the URL is served from,
+                             or None if it is not part of the site
+    """
+    if not siteurl or not url.startswith(f"{siteurl}/"):
+        return None
+
+    path = unquote(urlsplit(url[len(siteurl) + 1 :]).path)
+    return output_root.joinpath(path or "index.html")
+
+
+def check_page(task):
+    """
+    Check the unfurl tags of a generated page
+
+    :param task: (tuple) Page, URL, expected tag values (or None), expected
+                         oEmbed URL (or None), site URL, output root and
+                         description limits
+
+    :returns: (tuple) URL and a list of problems found
+    """
+    (page, url, expected, oembed_url, siteurl, output_root, limits) = task
+    problems = []
+
+    try:
+        head = parse_head(page)
+    except OSError as e:
+        return (url, [f"page could not be read: {e}"])
+
+    meta = head.meta
+
+    # Pages without unfurl tags, such as indexes, are only checked if they
+    # were tagged during the build
+    if expected is None and not any(tag.startswith("og:") for tag in meta):
+        return (url, problems)
+
+    for tag in REQUIRED_TAGS:
+        if tag not in meta:
+            problems.append(f"missing {tag}")
+
+    for tag in IMAGE_TAGS:
+        for image in meta.get(tag, ()):
+            if "://" not in image:
+                problems.append(f"{tag} is not an absolute URL: {image}")
+                continue
+
+            image_path = local_path(image, siteurl, output_root)
+
+            if image_path is not None and not image_path.is_file():
+                problems.append(f"{tag} does not exist: {image}")
+
+    for (tag, group) in DESCRIPTION_TAGS.items():
+        limit = limits.get(group)
+
+        for description in meta.get(tag, ()):
+            if limit is not None and len(description) > limit:
+                problems.append(f"{tag} is {len(description)} characters, over {limit}")
+
+    for href in head.oembed:
+        oembed_path = local_path(href, siteurl, output_root)
+
+        # Links to an endpoint, rather than a file, are not checked
+        if oembed_path is not None and "?" not in href and not oembed_path.is_file():
+            problems.append(f"oEmbed file does not exist: {href}")
+
+    if oembed_url is not None and oembed_url not in head.oembed:
+        problems.append(f"missing oEmbed link to {oembed_url}")
+
+    for (tag, text) in (expected or {}).items():
+        found = meta.get(tag)
+
+        if found is None:
+            if tag not in REQUIRED_TAGS:
+                problems.append(f"missing {tag}")
+
+        elif text not in found:
+            problems.append(f"{tag} is {found[0]!r}, expected {text!r}")
+
+    return (url, problems)
+
+
+def check_pages(tasks, workers=None):
+    """
+    Check many pages, in parallel if there are enough of them to benefit
+
+    :param tasks: (list) Tasks, as taken by check_page
+    :param workers: (int) Maximum number of processes to check pages in
+
+    :returns: (list) (URL, problems) pairs for pages with problems
+    """
+    if workers == 1 or len(tasks) < PARALLEL_THRESHOLD:
+        results = map(check_page, tasks)
+        return [(url, problems) for (url, problems) in results if problems]
+
+    chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 4))
+    logger.debug(f"Validating {len(tasks)} pages")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(check_page, tasks, chunksize=chunksize)
+        return [(url, problems) for (url, problems) in results if problems]
+
+
+def report(results):
+    """
+    Log the problems found, grouped by page
+
+    :param results: (list) (URL, problems) pairs for pages with problems
+    """
+    for (url, problems) in results:
+        logger.warning("\n  - ".join([f"Unfurl problems in {url}:", *problems]))
+
+
+def description_limits(settings):
+    """
+    :param settings: (dict) Enhanced unfurls settings
+
+    :returns: (dict) Description limit of each tag group
+    """
+    limits = dict(DESCRIPTION_LIMITS)
+    limits.update(settings.get("description_limits", {}))
+    return limits
+
+
+@timed("validate_output")
+def validate_output(pelican):
+    """
+    Check the unfurl tags of every page tagged during the build
+
+    :param pelican: (pelican.Pelican) Pelican instance that ran the build
+    """
+    settings = pelican.settings
+    eu_settings = settings.get("ENHANCED_UNFURLS", {})
+
+    if not eu_settings.get("validate", False) or shard_config(eu_settings):
+        return
+
+    output_root = Path(settings["OUTPUT_PATH"])
+    siteurl = settings.get("SITEURL")
+    limits = description_limits(eu_settings)
+    tasks = [
+        (
+            output_root.joinpath(content.save_as),
+            url,
+            {tag: text for (_, tag, text) in content.unfurl.texts()},
+            getattr(content, "oembed_url", None),
+            siteurl,
+            output_root,
+            limits,
+        )
+        for (url, content) in tracked().items()
+    ]
+
+    results = check_pages(tasks, eu_settings.get("validate_workers"))
+    report(results)
+
+    stats.count("pages_validated", len(tasks))
+    stats.count("pages_invalid", len(results))
+    logger.info(f"Unfurl validation: {len(results)} of {len(tasks)} page(s) invalid")
+
+
+def main(argv=None):
+    parser = ArgumentParser(
+        prog="python -m pelican.plugins.enhanced_unfurls.validate",
+        description="Check the unfurl tags of a generated site",
+    )
+    parser.add_argument("output_path", type=Path, help="Generated site to check")
+    parser.add_argument("siteurl", help="Root URL of the site")
+    parser.add_argument(
+        "--workers", type=int, help="Number of processes to check pages in"
+    )
+    for group in ("og", "twitter"):
+        parser.add_argument(
+            f"--{group}-limit",
+            type=int,
+            default=DESCRIPTION_LIMITS[group],
+            help=f"Maximum length of {group}:description",
+        )
+
+    args = parser.parse_args(argv)
+    basicConfig(format="%(message)s")
+    limits = {"og": args.og_limit, "twitter": args.twitter_limit}
+    siteurl = args.siteurl.rstrip("/")
+    tasks = []
+
+    for page in sorted(args.output_path.rglob("*.html")):
+        rel = page.relative_to(args.output_path).as_posix()
+        url = f"{siteurl}/{rel}"
+        tasks.append((page, url, None, None, siteurl, args.output_path, limits))
+
+    results = check_pages(tasks, args.workers)
+    report(results)
+    print(f"{len(results)} of {len(tasks)} page(s) with unfurl problems")
+
+    return 1 if results else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,6 +28,13 @@ def tests(c):
     c.run(f"{CMD_PREFIX}pytest", pty=PTY)
 
 
+@task
+def benchmark(c, sizes="1000 10000 50000", update_baseline=False):
+    """Time the plugin against synthetic sites, failing on regressions."""
+    update_flag = "--update-baseline" if update_baseline else ""
+    c.run(f"{CMD_PREFIX}python -m benchmark.run --sizes {sizes} {update_flag}")
+
+
 @task
 def black(c, check=False, diff=False):
     """Run Black auto-formatter, optionally with `--check` or `--diff`."""
@@ -0,0 +1,73 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from pathlib import Path
+
+from blinker import ANY
+import pytest
+
+from pelican import signals
+from pelican.generators import ArticlesGenerator, StaticGenerator
+from pelican.plugins.enhanced_unfurls.metadata import enhance_metadata
+from pelican.tests.support import get_context, get_settings
+
+
+@pytest.fixture
+def plugin():
+    yield
+
+    # Pelican connects the plugin's handlers itself; leave no trace for other tests
+    for signal in (
+        signals.initialized,
+        signals.all_generators_finalized,
+        signals.article_generator_write_article,
+        signals.page_generator_write_page,
+        signals.get_generators,
+        signals.finalized,
+    ):
+        for receiver in list(signal.receivers_for(ANY)):
+            if receiver.__module__.startswith("pelican.plugins.enhanced_unfurls"):
+                signal.disconnect(receiver)
+
+
+@pytest.fixture
+def build_article(tmpdir):
+    def _build(**eu_settings):
+        """
+        Read the test article and its static content, and enhance its metadata
+
+        :returns: (pelican.contents.Article) Test article
+        """
+        test_data = Path(__file__).parent.joinpath("data")
+        settings = get_settings(
+            PATH=str(test_data),
+            SITEURL="http://example.com",
+            STATIC_PATHS=["static"],
+            ARTICLE_PATHS=["posts"],
+            OUTPUT_PATH=str(tmpdir.join("output")),
+            CACHE_PATH=str(tmpdir.join("cache")),
+            ENHANCED_UNFURLS=eu_settings,
+        )
+        context = get_context(settings)
+        generators = [
+            cls(
+                context=context,
+                settings=settings,
+                path=test_data,
+                theme=settings["THEME"],
+                output_path=settings["OUTPUT_PATH"],
+            )
+            for cls in (StaticGenerator, ArticlesGenerator)
+        ]
+
+        for gen in generators:
+            gen.generate_context()
+
+        enhance_metadata(generators)
+        return generators[1].articles[0]
+
+    return _build
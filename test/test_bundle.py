@@ -0,0 +1,110 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from json import dumps, loads
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+
+from pelican.plugins.enhanced_unfurls.bundle import (
+    INDEX_NAME,
+    BundleReader,
+    endpoint_url,
+    shard_for,
+    shard_name,
+    write_bundle,
+)
+
+
+def make_records(count):
+    for i in range(count):
+        url = f"http://example.com/posts/{i}.html"
+        yield (url, dumps({"url": url, "title": f"Post {i}"}).encode("utf-8"))
+
+
+def test_endpoint_url():
+    assert (
+        endpoint_url("http://example.com/oembed", "http://example.com/a b.html")
+        == "http://example.com/oembed?url=http%3A%2F%2Fexample.com%2Fa%20b.html"
+        "&format=json"
+    )
+
+
+def test_shard_for():
+    url = "http://example.com/posts/1.html"
+    assert shard_for(url, 8) == shard_for(url, 8)
+    assert 0 <= shard_for(url, 8) < 8
+
+
+def test_write_bundle(tmpdir):
+    root = Path(tmpdir).joinpath("oembed")
+    results = write_bundle(make_records(100), root, shards=4)
+
+    assert results["records"] == 100
+    assert results["replaced"] == 5
+    assert sorted(p.name for p in root.iterdir()) == [
+        INDEX_NAME,
+        *(shard_name(i) for i in range(4)),
+    ]
+
+    index = loads(root.joinpath(INDEX_NAME).read_text())
+    assert index["shards"] == 4
+    assert len(index["records"]) == 100
+
+    mtimes = {p.name: p.stat().st_mtime_ns for p in root.iterdir()}
+    assert write_bundle(make_records(100), root, shards=4)["replaced"] == 0
+    assert mtimes == {p.name: p.stat().st_mtime_ns for p in root.iterdir()}
+
+
+def test_write_bundle_failure(tmpdir):
+    root = Path(tmpdir).joinpath("oembed")
+
+    def _records():
+        yield from make_records(5)
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        write_bundle(_records(), root, shards=2)
+
+    assert list(root.iterdir()) == []
+
+
+def test_bundle_reader(tmpdir):
+    root = Path(tmpdir).joinpath("oembed")
+    records = dict(make_records(50))
+    write_bundle(records.items(), root, shards=3)
+
+    reader = BundleReader(root)
+    for (url, data) in records.items():
+        assert reader.lookup(url) == data
+
+    assert reader.lookup("http://example.com/missing.html") is None
+    reader.close()
+
+
+@pytest.mark.parametrize(
+    "query, status",
+    [
+        ["url=http%3A%2F%2Fexample.com%2Fposts%2F1.html&format=json", "200 OK"],
+        ["url=http%3A%2F%2Fexample.com%2Fposts%2F1.html", "200 OK"],
+        ["url=http%3A%2F%2Fexample.com%2Fmissing.html", "404 Not Found"],
+        ["", "404 Not Found"],
+        ["url=http%3A%2F%2Fexample.com%2Fposts%2F1.html&format=xml", "501"],
+    ],
+    ids=["json", "default-format", "missing", "no-url", "xml"],
+)
+def test_bundle_reader_wsgi(query, status, tmpdir):
+    root = Path(tmpdir).joinpath("oembed")
+    write_bundle(make_records(5), root, shards=2)
+    start_response = Mock()
+
+    body = b"".join(BundleReader(root)({"QUERY_STRING": query}, start_response))
+
+    assert start_response.call_args[0][0].startswith(status)
+    if status == "200 OK":
+        assert loads(body)["url"] == "http://example.com/posts/1.html"
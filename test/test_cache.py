@@ -0,0 +1,153 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from pathlib import Path
+from unittest.mock import patch
+
+from pelican.generators import ArticlesGenerator, StaticGenerator
+from pelican.plugins.enhanced_unfurls.cache import get_cache, save_caches
+from pelican.plugins.enhanced_unfurls.metadata import enhance_metadata
+from pelican.plugins.enhanced_unfurls.tagging import insert_tags
+from pelican.tests.support import get_context, get_settings
+
+
+def build(cache_path, **eu_settings):
+    test_data = Path(__file__).parent.joinpath("data")
+
+    settings = get_settings(
+        SITEURL="http://example.com",
+        STATIC_PATHS=["static"],
+        ARTICLE_PATHS=["posts"],
+        CACHE_PATH=str(cache_path),
+        CACHE_CONTENT=True,
+        LOAD_CONTENT_CACHE=True,
+        ENHANCED_UNFURLS=dict(
+            default_lede="{static}/test/data/static/test.png",
+            facebook=True,
+            twitter=True,
+            oembed=True,
+            **eu_settings,
+        ),
+    )
+    context = get_context(settings)
+
+    stat_gen = StaticGenerator(
+        context=context,
+        settings=settings,
+        path=test_data,
+        theme=settings["THEME"],
+        output_path=None,
+    )
+
+    art_gen = ArticlesGenerator(
+        context=context,
+        settings=settings,
+        path=test_data,
+        theme=settings["THEME"],
+        output_path=None,
+    )
+    stat_gen.generate_context()
+    art_gen.generate_context()
+    enhance_metadata([stat_gen, art_gen])
+
+    for article in art_gen.articles:
+        insert_tags(art_gen, article)
+
+        # As rendering a template would
+        article.unfurl_html
+
+    save_caches()
+    return art_gen.articles[0]
+
+
+def test_get_cache_disabled():
+    assert get_cache(get_settings()) is None
+
+
+def test_cache_restores(tmpdir):
+    first = build(tmpdir)
+
+    with patch(
+        "pelican.plugins.enhanced_unfurls.metadata.resolve_metadata"
+    ) as mock_resolve, patch(
+        "pelican.plugins.enhanced_unfurls.tagging.UnfurlPlan.apply"
+    ) as mock_apply:
+        second = build(tmpdir)
+
+    mock_resolve.assert_not_called()
+    mock_apply.assert_not_called()
+    assert second.metadata["lede"] == first.metadata["lede"]
+    assert second.unfurl_og == first.unfurl_og
+    assert second.unfurl_twitter == first.unfurl_twitter
+    assert second.oembed_url == first.oembed_url
+
+
+def test_cache_invalidates_settings(tmpdir):
+    build(tmpdir)
+
+    with patch(
+        "pelican.plugins.enhanced_unfurls.metadata.resolve_metadata", return_value={}
+    ) as mock_resolve:
+        build(tmpdir, default_card_type="summary")
+
+    mock_resolve.assert_called_once()
+
+
+def test_cache_ignores_unkeyed_settings(tmpdir):
+    build(tmpdir)
+
+    with patch(
+        "pelican.plugins.enhanced_unfurls.metadata.resolve_metadata"
+    ) as mock_resolve:
+        build(
+            tmpdir,
+            profile="cpu",
+            stats="cache",
+            oembed_workers=4,
+            remote_ttl=0,
+            remote_probe_bytes=1024,
+        )
+
+    mock_resolve.assert_not_called()
+
+
+def test_cache_invalidates_static(tmpdir):
+    build(tmpdir)
+
+    with patch(
+        "pelican.plugins.enhanced_unfurls.cache.UnfurlCache.static_stamp",
+        return_value="changed",
+    ), patch(
+        "pelican.plugins.enhanced_unfurls.metadata.resolve_metadata", return_value={}
+    ) as mock_resolve:
+        build(tmpdir)
+
+    mock_resolve.assert_called_once()
+
+
+def test_cache_invalidates_remote(tmpdir):
+    lede = "https://example.com/lede.png"
+
+    with patch(
+        "pelican.plugins.enhanced_unfurls.metadata.remote_enabled", return_value=True
+    ), patch(
+        "pelican.plugins.enhanced_unfurls.metadata.verify_inputs",
+        return_value=[{lede: (1000.0, False)}],
+    ):
+        build(tmpdir)
+
+    # Failed checks only keep content cached briefly
+    for (now, expected_calls) in ((1299.0, 0), (1300.0, 1)):
+        with patch(
+            "pelican.plugins.enhanced_unfurls.cache.time", return_value=now
+        ), patch(
+            "pelican.plugins.enhanced_unfurls.metadata.resolve_metadata",
+            return_value={},
+        ) as mock_resolve:
+            build(tmpdir)
+
+        assert mock_resolve.call_count == expected_calls
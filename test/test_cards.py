@@ -0,0 +1,162 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from pathlib import Path
+from shutil import rmtree
+from unittest.mock import Mock, patch
+
+import pytest
+
+from pelican.plugins.enhanced_unfurls import cards
+from pelican.plugins.enhanced_unfurls.cache import settings_key
+from pelican.plugins.enhanced_unfurls.cards import (
+    CARD_CACHE_NAME,
+    CARD_SIZE,
+    card_path,
+    card_spec,
+    cards_enabled,
+    ensure_cards,
+    render_card,
+)
+from pelican.tests.support import get_settings
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.mark.parametrize("background", ["#336699", "static/test.png"])
+def test_render_card(background, tmpdir):
+    spec = (
+        1,
+        " ".join(["Long title"] * 20),
+        "Test Site",
+        "Fri 07 January 2022",
+        str(Path(__file__).parent.joinpath("data", background))
+        if background.startswith("static")
+        else background,
+        None,
+        "#ffffff",
+        None,
+        None,
+    )
+    path = Path(tmpdir).joinpath("cards", "card.png")
+
+    assert render_card(spec, path)
+
+    with Image.open(path) as card:
+        assert card.size == CARD_SIZE
+        assert card.format == "PNG"
+
+
+@patch("pelican.plugins.enhanced_unfurls.cards.logger")
+def test_render_card_missing_background(mock_logger, tmpdir):
+    spec = (
+        1,
+        "Title",
+        "Site",
+        "",
+        str(tmpdir.join("missing.png")),
+        None,
+        "#fff",
+        None,
+        None,
+    )
+    path = Path(tmpdir).joinpath("card.png")
+
+    assert not render_card(spec, path)
+    assert not path.exists()
+    mock_logger.warning.assert_called_once()
+
+
+def test_ensure_cards(tmpdir):
+    context = {
+        "PATH": str(tmpdir),
+        "OUTPUT_PATH": str(tmpdir.join("output")),
+        "CACHE_PATH": str(tmpdir.join("cache")),
+        "SITENAME": "Site",
+    }
+    contents = [
+        Mock(
+            title=f"Title {i}",
+            locale_date="",
+            metadata={"lede_card": f"images/cards/{i}.png"},
+            _context=context,
+        )
+        for i in range(3)
+    ]
+    contents.append(Mock(metadata={}))
+
+    ensure_cards(contents, context, {"card_workers": 2})
+
+    for i in range(3):
+        assert tmpdir.join("output", "images", "cards", f"{i}.png").exists()
+        assert tmpdir.join("cache", CARD_CACHE_NAME, f"{i}.png").exists()
+
+
+def test_card_path():
+    spec = (1, "Title", "Site", "", "#000", None, "#fff", None, None)
+
+    assert card_path(spec, {}).startswith("images/cards/")
+    assert card_path(spec, {"card_path": "cards"}).startswith("cards/")
+    assert card_path(spec, {}) != card_path(spec[:1] + ("Retitled",) + spec[2:], {})
+
+
+def test_card_spec_font(tmpdir):
+    settings = {"social_cards": True, "card_font": "card.ttf"}
+    context = get_settings(
+        PATH=str(tmpdir),
+        CACHE_PATH=str(tmpdir.join("cache")),
+        ENHANCED_UNFURLS=settings,
+    )
+    content = Mock(title="Title", locale_date="", _context=context)
+    font = tmpdir.join("card.ttf")
+
+    font.write("font")
+    before = card_path(card_spec(content, settings), settings)
+    key = settings_key(context)
+
+    # Fonts replaced in place give new cards, and invalidate cached unfurls
+    font.write("other font")
+    assert card_path(card_spec(content, settings), settings) != before
+    assert settings_key(context) != key
+
+
+def test_cards_enabled():
+    assert not cards_enabled({})
+    assert cards_enabled({"social_cards": True})
+
+    with patch.object(cards, "Image", None), patch.object(
+        cards, "_warned_unavailable", False
+    ), patch.object(cards, "logger") as mock_logger:
+        assert not cards_enabled({"social_cards": True})
+        assert not cards_enabled({"social_cards": True})
+        mock_logger.warning.assert_called_once()
+
+
+def test_enhance_metadata_cards(build_article, tmpdir):
+    article = build_article(social_cards=True)
+    card = article.metadata["lede_card"]
+
+    assert article.metadata["lede"] == f"http://example.com/{card}"
+    assert article.metadata["card_type"] == "summary_large_image"
+    assert (article.metadata["lede_width"], article.metadata["lede_height"]) == (
+        CARD_SIZE
+    )
+    assert tmpdir.join("output", card).exists()
+    assert tmpdir.join("cache", CARD_CACHE_NAME, Path(card).name).exists()
+
+    # Cards are copied from the render cache into a clean output directory
+    rmtree(tmpdir.join("output"))
+
+    with patch("pelican.plugins.enhanced_unfurls.cards.render_card") as mock_render:
+        assert build_article(social_cards=True).metadata["lede_card"] == card
+        mock_render.assert_not_called()
+
+    assert tmpdir.join("output", card).exists()
+
+    # Content with a lede has no card
+    article = build_article(social_cards=True, default_lede="{static}/static/test.png")
+    assert "lede_card" not in article.metadata
@@ -0,0 +1,172 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from pathlib import Path
+from unittest.mock import Mock
+
+from pelican import Pelican
+from pelican.generators import ArticlesGenerator, PagesGenerator, StaticGenerator
+from pelican.plugins.enhanced_unfurls.contents import (
+    content_groups,
+    unsignaled_content,
+    written_content,
+)
+from pelican.settings import read_settings
+
+CONTENT = """{title}
+{underline}
+:date: 2022-01-07 12:00
+:slug: {slug}
+:lang: {lang}
+:status: {status}
+
+Some {status} content, {title}.
+"""
+
+
+def make_generator(cls, **contents):
+    gen = Mock(spec=cls)
+    gen.settings = {"ARTICLE_TRANSLATION_ID": "slug", "PAGE_TRANSLATION_ID": "slug"}
+
+    for (name, items) in contents.items():
+        setattr(gen, name, items)
+
+    return gen
+
+
+def test_content_groups():
+    articles = make_generator(
+        ArticlesGenerator,
+        articles=["a1"],
+        translations=["a1-fr"],
+        hidden_articles=["h1"],
+        hidden_translations=[],
+        drafts=["d1"],
+        drafts_translations=["d1-fr"],
+    )
+    groups = [(tid, list(contents)) for (tid, contents) in content_groups(articles)]
+
+    assert groups == [
+        ("slug", ["a1", "a1-fr"]),
+        ("slug", ["h1"]),
+        ("slug", ["d1", "d1-fr"]),
+    ]
+    assert list(unsignaled_content(articles)) == ["d1", "d1-fr"]
+
+
+def test_written_content():
+    articles = make_generator(
+        ArticlesGenerator,
+        articles=["a1", "a2"],
+        translations=["a1-fr"],
+        drafts=["d1"],
+    )
+    pages = make_generator(
+        PagesGenerator,
+        pages=["p1"],
+        hidden_pages=["h1"],
+        draft_pages=["d2"],
+        draft_translations=["d2-fr"],
+    )
+    static = make_generator(StaticGenerator, staticfiles=["s1"])
+
+    assert list(written_content([articles, static, pages])) == [
+        "a1",
+        "a2",
+        "a1-fr",
+        "d1",
+        "p1",
+        "h1",
+        "d2",
+        "d2-fr",
+    ]
+    assert list(unsignaled_content(pages)) == []
+
+
+def test_written_content_build(plugin, tmpdir):
+    root = Path(tmpdir)
+    content = root.joinpath("content")
+    content.joinpath("pages").mkdir(parents=True)
+    sources = {
+        "published.rst": ("published", "en", "published"),
+        "published-fr.rst": ("published", "fr", "published"),
+        "hidden.rst": ("hidden", "en", "hidden"),
+        "draft.rst": ("draft", "en", "draft"),
+        "pages/about.rst": ("about", "en", "published"),
+        "pages/about-fr.rst": ("about", "fr", "published"),
+        "pages/secret.rst": ("secret", "en", "hidden"),
+        "pages/upcoming.rst": ("upcoming", "en", "draft"),
+    }
+
+    for (name, (slug, lang, status)) in sources.items():
+        title = f"{slug} {lang} {status}"
+        content.joinpath(name).write_text(
+            CONTENT.format(
+                title=title,
+                underline="#" * len(title),
+                slug=slug,
+                lang=lang,
+                status=status,
+            )
+        )
+
+    templates = root.joinpath("templates")
+    templates.mkdir()
+
+    for name in ("article.html", "page.html"):
+        var = name.split(".")[0]
+        templates.joinpath(name).write_text(
+            f"<html><head>{{{{ {var}.unfurl_html }}}}</head></html>\n"
+        )
+
+    output = root.joinpath("output")
+    settings = read_settings(
+        override={
+            "PATH": str(content),
+            "OUTPUT_PATH": str(output),
+            "CACHE_PATH": str(root.joinpath("cache")),
+            "SITEURL": "https://example.com",
+            "PLUGINS": ["pelican.plugins.enhanced_unfurls"],
+            "THEME_TEMPLATES_OVERRIDES": [str(templates)],
+            "FEED_ALL_ATOM": None,
+            "CATEGORY_FEED_ATOM": None,
+            "TRANSLATION_FEED_ATOM": None,
+            "AUTHOR_FEED_ATOM": None,
+            "AUTHOR_FEED_RSS": None,
+            "ENHANCED_UNFURLS": {"oembed": True, "alternate_links": True},
+        }
+    )
+    Pelican(settings).run()
+
+    written = [
+        "published.html",
+        "published-fr.html",
+        "hidden.html",
+        "drafts/draft.html",
+        "pages/about.html",
+        "pages/about-fr.html",
+        "pages/secret.html",
+        "drafts/pages/upcoming.html",
+    ]
+
+    # Every piece of content written is unfurled, and has its oEmbed file
+    for path in written:
+        html = output.joinpath(path).read_text()
+        oembed_path = Path(path).with_suffix(".json")
+        og_url = f'<meta property="og:url" content="https://example.com/{path}" />'
+
+        assert og_url in html
+        assert f'href="https://example.com/{oembed_path}"' in html
+        assert output.joinpath(oembed_path).exists()
+
+    # Translations of pages are linked like those of articles
+    about = output.joinpath("pages", "about.html").read_text()
+    assert '<meta property="og:type" content="website" />' in about
+    assert '<meta property="og:type" content="article" />' in (
+        output.joinpath("published.html").read_text()
+    )
+    assert 'hreflang="fr" href="https://example.com/pages/about-fr.html"' in about
@@ -0,0 +1,124 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from pathlib import Path
+from shutil import rmtree
+from unittest.mock import patch
+
+import pytest
+
+from pelican.plugins.enhanced_unfurls import derivatives
+from pelican.plugins.enhanced_unfurls.derivatives import (
+    DERIVATIVE_CACHE_NAME,
+    derivative_specs,
+    derivatives_enabled,
+    render_derivative,
+)
+
+Image = pytest.importorskip("PIL.Image")
+
+TEST_PNG = str(Path(__file__).parent.joinpath("data", "static", "test.png"))
+
+
+DEFAULTS = {"default_lede": "{static}/static/test.png", "lede_derivatives": True}
+
+
+def test_derivative_specs():
+    info = (2400, 1600, "image/jpeg")
+    specs = derivative_specs("/site/images/big.jpeg", info, "abc123", {})
+
+    assert specs == {
+        "og": (
+            "images/ledes/big-abc123-1200x630.jpg",
+            "/site/images/big.jpeg",
+            (1200, 630),
+            "image/jpeg",
+        ),
+        "twitter": (
+            "images/ledes/big-abc123-1200x600.jpg",
+            "/site/images/big.jpeg",
+            (1200, 600),
+            "image/jpeg",
+        ),
+    }
+
+    settings = {"lede_sizes": {"twitter": None}, "derivative_path": "ledes"}
+    specs = derivative_specs("big.gif", (2400, 1600, "image/gif"), "abc", settings)
+    assert specs == {
+        "og": ("ledes/big-abc-1200x630.png", "big.gif", (1200, 630), "image/png")
+    }
+
+    assert derivative_specs("small.png", (800, 400, "image/png"), "abc", {}) == {}
+    assert derivative_specs("tall.png", (1000, 2000, "image/png"), "abc", {}) == {}
+    assert list(derivative_specs("og.png", (1200, 630, "image/png"), "a", {})) == [
+        "twitter"
+    ]
+
+
+@pytest.mark.parametrize("ext", [".jpg", ".png"])
+def test_render_derivative(ext, tmpdir):
+    path = Path(tmpdir).joinpath(f"derivative{ext}")
+
+    assert render_derivative((TEST_PNG, (400, 200)), path)
+
+    with Image.open(path) as derivative:
+        assert derivative.size == (400, 200)
+        assert derivative.format == ("JPEG" if ext == ".jpg" else "PNG")
+
+
+@patch("pelican.plugins.enhanced_unfurls.derivatives.logger")
+def test_render_derivative_missing(mock_logger, tmpdir):
+    path = Path(tmpdir).joinpath("derivative.png")
+
+    assert not render_derivative((str(tmpdir.join("missing.png")), (10, 10)), path)
+    mock_logger.warning.assert_called_once()
+
+
+def test_derivatives_enabled():
+    assert not derivatives_enabled({})
+    assert derivatives_enabled({"lede_derivatives": True})
+
+    with patch.object(derivatives, "Image", None), patch.object(
+        derivatives, "_warned_unavailable", False
+    ), patch.object(derivatives, "logger") as mock_logger:
+        assert not derivatives_enabled({"lede_derivatives": True})
+        assert not derivatives_enabled({"lede_derivatives": True})
+        mock_logger.warning.assert_called_once()
+
+
+def test_enhance_metadata_derivatives(build_article, tmpdir):
+    sizes = {"og": (600, 315), "twitter": (400, 200)}
+    article = build_article(lede_sizes=sizes, **DEFAULTS)
+    metadata = article.metadata
+
+    assert metadata["lede"].startswith("http://example.com/images/ledes/test-")
+    assert metadata["lede"].endswith("-600x315.png")
+    assert metadata["twitter_lede"].endswith("-400x200.png")
+    assert (metadata["lede_width"], metadata["lede_height"]) == (600, 315)
+
+    for (path, _, size) in metadata["lede_derivatives"]:
+        with Image.open(tmpdir.join("output", path)) as derivative:
+            assert derivative.size == size
+
+        assert tmpdir.join("cache", DERIVATIVE_CACHE_NAME, Path(path).name).exists()
+
+    # Derivatives are copied from the render cache into a clean output directory
+    rmtree(tmpdir.join("output"))
+
+    with patch(
+        "pelican.plugins.enhanced_unfurls.derivatives.render_derivative"
+    ) as mock_render:
+        assert (
+            build_article(lede_sizes=sizes, **DEFAULTS).metadata["lede"]
+            == metadata["lede"]
+        )
+        mock_render.assert_not_called()
+
+    # Ledes smaller than every platform's size are used as they are
+    metadata = build_article(**DEFAULTS).metadata
+    assert metadata["lede"] == "http://example.com/static/test.png"
+    assert "lede_derivatives" not in metadata
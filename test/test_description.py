@@ -0,0 +1,36 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import pytest
+
+from pelican.plugins.enhanced_unfurls.description import plain_text, truncate
+
+
+def test_plain_text():
+    summary = "<p>Fish &amp;\n   <em>chips</em></p>\n<p>to go</p>"
+    assert plain_text(summary) == "Fish & chips to go"
+
+
+@pytest.mark.parametrize(
+    "text,limit,expected",
+    [
+        ("Fish and chips", None, "Fish and chips"),
+        ("Fish and chips", 14, "Fish and chips"),
+        ("Fish and chips", 13, "Fish and…"),
+        ("Fish and chips", 9, "Fish and…"),
+        ("Fish and chips", 8, "Fish…"),
+        ("Fish, and chips", 9, "Fish…"),
+        ("Fishandchips", 6, "Fisha…"),
+    ],
+)
+def test_truncate(text, limit, expected):
+    assert truncate(text, limit) == expected
+
+
+def test_truncate_shared():
+    text = " ".join(["word"] * 100)
+    assert truncate(text, 50) is truncate(text[:], 50)
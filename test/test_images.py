@@ -0,0 +1,130 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from pathlib import Path
+from struct import pack
+from unittest.mock import patch
+
+import pytest
+
+from pelican.plugins.enhanced_unfurls.cache import ImageCache
+from pelican.plugins.enhanced_unfurls.images import (
+    fingerprint_file,
+    probe_bytes,
+    probe_image,
+)
+from pelican.tests.support import get_settings
+
+PNG = b"\x89PNG\r\n\x1a\n" + pack(">I4sII", 13, b"IHDR", 1200, 630) + b"\x08\x06"
+GIF = b"GIF89a" + pack("<HH", 400, 300) + b"\x00" * 8
+JPEG = (
+    b"\xff\xd8"
+    + b"\xff\xe1"
+    + pack(">H", 4098)
+    + b"\x00" * 4096
+    + b"\xff\xff\xc2"
+    + pack(">HBHH", 17, 8, 768, 1024)
+    + b"\x00" * 32
+)
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        [PNG, (1200, 630, "image/png")],
+        [GIF, (400, 300, "image/gif")],
+        [JPEG, (1024, 768, "image/jpeg")],
+        [PNG[:20], None],
+        [GIF[:8], None],
+        [JPEG[:4100], None],
+        [b"\xff\xd8\x00\x00", None],
+        [b"\xff\xd8\xff\xd0\xff\xc0\x00", None],
+        [b"BM" + b"\x00" * 30, None],
+        [b"", None],
+    ],
+    ids=[
+        "png",
+        "gif",
+        "jpeg",
+        "short-png",
+        "short-gif",
+        "short-jpeg",
+        "bad-jpeg",
+        "truncated-sof",
+        "bmp",
+        "empty",
+    ],
+)
+def test_probe_image(data, expected, tmpdir):
+    path = Path(tmpdir).joinpath("image")
+    path.write_bytes(data)
+
+    assert probe_image(str(path)) == expected
+    assert probe_bytes(data) == expected
+
+
+def test_probe_image_missing(tmpdir):
+    assert probe_image(str(Path(tmpdir).joinpath("missing.png"))) is None
+
+
+def test_image_cache(tmpdir):
+    path = Path(tmpdir).joinpath("image.png")
+    path.write_bytes(PNG)
+    settings = get_settings(
+        CACHE_PATH=str(tmpdir), CACHE_CONTENT=True, LOAD_CONTENT_CACHE=True
+    )
+
+    cache = ImageCache(settings)
+    assert cache.image_info(str(Path(tmpdir).joinpath("missing.png"))) is None
+    assert cache.image_info(str(path)) == (1200, 630, "image/png")
+    cache.save_cache()
+
+    with patch("pelican.plugins.enhanced_unfurls.cache.probe_image") as mock_probe:
+        assert ImageCache(settings).image_info(str(path)) == (1200, 630, "image/png")
+        mock_probe.assert_not_called()
+
+    path.write_bytes(GIF)
+    assert ImageCache(settings).image_info(str(path)) == (400, 300, "image/gif")
+
+
+def test_fingerprint_file(tmpdir):
+    path = Path(tmpdir).joinpath("image.png")
+    path.write_bytes(PNG)
+    fingerprint = fingerprint_file(str(path))
+
+    assert len(fingerprint) == 12
+    assert fingerprint_file(str(path)) == fingerprint
+
+    path.write_bytes(GIF)
+    assert fingerprint_file(str(path)) != fingerprint
+
+    path.write_bytes(b"")
+    assert len(fingerprint_file(str(path))) == 12
+
+    assert fingerprint_file(str(Path(tmpdir).joinpath("missing.png"))) is None
+
+
+def test_image_cache_fingerprint(tmpdir):
+    path = Path(tmpdir).joinpath("image.png")
+    path.write_bytes(PNG)
+    settings = get_settings(
+        CACHE_PATH=str(tmpdir), CACHE_CONTENT=True, LOAD_CONTENT_CACHE=True
+    )
+
+    cache = ImageCache(settings)
+    fingerprint = cache.fingerprint(str(path))
+    assert fingerprint == fingerprint_file(str(path))
+    cache.save_cache()
+
+    with patch(
+        "pelican.plugins.enhanced_unfurls.cache.fingerprint_file"
+    ) as mock_fingerprint:
+        assert ImageCache(settings).fingerprint(str(path)) == fingerprint
+        mock_fingerprint.assert_not_called()
+
+    path.write_bytes(GIF)
+    assert ImageCache(settings).fingerprint(str(path)) != fingerprint
@@ -0,0 +1,56 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from unittest.mock import Mock, call, patch
+
+from pelican.plugins import enhanced_unfurls
+from pelican.plugins.enhanced_unfurls import finalize, finalize_generators
+
+
+def patched(handlers):
+    manager = Mock()
+    mocks = tuple(
+        Mock(name=handler.__name__, side_effect=getattr(manager, handler.__name__))
+        for handler in handlers
+    )
+    return (manager, mocks)
+
+
+def test_finalize_generators():
+    (manager, mocks) = patched(enhanced_unfurls.GENERATORS_FINALIZED)
+    generators = [Mock()]
+
+    with patch.object(enhanced_unfurls, "GENERATORS_FINALIZED", mocks):
+        finalize_generators(generators)
+
+    # Metadata is enhanced before anything uses it
+    assert manager.mock_calls == [
+        call.enhance_metadata(generators),
+        call.insert_unsignaled_tags(generators),
+        call.add_sources(generators),
+    ]
+
+
+def test_finalize():
+    (manager, mocks) = patched(enhanced_unfurls.FINALIZED)
+    pelican = Mock()
+
+    with patch.object(enhanced_unfurls, "FINALIZED", mocks):
+        finalize(pelican)
+
+    # Tracked output is used before it is reset, and the cache saved after the
+    # manifest's digests; profiles are written before stats are reported
+    assert manager.mock_calls == [
+        call.write_manifest(pelican),
+        call.validate_output(pelican),
+        call.write_shard(pelican),
+        call.reset_tracked(pelican),
+        call.reset_plans(pelican),
+        call.save_caches(pelican),
+        call.write_profiles(pelican),
+        call.report_stats(pelican),
+    ]
@@ -0,0 +1,113 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from json import loads
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+
+from pelican.plugins.enhanced_unfurls.cache import save_caches
+from pelican.plugins.enhanced_unfurls.manifest import MANIFEST_NAME, write_manifest
+from pelican.plugins.enhanced_unfurls.tagging import insert_tags
+from pelican.plugins.enhanced_unfurls.tracking import reset_tracked
+from pelican.tests.support import get_article, get_settings
+
+
+def build(tmpdir, articles, destination="cache"):
+    mock_pelican = Mock()
+    mock_pelican.settings = get_settings(
+        SITEURL="http://example.com",
+        OUTPUT_PATH=str(tmpdir.join("output")),
+        CACHE_PATH=str(tmpdir.join("cache")),
+        ENHANCED_UNFURLS={"oembed": True, "manifest": destination},
+    )
+    mock_gen = Mock()
+    mock_gen.settings = mock_pelican.settings
+
+    for (slug, title, lede) in articles:
+        mock_category = Mock()
+        mock_category.slug = "test"
+        content = get_article(
+            title,
+            "Test content",
+            category=mock_category,
+            slug=slug,
+            url=f"http://example.com/{slug}.html",
+            lede=lede,
+        )
+        insert_tags(mock_gen, content)
+
+    write_manifest(mock_pelican)
+    save_caches()
+    reset_tracked()
+
+    manifest_path = Path(tmpdir.join(destination or "cache", MANIFEST_NAME))
+
+    if not manifest_path.exists():
+        return None
+
+    return [loads(line) for line in manifest_path.read_text().splitlines()]
+
+
+def test_write_manifest(tmpdir):
+    first = build(
+        tmpdir,
+        [("one", "One", "http://example.com/one.png"), ("two", "Two", None)],
+    )
+    assert first == [
+        {
+            "status": "added",
+            "url": "http://example.com/one.html",
+            "images": ["http://example.com/one.png"],
+        },
+        {"status": "added", "url": "http://example.com/two.html", "images": []},
+    ]
+
+    assert build(tmpdir, [("one", "One", "http://example.com/one.png")]) == [
+        {"status": "removed", "url": "http://example.com/two.html", "images": []},
+    ]
+
+    second = build(
+        tmpdir,
+        [("one", "One again", "http://example.com/one.png"), ("three", "3", None)],
+    )
+    assert [(line["status"], line["url"]) for line in second] == [
+        ("changed", "http://example.com/one.html"),
+        ("added", "http://example.com/three.html"),
+    ]
+
+    assert build(tmpdir, [("one", "One again", "http://example.com/one.png")]) == [
+        {"status": "removed", "url": "http://example.com/three.html", "images": []},
+    ]
+
+
+@pytest.mark.parametrize("destination", [None, "output"])
+def test_write_manifest_destination(destination, tmpdir):
+    lines = build(tmpdir, [("one", "One", None)], destination)
+
+    if destination is None:
+        assert lines is None
+        assert not tmpdir.join("output", MANIFEST_NAME).exists()
+    else:
+        assert len(lines) == 1
+
+
+@patch("pelican.plugins.enhanced_unfurls.manifest.logger")
+def test_write_manifest_unwritable(mock_logger, tmpdir):
+    tmpdir.join("blocked").write("")
+    mock_pelican = Mock()
+    mock_pelican.settings = get_settings(
+        OUTPUT_PATH=str(tmpdir.join("blocked", "output")),
+        CACHE_PATH=str(tmpdir.join("cache")),
+        ENHANCED_UNFURLS={"manifest": "output"},
+    )
+
+    write_manifest(mock_pelican)
+    save_caches()
+
+    mock_logger.warning.assert_called_once()
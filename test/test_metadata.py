@@ -11,8 +11,33 @@ from unittest.mock import Mock, patch
 import pytest
 
 from pelican.generators import ArticlesGenerator, StaticGenerator
-from pelican.plugins.enhanced_unfurls.metadata import enhance_metadata, get_metadata
-from pelican.tests.support import get_context, get_settings
+from pelican.plugins.enhanced_unfurls.metadata import (
+    enhance_metadata,
+    first_image,
+    get_metadata,
+    resolve_metadata,
+)
+from pelican.tests.support import get_article, get_context, get_settings
+
+
+@pytest.mark.parametrize(
+    "body, expected",
+    [
+        ["<p>No images here</p>", None],
+        ['<a href="{static}/files/doc.pdf">PDF</a>', None],
+        [
+            '<img src="{static}/images/My%20Image.JPG" />'
+            '<img src="{attach}/images/second.png" />',
+            "images/My Image.JPG",
+        ],
+        ['<img src="{attach}img/first.gif?v=1" />', "posts/img/first.gif"],
+    ],
+    ids=["no-images", "no-valid-images", "absolute", "relative"],
+)
+def test_first_image(body, expected):
+    content = get_article("Test Article", body)
+    content.source_path = str(Path(content.settings["PATH"], "posts", "test.rst"))
+    assert first_image(content) == expected
 
 
 @pytest.mark.parametrize(
@@ -82,10 +107,12 @@ def test_get_metadata(siteurl, lede, locale, default_card, article_card):
         eu_settings["first_image_lede"] = True
 
         if lede.endswith("pres"):
-            content.get_static_links = lambda: {
-                "static/images/skipme.bmp",
-                "test/data/static/test.png",
-            }
+            content._content = (
+                '<a href="{filename}/other.rst">Other</a>'
+                '<img src="{static}/static/images/skipme.bmp" />'
+                '<img src="{static}../static/test.png" />'
+                '<img src="{static}/static/images/later.png" />'
+            )
 
     result = get_metadata(mock_logger, content, eu_settings, siteurl, locale)
 
@@ -110,6 +137,17 @@ def test_get_metadata(siteurl, lede, locale, default_card, article_card):
 
         if lede in ("rel", "def-rel", "fil-pres"):
             assert result["lede"] == "http://example.com/test/data/static/test.png"
+            assert result["lede_width"] == 811
+            assert result["lede_height"] == 811
+            assert result["lede_type"] == "image/png"
+
+            eu_settings["fingerprint_ledes"] = True
+            result = get_metadata(mock_logger, content, eu_settings, siteurl, locale)
+            assert result["lede"].startswith(
+                "http://example.com/test/data/static/test.png?v="
+            )
+        else:
+            assert "lede_width" not in result
     else:
         if lede not in ("abs", "def-abs"):
             assert "lede" not in result
@@ -169,3 +207,56 @@ def test_enhance_metadata(mock_logger, siteurl, default_lede):
         mock_logger.warning.assert_called_once_with(
             "SITEURL not defined; tags requiring full URL will not be generated"
         )
+
+
+def test_resolve_metadata():
+    eu_settings = {}
+    inputs = [
+        {
+            "lede": None,
+            "static_lede": f"images/{i}.png" if i % 2 else None,
+            "lede_info": (1200, 630, "image/png") if i % 2 else None,
+            "lede_fingerprint": "0123456789ab" if i % 4 == 1 else None,
+            "derivatives": None,
+            "card": None,
+            "present": ("type",) if i % 3 else (),
+            "og_type": "article",
+            "lang": "fr" if i == 4 else None,
+            "labels": (i * 100, None) if i == 6 else (None, None),
+            "url": f"posts/{i}.html",
+        }
+        for i in range(10)
+    ]
+
+    for (i, item) in enumerate(inputs):
+        metadata = resolve_metadata(item, eu_settings, "http://example.com", [""])
+
+        assert metadata["url"] == f"http://example.com/posts/{i}.html"
+        assert ("lede" in metadata) == bool(i % 2)
+        assert metadata.get("lede", "").endswith("?v=0123456789ab") == (i % 4 == 1)
+        assert ("lede_width" in metadata) == bool(i % 2)
+        assert ("type" in metadata) != bool(i % 3)
+        assert metadata.get("locale") == ("fr_FR" if i == 4 else None)
+        assert metadata.get("td1") == ("3 min read" if i == 6 else None)
+
+
+def test_resolve_remote_lede():
+    inputs = {
+        "lede": "http://cdn.example.com/lede.jpg",
+        "static_lede": None,
+        "lede_info": (800, 600, "image/jpeg"),
+        "lede_fingerprint": None,
+        "derivatives": None,
+        "card": None,
+        "present": (),
+        "og_type": "article",
+        "lang": None,
+        "labels": (None, None),
+        "url": "posts/remote.html",
+    }
+
+    metadata = resolve_metadata(inputs, {}, "http://example.com", [""])
+
+    assert metadata["lede"] == "http://cdn.example.com/lede.jpg"
+    assert (metadata["lede_width"], metadata["lede_height"]) == (800, 600)
+    assert metadata["lede_type"] == "image/jpeg"
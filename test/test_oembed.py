@@ -5,6 +5,7 @@
 #       Released under version 3.0 of the Non-Profit Open Source License       #
 ################################################################################
 
+from gzip import decompress
 from json import loads
 from pathlib import Path
 from unittest.mock import patch
@@ -12,7 +13,21 @@ from unittest.mock import patch
 import pytest
 
 from pelican.generators import ArticlesGenerator
-from pelican.plugins.enhanced_unfurls.oembed import OEmbedGenerator, add_generator
+from pelican.plugins.enhanced_unfurls.bundle import BundleReader
+from pelican.plugins.enhanced_unfurls.oembed import (
+    FAILED,
+    SKIPPED,
+    WRITTEN,
+    OEmbedGenerator,
+    _gzip,
+    add_generator,
+    add_sources,
+    get_compressors,
+    serialize,
+    write_file,
+    write_files,
+    write_if_changed,
+)
 from pelican.tests.support import get_context, get_settings
 
 
@@ -20,9 +35,84 @@ def test_add_generator():
     assert add_generator(None) is OEmbedGenerator
 
 
+def test_serialize():
+    assert serialize({"b": 1, "a": "\u00e9"}) == serialize({"a": "\u00e9", "b": 1})
+
+
+def test_write_if_changed(tmpdir):
+    path = Path(tmpdir).joinpath("nested", "test.json")
+
+    assert write_if_changed(path, b"{}") == WRITTEN
+    mtime = path.stat().st_mtime_ns
+    assert write_if_changed(path, b"{}") == SKIPPED
+    assert path.stat().st_mtime_ns == mtime
+    assert write_if_changed(path, b"[]") == WRITTEN
+    assert path.read_bytes() == b"[]"
+    assert [p.name for p in path.parent.iterdir()] == ["test.json"]
+
+    path.parent.joinpath("blocked").write_bytes(b"")
+    assert write_if_changed(path.parent.joinpath("blocked", "x.json"), b"") == FAILED
+
+
+def test_gzip():
+    data = b'{"title":"Test"}' * 64
+
+    # Identical input always compresses to identical output
+    assert _gzip(data) == _gzip(data)
+    assert decompress(_gzip(data)) == data
+
+
+@patch("pelican.plugins.enhanced_unfurls.oembed.logger")
+def test_get_compressors(mock_logger):
+    with patch("pelican.plugins.enhanced_unfurls.oembed.brotli_compress", None):
+        compressors = get_compressors(["gzip", "brotli", "zip"])
+
+    assert [ext for (ext, _) in compressors] == [".gz"]
+    assert mock_logger.warning.call_count == 2
+
+    pytest.importorskip("brotli")
+    compressors = get_compressors(["gzip", "brotli"])
+    assert [ext for (ext, _) in compressors] == [".gz", ".br"]
+
+
+def test_write_file_compressed(tmpdir):
+    path = Path(tmpdir).joinpath("test.json")
+    gz_path = Path(tmpdir).joinpath("test.json.gz")
+    compressors = get_compressors(["gzip"])
+    data = serialize({"title": "x" * 512})
+
+    assert write_file(path, data, compressors, 256) == WRITTEN
+    assert decompress(gz_path.read_bytes()) == data
+    mtime = gz_path.stat().st_mtime_ns
+
+    assert write_file(path, data, compressors, 256) == SKIPPED
+    assert gz_path.stat().st_mtime_ns == mtime
+
+    gz_path.unlink()
+    assert write_file(path, data, compressors, 256) == SKIPPED
+    assert decompress(gz_path.read_bytes()) == data
+
+    assert write_file(path, b"{}", compressors, 256) == WRITTEN
+    assert not gz_path.exists()
+
+
+def test_write_files(tmpdir):
+    root = Path(tmpdir)
+    root.joinpath("same.json").write_bytes(b"{}")
+    files = [(root.joinpath(f"{i}.json"), b"{}") for i in range(20)]
+    files.append((root.joinpath("same.json"), b"{}"))
+
+    results = write_files(iter(files), workers=2)
+
+    assert results[WRITTEN] == 20
+    assert results[SKIPPED] == 1
+    assert results[FAILED] == 0
+
+
+@pytest.mark.parametrize("lede_info", [False, True], ids=["no-lede-info", "lede-info"])
 @pytest.mark.parametrize("sitename", ["", "Test Site"], ids=["no-sitename", "sitename"])
 @patch("pelican.plugins.enhanced_unfurls.metadata.logger")
-def test_generate_output(mock_logger, sitename, tmpdir):
+def test_generate_output(mock_logger, sitename, lede_info, tmpdir):
     eu_settings = {"oembed": True}
     test_data = Path(__file__).parent.joinpath("data")
 
@@ -34,13 +124,14 @@ def test_generate_output(mock_logger, sitename, tmpdir):
     )
     context = get_context(settings)
 
-    ArticlesGenerator(
+    art_gen = ArticlesGenerator(
         context=context,
         settings=settings,
         path=test_data,
         theme=settings["THEME"],
         output_path=None,
-    ).generate_context()
+    )
+    art_gen.generate_context()
 
     gen = OEmbedGenerator(
         context=context,
@@ -49,10 +140,20 @@ def test_generate_output(mock_logger, sitename, tmpdir):
         theme=settings["THEME"],
         output_path=str(tmpdir),
     )
+    add_sources([art_gen, gen])
 
     context["articles"][0].metadata["url"] = "http://example.com/test-article.html"
     context["articles"][0].oembed_save_as = "test-article.json"
     context["articles"][0].oembed_url = "http://example.com/test-article.json"
+
+    if lede_info:
+        context["articles"][0].metadata.update(
+            lede="http://example.com/test.png",
+            lede_width=1200,
+            lede_height=630,
+            lede_type="image/png",
+        )
+
     gen.generate_output()
 
     oembed_file = tmpdir.join("test-article.json")
@@ -62,3 +163,51 @@ def test_generate_output(mock_logger, sitename, tmpdir):
     assert oembed_json["title"] == context["articles"][0].metadata["title"]
     if sitename:
         assert oembed_json["provider_name"] == sitename
+
+    if lede_info:
+        assert oembed_json["thumbnail_url"] == "http://example.com/test.png"
+        assert oembed_json["thumbnail_width"] == 1200
+        assert oembed_json["thumbnail_height"] == 630
+    else:
+        assert "thumbnail_url" not in oembed_json
+
+
+@patch("pelican.plugins.enhanced_unfurls.metadata.logger")
+def test_generate_output_bundle(mock_logger, tmpdir):
+    eu_settings = {"oembed": True, "oembed_mode": "bundle", "oembed_shards": 2}
+    test_data = Path(__file__).parent.joinpath("data")
+
+    settings = get_settings(
+        SITENAME="Test Site",
+        STATIC_PATHS=["static"],
+        ARTICLE_PATHS=["posts"],
+        ENHANCED_UNFURLS=eu_settings,
+    )
+    context = get_context(settings)
+
+    art_gen = ArticlesGenerator(
+        context=context,
+        settings=settings,
+        path=test_data,
+        theme=settings["THEME"],
+        output_path=None,
+    )
+    art_gen.generate_context()
+
+    gen = OEmbedGenerator(
+        context=context,
+        settings=settings,
+        path=test_data,
+        theme=settings["THEME"],
+        output_path=str(tmpdir),
+    )
+    add_sources([art_gen, gen])
+
+    context["articles"][0].metadata["url"] = "http://example.com/test-article.html"
+    gen.generate_output()
+
+    reader = BundleReader(Path(tmpdir).joinpath("oembed"))
+    oembed_json = loads(reader.lookup("http://example.com/test-article.html"))
+    assert oembed_json["title"] == context["articles"][0].metadata["title"]
+    assert oembed_json["provider_name"] == "Test Site"
+    assert not tmpdir.join("test-article.json").exists()
@@ -0,0 +1,162 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from pathlib import Path
+from pstats import Stats
+import tracemalloc
+from unittest.mock import Mock, patch
+
+from blinker import ANY
+import pytest
+
+from pelican import signals
+from pelican.plugins.enhanced_unfurls import finalize_generators, metadata, profiling
+from pelican.plugins.enhanced_unfurls.profiling import (
+    HandlerProfile,
+    install_profiling,
+    profile_modes,
+    profiled_as,
+    write_profiles,
+)
+from pelican.tests.support import get_settings
+
+
+@pytest.fixture
+def connected():
+    signals.all_generators_finalized.connect(finalize_generators)
+
+    with patch.dict(profiling._profilers, clear=True):
+        yield
+
+    signals.all_generators_finalized.disconnect(finalize_generators)
+
+
+def make_pelican(tmpdir, profile):
+    mock_pelican = Mock()
+    mock_pelican.settings = get_settings(
+        CACHE_PATH=str(tmpdir), ENHANCED_UNFURLS={"profile": profile}
+    )
+    return mock_pelican
+
+
+def receivers(signal):
+    return list(signal.receivers_for(ANY))
+
+
+@pytest.mark.parametrize(
+    "profile, expected",
+    [
+        [None, set()],
+        ["cpu", {"cpu"}],
+        [["cpu", "memory"], {"cpu", "memory"}],
+        [["memory", "disk"], {"memory"}],
+    ],
+)
+def test_profile_modes(profile, expected):
+    assert profile_modes({"profile": profile}) == expected
+
+
+def test_install_disabled(connected, tmpdir):
+    install_profiling(make_pelican(tmpdir, None))
+    metadata.enhance_metadata([])
+
+    assert not profiling._profilers
+
+
+def test_install(connected, tmpdir):
+    before = receivers(signals.all_generators_finalized)
+    mock_pelican = make_pelican(tmpdir, "cpu")
+
+    install_profiling(mock_pelican)
+    metadata.enhance_metadata([])
+
+    # Handlers are neither swapped nor reordered
+    assert receivers(signals.all_generators_finalized) == before
+    assert set(profiling._profilers) == set(profiling.PROFILED_HANDLERS)
+    assert profiling._profilers["enhance_metadata"].calls == 1
+    assert profiling._profilers["insert_tags"].calls == 0
+    assert profiling._profilers["insert_tags"].cpu
+
+    write_profiles(mock_pelican)
+
+    root = Path(tmpdir).joinpath(profiling.PROFILE_NAME)
+    assert [p.name for p in root.iterdir()] == ["enhance_metadata.pstats"]
+    assert profiling._profilers["enhance_metadata"].calls == 0
+
+
+@patch.dict("pelican.plugins.enhanced_unfurls.profiling._profilers", clear=True)
+def test_profiled_nesting():
+    outer = HandlerProfile("outer", True, False)
+    inner = HandlerProfile("inner", True, False)
+    profiling._profilers.update(outer=outer, inner=inner)
+
+    @profiled_as("inner")
+    def _inner():
+        return sum(range(1000))
+
+    @profiled_as("outer")
+    def _outer():
+        return _inner() + _inner()
+
+    assert _outer() == 2 * sum(range(1000))
+    assert _outer() == 2 * sum(range(1000))
+    assert (outer.calls, inner.calls) == (2, 4)
+
+    outer_funcs = {func for (_, _, func) in Stats(outer.profile).stats}
+    inner_funcs = {func for (_, _, func) in Stats(inner.profile).stats}
+
+    assert "_outer" in outer_funcs
+    assert "_inner" not in outer_funcs
+    assert "_inner" in inner_funcs
+
+
+@patch.dict("pelican.plugins.enhanced_unfurls.profiling._profilers", clear=True)
+def test_profiled_memory():
+    profile = profiling._profilers["handler"] = HandlerProfile("handler", False, True)
+    kept = profiled_as("handler")(lambda: [bytearray(4096) for _ in range(64)])()
+
+    assert len(kept) == 64
+    assert not tracemalloc.is_tracing()
+    assert profile.peak >= 64 * 4096
+
+    (size, count) = max(profile.sites.values())
+    assert size >= 64 * 4096
+    assert count >= 64
+
+
+def test_profiled_disabled():
+    calls = []
+    handler = profiled_as("missing")(lambda: calls.append(1))
+
+    handler()
+
+    assert calls == [1]
+    assert "missing" not in profiling._profilers
+
+
+@patch.dict("pelican.plugins.enhanced_unfurls.profiling._profilers", clear=True)
+def test_write_profiles(tmpdir):
+    profile = HandlerProfile("handler", True, True)
+    idle = HandlerProfile("idle", True, True)
+    profiling._profilers.update(handler=profile, idle=idle)
+    kept = profiled_as("handler")(lambda: [bytearray(4096) for _ in range(64)])()
+    write_profiles(make_pelican(tmpdir, ["cpu", "memory"]))
+
+    root = Path(tmpdir).joinpath(profiling.PROFILE_NAME)
+    report = root.joinpath("handler.allocations.txt").read_text()
+
+    assert len(kept) == 64
+    assert Stats(str(root.joinpath("handler.pstats"))).total_calls > 0
+    assert report.startswith("handler: 1 call(s), peak traced memory")
+    assert "test_profiling.py" in report.splitlines()[2]
+    assert sorted(p.name for p in root.iterdir()) == [
+        "handler.allocations.txt",
+        "handler.pstats",
+    ]
+
+    # Profiles start over for the next build
+    assert profile.calls == 0
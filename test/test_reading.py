@@ -0,0 +1,98 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from unittest.mock import Mock, patch
+
+import pytest
+
+from pelican.plugins.enhanced_unfurls.reading import (
+    count_words,
+    get_label_inputs,
+    reading_time,
+    resolve_labels,
+    word_count,
+)
+
+
+@pytest.mark.parametrize(
+    "html, expected",
+    [
+        ["", 0],
+        ["<p></p>", 0],
+        ["One two  three\nfour", 4],
+        ['<p>One <a href="/two three">two</a>, three.</p>', 3],
+        ["<p>One<br/>two</p>", 2],
+        ["<p>Before</p><script>var a = 1 < 2;</script><p>after</p>", 2],
+        ["<STYLE>p { color: red }</STYLE>Styled", 1],
+        ["<!-- a comment <b>with tags</b> -->Text", 1],
+        ["<p>Q&amp;A &mdash; AT&amp;T (again) &hellip;</p>", 3],
+    ],
+    ids=[
+        "empty",
+        "no-text",
+        "text",
+        "attributes",
+        "adjacent-tags",
+        "script",
+        "style",
+        "comment",
+        "punctuation",
+    ],
+)
+def test_count_words(html, expected):
+    assert count_words(html) == expected
+
+
+@patch("pelican.plugins.enhanced_unfurls.reading._word_counts", {})
+@patch("pelican.plugins.enhanced_unfurls.reading.count_words")
+def test_word_count_memoized(mock_count):
+    mock_count.return_value = 42
+
+    assert word_count("<p>Some content</p>") == 42
+    assert word_count("<p>Some content</p>") == 42
+    assert word_count("<p>Other content</p>") == 42
+    assert mock_count.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "words, wpm, expected",
+    [[0, 230, "1 min read"], [1000, 230, "4 min read"], [1000, 100, "10 min read"]],
+)
+def test_reading_time(words, wpm, expected):
+    assert reading_time(words, wpm) == expected
+
+
+def test_get_label_inputs():
+    content = Mock(_content="<p>Three short words</p>", authors=["Ann", "Bob"])
+
+    assert get_label_inputs(content, {}) == (None, None)
+    assert get_label_inputs(content, {"reading_time": True}) == (3, None)
+    assert get_label_inputs(content, {"written_by": True}) == (None, "Ann, Bob")
+
+    content.authors = []
+    assert get_label_inputs(content, {"written_by": True}) == (None, None)
+
+
+@pytest.mark.parametrize(
+    "present, expected",
+    [
+        [
+            (),
+            {
+                "tl1": "Reading time",
+                "td1": "2 min read",
+                "tl2": "Written by",
+                "td2": "Ann",
+            },
+        ],
+        [("td1",), {"tl2": "Reading time", "td2": "2 min read"}],
+        [("tl1", "tl2"), {}],
+    ],
+    ids=["free", "one-taken", "all-taken"],
+)
+def test_resolve_labels(present, expected):
+    assert resolve_labels((500, "Ann"), present, {}) == expected
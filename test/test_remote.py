@@ -0,0 +1,234 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from struct import pack
+from threading import Thread
+from unittest.mock import patch
+
+import pytest
+
+from pelican.plugins.enhanced_unfurls.cache import save_caches
+from pelican.plugins.enhanced_unfurls.remote import (
+    remote_enabled,
+    verify_inputs,
+    verify_ledes,
+)
+from pelican.tests.support import get_settings
+
+pytest.importorskip("aiohttp")
+
+
+def png(width, height):
+    header = pack(">I4sII", 13, b"IHDR", width, height)
+    return b"\x89PNG\r\n\x1a\n" + header + b"\x08\x06" + b"\x00" * 4096
+
+
+RESOURCES = {
+    "/large.png": ("image/png", png(1200, 630)),
+    "/small.png": ("image/png", png(100, 100)),
+    "/page.html": ("text/html", b"<html></html>"),
+    "/nohead.png": ("image/png", png(800, 800)),
+}
+
+
+# http.server.ThreadingHTTPServer is not available before Python 3.7
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class LedeHandler(BaseHTTPRequestHandler):
+    requests = Counter()
+    ranges = []
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, body):
+        self.requests[(self.command, self.path)] += 1
+
+        if self.path not in RESOURCES:
+            self.send_error(404)
+            return
+
+        if self.command == "HEAD" and self.path == "/nohead.png":
+            self.send_error(405)
+            return
+
+        (content_type, data) = RESOURCES[self.path]
+        etag = f'"{len(data)}"'
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        status = 200
+        byte_range = self.headers.get("Range")
+
+        if byte_range is not None:
+            self.ranges.append(byte_range)
+            end = int(byte_range.rsplit("-", 1)[1])
+            data = data[: end + 1]
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+
+        if body:
+            self.wfile.write(data)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def do_GET(self):
+        self._respond(True)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), LedeHandler)
+    thread = Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    LedeHandler.requests.clear()
+    LedeHandler.ranges.clear()
+
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_settings(tmpdir, **eu_settings):
+    return get_settings(
+        CACHE_PATH=str(tmpdir),
+        ENHANCED_UNFURLS={"verify_remote_ledes": True, **eu_settings},
+    )
+
+
+def test_remote_enabled():
+    assert remote_enabled({"verify_remote_ledes": True})
+    assert not remote_enabled({})
+
+
+@patch("pelican.plugins.enhanced_unfurls.remote.aiohttp", None)
+@patch("pelican.plugins.enhanced_unfurls.remote._warned_unavailable", False)
+@patch("pelican.plugins.enhanced_unfurls.remote.logger")
+def test_remote_enabled_unavailable(mock_logger):
+    assert not remote_enabled({"verify_remote_ledes": True})
+    assert not remote_enabled({"verify_remote_ledes": True})
+    mock_logger.warning.assert_called_once()
+
+
+def test_verify_ledes(server, tmpdir):
+    settings = make_settings(tmpdir, remote_probe_bytes=1024)
+    urls = [f"{server}{path}" for path in ("/large.png", "/small.png", "/large.png")]
+    urls += [f"{server}/missing.png", f"{server}/page.html", f"{server}/nohead.png"]
+
+    results = verify_ledes(urls, settings, settings["ENHANCED_UNFURLS"])
+    save_caches()
+
+    assert results[f"{server}/large.png"]["ok"]
+    assert results[f"{server}/large.png"]["info"] == (1200, 630, "image/png")
+    assert results[f"{server}/small.png"]["info"] == (100, 100, "image/png")
+    assert results[f"{server}/missing.png"]["error"] == "HTTP 404"
+    assert results[f"{server}/page.html"]["error"] == "not an image (text/html)"
+    assert results[f"{server}/nohead.png"]["ok"]
+    assert results[f"{server}/nohead.png"]["info"] == (800, 800, "image/png")
+
+    # Each lede is requested once, and only partly downloaded
+    assert LedeHandler.requests[("HEAD", "/large.png")] == 1
+    assert LedeHandler.requests[("GET", "/large.png")] == 1
+    assert LedeHandler.requests[("GET", "/missing.png")] == 0
+    assert set(LedeHandler.ranges) == {"bytes=0-1023"}
+
+
+def test_verify_ledes_cached(server, tmpdir):
+    settings = make_settings(tmpdir)
+    url = f"{server}/large.png"
+
+    verify_ledes([url], settings, settings["ENHANCED_UNFURLS"])
+    save_caches()
+    LedeHandler.requests.clear()
+
+    # Results within their TTL are used without any requests
+    results = verify_ledes([url], settings, settings["ENHANCED_UNFURLS"])
+    save_caches()
+
+    assert results[url]["info"] == (1200, 630, "image/png")
+    assert not LedeHandler.requests
+
+    # Expired results are revalidated with their ETag
+    settings["ENHANCED_UNFURLS"]["remote_ttl"] = 0
+    results = verify_ledes([url], settings, settings["ENHANCED_UNFURLS"])
+    save_caches()
+
+    assert results[url]["info"] == (1200, 630, "image/png")
+    assert LedeHandler.requests == Counter({("HEAD", "/large.png"): 1})
+
+
+def test_verify_ledes_unreachable(tmpdir):
+    settings = make_settings(tmpdir, remote_timeout=2)
+    url = "http://127.0.0.1:9/lede.png"
+
+    results = verify_ledes([url], settings, settings["ENHANCED_UNFURLS"])
+    save_caches()
+
+    assert not results[url]["ok"]
+    assert results[url]["error"]
+
+
+@patch("pelican.plugins.enhanced_unfurls.remote.logger")
+def test_verify_inputs(mock_logger, server, tmpdir):
+    settings = make_settings(tmpdir)
+    missing = {"lede": f"{server}/missing.png", "lede_info": None}
+    inputs = [
+        {"lede": f"{server}/large.png", "lede_info": None},
+        {"lede": f"{server}/small.png", "lede_info": None},
+        missing,
+        dict(missing),
+        {"lede": None, "lede_info": None},
+        {"lede": "/relative.png", "lede_info": None},
+    ]
+
+    remote_deps = verify_inputs(inputs, settings, settings["ENHANCED_UNFURLS"])
+    save_caches()
+
+    assert inputs[0]["lede_info"] == (1200, 630, "image/png")
+    assert inputs[1]["lede_info"] == (100, 100, "image/png")
+    assert inputs[2]["lede"] is None
+    assert inputs[3]["lede"] is None
+    assert inputs[5] == {"lede": "/relative.png", "lede_info": None}
+
+    assert remote_deps[0][f"{server}/large.png"][1]
+    assert not remote_deps[2][f"{server}/missing.png"][1]
+    assert remote_deps[4] == remote_deps[5] == {}
+
+    # Ledes are only warned about once each
+    assert mock_logger.warning.call_count == 2
+
+
+def test_verify_ledes_failure_ttl(server, tmpdir):
+    settings = make_settings(tmpdir)
+    url = f"{server}/missing.png"
+
+    verify_ledes([url], settings, settings["ENHANCED_UNFURLS"])
+    save_caches()
+    LedeHandler.requests.clear()
+
+    # Failures are kept for less time than results
+    settings["ENHANCED_UNFURLS"]["remote_failure_ttl"] = 0
+    results = verify_ledes([url], settings, settings["ENHANCED_UNFURLS"])
+    save_caches()
+
+    assert results[url]["error"] == "HTTP 404"
+    assert LedeHandler.requests == Counter({("HEAD", "/missing.png"): 1})
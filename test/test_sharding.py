@@ -0,0 +1,263 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from json import loads
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+from markupsafe import Markup
+import pytest
+
+from pelican import Pelican
+from pelican.plugins.enhanced_unfurls import metadata, sharding
+from pelican.plugins.enhanced_unfurls.cache import settings_key
+from pelican.plugins.enhanced_unfurls.sharding import (
+    ARTIFACT_VERSION,
+    artifact_name,
+    artifact_tags,
+    in_shard,
+    load_artifacts,
+    merged_entry,
+    shard_config,
+    shard_of,
+    write_artifact,
+    write_shard,
+)
+from pelican.plugins.enhanced_unfurls.tagging import UnfurlPlan, restore_tags
+from pelican.settings import read_settings
+from pelican.tests.support import get_settings
+
+ARTICLE = """{title}
+{underline}
+:date: 2022-01-{day:02d} 12:00
+:author: Jeremy
+:category: Test
+:slug: {slug}
+:lang: {lang}
+:lede: {{static}}/images/lede.png
+
+Article {title}, with enough words to have a summary worth unfurling.
+"""
+
+
+@pytest.fixture
+def site(tmpdir):
+    root = Path(tmpdir)
+    content = root.joinpath("content")
+    content.joinpath("images").mkdir(parents=True)
+    content.joinpath("images", "lede.png").write_bytes(
+        Path(__file__).parent.joinpath("data", "static", "test.png").read_bytes()
+    )
+
+    for day in range(1, 13):
+        slug = f"article-{day}"
+        posts = [(slug, "en")] + ([(slug, "fr")] if day % 3 == 0 else [])
+
+        for (slug, lang) in posts:
+            title = f"{slug} {lang}"
+            content.joinpath(f"{slug}-{lang}.rst").write_text(
+                ARTICLE.format(
+                    title=title,
+                    underline="#" * len(title),
+                    day=day,
+                    slug=slug,
+                    lang=lang,
+                )
+            )
+
+    templates = root.joinpath("templates")
+    templates.mkdir()
+    templates.joinpath("article.html").write_text(
+        "<html><head>{{ article.unfurl_html }}</head></html>\n"
+    )
+
+    return root
+
+
+def build(site, name, **eu_settings):
+    settings = read_settings(
+        override={
+            "PATH": str(site.joinpath("content")),
+            "OUTPUT_PATH": str(site.joinpath(name, "output")),
+            "CACHE_PATH": str(site.joinpath(name, "cache")),
+            "SITEURL": "https://example.com",
+            "STATIC_PATHS": ["images"],
+            "PLUGINS": ["pelican.plugins.enhanced_unfurls"],
+            "THEME_TEMPLATES_OVERRIDES": [str(site.joinpath("templates"))],
+            "FEED_ALL_ATOM": None,
+            "CATEGORY_FEED_ATOM": None,
+            "TRANSLATION_FEED_ATOM": None,
+            "AUTHOR_FEED_ATOM": None,
+            "AUTHOR_FEED_RSS": None,
+            "ENHANCED_UNFURLS": {
+                "oembed": True,
+                "manifest": "cache",
+                "alternate_links": True,
+                **eu_settings,
+            },
+        }
+    )
+    Pelican(settings).run()
+
+    return site.joinpath(name)
+
+
+def tree(root):
+    return {
+        str(path.relative_to(root)): path.read_bytes()
+        for path in root.rglob("*")
+        if path.is_file()
+    }
+
+
+@pytest.mark.parametrize(
+    "settings, expected",
+    [
+        [{}, None],
+        [{"shard_count": 4}, None],
+        [{"shard_index": 0, "shard_count": 1}, None],
+        [{"shard_index": 2, "shard_count": 4}, (2, 4)],
+    ],
+)
+def test_shard_config(settings, expected):
+    assert shard_config(settings) == expected
+
+
+@patch("pelican.plugins.enhanced_unfurls.sharding._warned_invalid", False)
+@patch("pelican.plugins.enhanced_unfurls.sharding.logger")
+def test_shard_config_invalid(mock_logger):
+    assert shard_config({"shard_index": 4, "shard_count": 4}) is None
+    assert shard_config({"shard_index": -1, "shard_count": 4}) is None
+    mock_logger.error.assert_called_once()
+
+
+def test_shard_of():
+    keys = [f"posts/article-{i}.md" for i in range(200)]
+    shards = [shard_of(key, 4) for key in keys]
+
+    # Stable across runs and processes, and spread over every shard
+    assert shards == [shard_of(key, 4) for key in keys]
+    assert shard_of("posts/article-0.md", 4) == 1
+    assert set(shards) == {0, 1, 2, 3}
+
+
+def test_in_shard():
+    content = Mock(relative_source_path="posts/article-0.md")
+
+    assert in_shard(content, None)
+    assert [in_shard(content, (i, 4)) for i in range(4)] == [
+        False,
+        True,
+        False,
+        False,
+    ]
+
+
+def test_merged_entry(tmpdir):
+    source = Path(tmpdir).joinpath("article.md")
+    source.write_text("Title: Article\n")
+    content = Mock(
+        relative_source_path="article.md", source_path=str(source), metadata={}
+    )
+    settings = get_settings(
+        CACHE_PATH=str(tmpdir), ENHANCED_UNFURLS={"shard_index": 0, "shard_count": 2}
+    )
+
+    with patch.object(sharding, "shard_of", return_value=0):
+        sharding.collect(content, {"url": "https://example.com/article.html"})
+        write_shard(Mock(settings=settings))
+
+    root = Path(tmpdir).joinpath(sharding.SHARD_PATH)
+    assert [p.name for p in root.iterdir()] == [artifact_name(0, 2)]
+
+    settings["ENHANCED_UNFURLS"] = {"shard_merge": True}
+    entry = merged_entry(content, settings)
+    assert entry["metadata"] == {"url": "https://example.com/article.html"}
+    assert entry["translations"] == (None, None)
+
+    # Entries computed from a different source file are not used
+    write_shard(Mock(settings=settings))
+    source.write_text("Title: Changed\n")
+    assert merged_entry(content, settings) is None
+
+    # Nor are artifacts built with other settings
+    write_shard(Mock(settings=settings))
+    source.write_text("Title: Article\n")
+    settings["SITEURL"] = "https://example.org"
+    assert merged_entry(content, settings) is None
+
+    write_shard(Mock(settings=settings))
+
+
+def test_artifact_tags(tmpdir):
+    settings = get_settings(
+        CACHE_PATH=str(tmpdir),
+        SITEURL="https://example.com",
+        ENHANCED_UNFURLS={"twitter": True},
+    )
+    plan = UnfurlPlan(settings)
+    record = plan.apply({"title": "Article", "locale_alternates": ("fr", "de")})
+    tags = {
+        "record": {"unfurl": record},
+        "oembed": {},
+        "html": {"unfurl_html": record.html()},
+    }
+    artifact = {
+        "version": ARTIFACT_VERSION,
+        "shard": (0, 2),
+        "key": settings_key(settings),
+        "entries": {"article.md": {"tags": artifact_tags(tags)}},
+    }
+    write_artifact(
+        sharding.shard_root(settings).joinpath(artifact_name(0, 2)), artifact
+    )
+
+    loaded = load_artifacts(settings)["article.md"]["tags"]
+    restore_tags(loaded, plan)
+
+    # Tags read back render the same as those computed
+    assert loaded["record"]["unfurl"].values == record.values
+    assert loaded["record"]["unfurl"].html() == record.html()
+    assert loaded["html"]["unfurl_html"] == tags["html"]["unfurl_html"]
+    assert isinstance(loaded["html"]["unfurl_html"], Markup)
+
+
+def test_sharded_build(plugin, site):
+    single = build(site, "single")
+
+    for index in range(3):
+        node = build(
+            site,
+            f"node-{index}",
+            shard_index=index,
+            shard_count=3,
+            shard_path=str(site.joinpath("shards")),
+        )
+
+        # Shard builds leave the output of the whole site to the merge build
+        assert not node.joinpath("cache", "enhanced_unfurls_manifest.jsonl").exists()
+
+    artifacts = list(site.joinpath("shards").iterdir())
+    assert len(artifacts) == 3
+
+    # Artifacts are plain JSON, never unpickled
+    for path in artifacts:
+        assert loads(path.read_text())["version"] == ARTIFACT_VERSION
+
+    with patch.object(metadata, "get_inputs", wraps=metadata.get_inputs) as inputs:
+        merged = build(
+            site, "merged", shard_merge=True, shard_path=str(site.joinpath("shards"))
+        )
+
+    # Every result was taken from the artifacts
+    inputs.assert_not_called()
+
+    assert tree(merged.joinpath("output")) == tree(single.joinpath("output"))
+    assert (
+        merged.joinpath("cache", "enhanced_unfurls_manifest.jsonl").read_text()
+        == single.joinpath("cache", "enhanced_unfurls_manifest.jsonl").read_text()
+    )
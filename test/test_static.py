@@ -0,0 +1,92 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from unittest.mock import Mock
+
+import pytest
+
+from pelican.plugins.enhanced_unfurls.static import (
+    StaticIndex,
+    get_static_index,
+    is_static_link,
+    normalize,
+)
+
+STATIC_CONTENT = {
+    "images/static-site.png": "root-image",
+    "posts/images/attached.png": "post-image",
+    "images/My Image.png": "spaced-image",
+}
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ["images/a.png", "images/a.png"],
+        ["/images/a.png", "images/a.png"],
+        ["images\\a.png", "images/a.png"],
+        ["posts/../images/./a.png", "images/a.png"],
+        ["images/My%20Image.png", "images/My Image.png"],
+    ],
+)
+def test_normalize(path, expected):
+    assert normalize(path) == expected
+
+
+def test_is_static_link():
+    assert is_static_link("{static}/images/a.png")
+    assert is_static_link("{attach}images/a.png")
+    assert is_static_link("|static|images/a.png")
+    assert not is_static_link("http://example.com/images/a.png")
+
+
+@pytest.mark.parametrize(
+    "link, expected",
+    [
+        ["{static}/images/static-site.png", "root-image"],
+        ["{static}images/static-site.png", "root-image"],
+        ["{attach}/images/static-site.png", "root-image"],
+        ["{static}/images/My%20Image.png", "spaced-image"],
+        ["{static}images/attached.png", "post-image"],
+        ["{attach}./images/attached.png", "post-image"],
+        ["{static}../posts/images/attached.png", "post-image"],
+        ["{static}/images/attached.png", None],
+        ["{static}/images/missing.png", None],
+    ],
+)
+def test_static_index_resolve(link, expected):
+    content = Mock()
+    content.relative_dir = "posts"
+    index = StaticIndex(STATIC_CONTENT)
+
+    assert index.resolve(link, content)[1] == expected
+    assert index.resolve(link, content)[1] == expected
+
+
+def test_static_index_resolve_no_content():
+    index = StaticIndex(STATIC_CONTENT)
+
+    assert index.resolve("{static}images/attached.png") == (
+        "images/attached.png",
+        None,
+    )
+    assert index.resolve("{static}./images/static-site.png") == (
+        "images/static-site.png",
+        "root-image",
+    )
+
+
+def test_get_static_index():
+    static_content = dict(STATIC_CONTENT)
+    context = {"static_content": static_content}
+    index = get_static_index(context)
+
+    assert get_static_index(context) is index
+
+    static_content["images/new.png"] = "new-image"
+    assert get_static_index(context).get("images/new.png")[1] == "new-image"
+    assert get_static_index({"static_content": {}}).size == 0
@@ -0,0 +1,103 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from json import loads
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+
+from pelican.plugins.enhanced_unfurls.stats import (
+    STATS_NAME,
+    BuildStats,
+    report_stats,
+    stats,
+    timed,
+)
+from pelican.tests.support import get_settings
+
+
+def test_build_stats():
+    build_stats = BuildStats()
+    build_stats.count("things")
+    build_stats.count("things", 2)
+    build_stats.record("handler", 0.5)
+    build_stats.record("handler", 0.25)
+
+    assert build_stats.as_dict() == {
+        "timings": {"handler": {"calls": 2, "seconds": 0.75}},
+        "counters": {"things": 3},
+    }
+
+    build_stats.reset()
+    assert build_stats.as_dict() == {"timings": {}, "counters": {}}
+
+
+def test_timed():
+    stats.reset()
+
+    @timed("test")
+    def handler(fail):
+        if fail:
+            raise ValueError
+
+        return "result"
+
+    assert handler(False) == "result"
+
+    with pytest.raises(ValueError):
+        handler(True)
+
+    assert stats.timings["test"][0] == 2
+    stats.reset()
+
+
+@pytest.mark.parametrize("destination", [None, "output", "cache"])
+@patch("pelican.plugins.enhanced_unfurls.stats.logger")
+def test_report_stats(mock_logger, destination, tmpdir):
+    mock_pelican = Mock()
+    mock_pelican.settings = get_settings(
+        OUTPUT_PATH=str(tmpdir.join("output")),
+        CACHE_PATH=str(tmpdir.join("cache")),
+        ENHANCED_UNFURLS={"stats": destination},
+    )
+
+    stats.reset()
+    report_stats(mock_pelican)
+    mock_logger.info.assert_not_called()
+
+    stats.record("insert_tags", 0.5)
+    stats.count("summaries_computed")
+    report_stats(mock_pelican)
+
+    mock_logger.info.assert_any_call("insert_tags: 1 call(s) in 0.500s")
+    mock_logger.info.assert_any_call("summaries_computed: 1")
+    assert stats.as_dict() == {"timings": {}, "counters": {}}
+
+    for root in ("output", "cache"):
+        stats_path = Path(tmpdir.join(root, STATS_NAME))
+
+        if root == destination:
+            recorded = loads(stats_path.read_text())
+            assert recorded["counters"] == {"summaries_computed": 1}
+        else:
+            assert not stats_path.exists()
+
+
+@patch("pelican.plugins.enhanced_unfurls.stats.logger")
+def test_report_stats_unwritable(mock_logger, tmpdir):
+    tmpdir.join("blocked").write("")
+    mock_pelican = Mock()
+    mock_pelican.settings = get_settings(
+        CACHE_PATH=str(tmpdir.join("blocked", "cache")),
+        ENHANCED_UNFURLS={"stats": "cache"},
+    )
+
+    stats.record("insert_tags", 0.5)
+    report_stats(mock_pelican)
+
+    mock_logger.warning.assert_called_once()
@@ -6,11 +6,19 @@
 ################################################################################
 
 from datetime import datetime
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
+from jinja2 import Template
 import pytest
 
-from pelican.plugins.enhanced_unfurls.tagging import insert_tags, map_to_tags
+from pelican.plugins.enhanced_unfurls import tagging
+from pelican.plugins.enhanced_unfurls.tagging import (
+    UnfurlPlan,
+    get_plan,
+    insert_tags,
+    map_to_tags,
+    reset_plans,
+)
 from pelican.tests.support import get_article, get_settings
 
 
@@ -35,6 +43,91 @@ def test_map_to_tags():
     assert result.get("dest-key-3") == "1969-04-20"
 
 
+def test_unfurl_plan():
+    eu_settings = {
+        "twitter": True,
+        "tag_maps": {
+            "og": {"lede": None, "series": "article:section"},
+            "fb": {"fb_admins": "fb:admins"},
+        },
+    }
+    settings = get_settings(ENHANCED_UNFURLS=eu_settings)
+    plan = UnfurlPlan(settings)
+
+    assert get_plan(settings) is get_plan(settings)
+    assert get_plan(settings) is not get_plan(get_settings(ENHANCED_UNFURLS={}))
+    assert "fb" not in plan.groups
+    assert ("lede", "og:image", None) not in plan.entries
+    assert ("series", "article:section", None) in plan.entries
+
+    record = plan.apply(
+        {
+            "title": "Test Article",
+            "lede": "http://example.com/test.png",
+            "series": "Tests",
+            "date": datetime(1969, 4, 20, 10, 17, 0),
+        }
+    )
+
+    assert record.fb is None
+    assert list(record.og.items()) == [
+        ("og:title", "Test Article"),
+        ("article:published_time", "1969-04-20"),
+        ("article:section", "Tests"),
+    ]
+    assert record.og["article:section"] == "Tests"
+    assert "og:image" not in record.og
+    assert len(record.twitter) == 2
+    assert dict(record.twitter) == {
+        "twitter:title": "Test Article",
+        "twitter:image": "http://example.com/test.png",
+    }
+
+    with pytest.raises(KeyError):
+        record.og["og:image"]
+
+
+def test_tag_view_tags():
+    record = UnfurlPlan(get_settings()).apply(
+        {"title": "Test Article", "locale": "en", "locale_alternates": ("fr", "de")}
+    )
+    template = Template(
+        "{% for tag, value in unfurl_og.tags() %}"
+        '<meta property="{{ tag }}" content="{{ value|striptags|e }}" />\n'
+        "{% endfor %}"
+    )
+
+    assert record.og["og:locale:alternate"] == ("fr", "de")
+    assert template.render(unfurl_og=record.og).splitlines() == [
+        '<meta property="og:title" content="Test Article" />',
+        '<meta property="og:locale" content="en" />',
+        '<meta property="og:locale:alternate" content="fr" />',
+        '<meta property="og:locale:alternate" content="de" />',
+    ]
+
+
+def test_unfurl_record_html():
+    settings = get_settings(ENHANCED_UNFURLS={"twitter": True})
+    record = UnfurlPlan(settings).apply(
+        {
+            "title": 'Fish & "Chips"',
+            "summary": "<p>Crispy &amp; <em>hot</em></p>",
+        }
+    )
+
+    html = record.html("http://example.com/a?b=1&c=2")
+
+    assert html.splitlines() == [
+        '<link rel="alternate" type="application/json+oembed" '
+        'href="http://example.com/a?b=1&amp;c=2" />',
+        '<meta property="og:title" content="Fish &amp; &#34;Chips&#34;" />',
+        '<meta property="og:description" content="Crispy &amp; hot" />',
+        '<meta name="twitter:title" content="Fish &amp; &#34;Chips&#34;" />',
+        '<meta name="twitter:description" content="Crispy &amp; hot" />',
+    ]
+    assert "<link" not in record.html()
+
+
 @pytest.mark.parametrize(
     "output_fmt",
     ["posts/{slug}/index.html", "posts/{slug}.html"],
@@ -74,6 +167,7 @@ def test_insert_tags(siteurl, output_fmt):
     mock_content.settings["ARTICLE_SAVE_AS"] = output_fmt
 
     insert_tags(mock_gen, mock_content)
+    assert mock_content.unfurl.og == mock_content.unfurl_og
     assert hasattr(mock_content, "unfurl_og")
     assert len(mock_content.unfurl_og) == 8 if siteurl else 7
     assert mock_content.unfurl_og["article:published_time"] == "1969-04-20"
@@ -104,7 +198,15 @@ def test_insert_tags(siteurl, output_fmt):
     assert mock_content.unfurl_twitter["twitter:label2"] == content_md["tl2"]
     assert mock_content.unfurl_twitter["twitter:data2"] == content_md["td2"]
 
+    assert '<meta property="og:title" content="Test Article" />' in (
+        mock_content.unfurl_html
+    )
+    assert '<meta name="twitter:site" content="@examplecom" />' in (
+        mock_content.unfurl_html
+    )
+
     if siteurl:
+        assert mock_content.oembed_url in mock_content.unfurl_html
         assert mock_content.unfurl_og["og:description"] == content_md["summary"]
         assert (
             mock_content.unfurl_twitter["twitter:description"] == content_md["summary"]
@@ -117,3 +219,118 @@ def test_insert_tags(siteurl, output_fmt):
             assert mock_content.oembed_save_as.endswith("test-article.json")
 
         assert hasattr(mock_content, "oembed_url")
+
+
+@pytest.mark.parametrize(
+    "endpoint", [None, "http://example.com/oembed"], ids=["no-endpoint", "endpoint"]
+)
+def test_insert_tags_bundle(endpoint):
+    eu_settings = {"oembed": True, "oembed_mode": "bundle", "oembed_endpoint": endpoint}
+    mock_gen = Mock()
+    mock_gen.settings = get_settings(
+        SITEURL="http://example.com", ENHANCED_UNFURLS=eu_settings
+    )
+    mock_content = get_article(
+        "Test Article", "Test article content", url="http://example.com/test.html"
+    )
+
+    insert_tags(mock_gen, mock_content)
+
+    assert not hasattr(mock_content, "oembed_save_as")
+    if endpoint:
+        assert mock_content.oembed_url == (
+            "http://example.com/oembed?url=http%3A%2F%2Fexample.com%2Ftest.html"
+            "&format=json"
+        )
+    else:
+        assert not hasattr(mock_content, "oembed_url")
+
+
+def test_insert_tags_lazy():
+    mock_gen = Mock()
+    mock_gen.settings = get_settings(
+        SITEURL="http://example.com", ENHANCED_UNFURLS={"oembed": True}
+    )
+    mock_category = Mock()
+    mock_category.slug = "test"
+    mock_content = get_article(
+        "Test Article",
+        "Test article content",
+        category=mock_category,
+        url="http://example.com/test.html",
+    )
+    mock_content.get_summary = Mock(return_value="Test summary")
+
+    insert_tags(mock_gen, mock_content)
+    mock_content.get_summary.assert_not_called()
+    assert "unfurl" not in vars(mock_content)
+
+    assert mock_content.unfurl_og["og:description"] == "Test summary"
+    assert "unfurl_html" not in vars(mock_content)
+    assert mock_content.oembed_url in mock_content.unfurl_html
+    assert not hasattr(mock_content, "unfurl_fb")
+    mock_content.get_summary.assert_called_once()
+
+    assert not hasattr(get_article("Untagged", "Untagged content"), "unfurl")
+
+
+def test_insert_tags_description():
+    eu_settings = {"twitter": True, "description_limits": {"twitter": 20}}
+    mock_gen = Mock()
+    mock_gen.settings = get_settings(
+        SITEURL="http://example.com", ENHANCED_UNFURLS=eu_settings
+    )
+    summary = "<p>A <em>rather</em> long summary, which goes on &amp; on</p>"
+    mock_content = get_article("Test Article", "Test content", summary=summary)
+
+    insert_tags(mock_gen, mock_content)
+
+    og_desc = mock_content.unfurl_og["og:description"]
+    assert og_desc == "A rather long summary, which goes on & on"
+    assert mock_content.unfurl_twitter["twitter:description"] == "A rather long…"
+    assert mock_content.metadata["summary"] == summary
+    assert 'content="A rather long summary, which goes on &amp; on"' in (
+        mock_content.unfurl_html
+    )
+
+    # Settings only change between builds
+    reset_plans()
+    mock_gen.settings["ENHANCED_UNFURLS"]["description_limits"] = {"twitter": None}
+    mock_content = get_article("Test Article", "Test content", summary=summary)
+    insert_tags(mock_gen, mock_content)
+
+    assert mock_content.unfurl_twitter["twitter:description"] is og_desc
+
+
+def test_insert_tags_settings_key():
+    mock_gen = Mock()
+    mock_gen.settings = get_settings(
+        SITEURL="http://example.com", CACHE_CONTENT=True, ENHANCED_UNFURLS={}
+    )
+
+    with patch.object(tagging, "settings_key", wraps=tagging.settings_key) as key:
+        with patch.object(tagging, "get_cache") as mock_cache:
+            mock_cache.return_value.get_entry.return_value = None
+
+            for title in ("First", "Second"):
+                insert_tags(mock_gen, get_article(title, "Test content"))
+
+            reset_plans()
+            insert_tags(mock_gen, get_article("Third", "Test content"))
+
+    # Keyed once per build, however many pieces of content are tagged
+    assert key.call_count == 2
+    assert mock_cache.return_value.get_entry.call_count == 3
+
+
+def test_unfurl_plan_source_overrides():
+    plan = UnfurlPlan(get_settings(ENHANCED_UNFURLS={"twitter": True}))
+    metadata = {"lede": "http://example.com/lede.png"}
+
+    record = plan.apply(metadata)
+    assert record.og["og:image"] == record.twitter["twitter:image"]
+
+    metadata["twitter_lede"] = "http://example.com/lede-2x1.png"
+    record = plan.apply(metadata)
+    assert record.og["og:image"] == "http://example.com/lede.png"
+    assert record.twitter["twitter:image"] == "http://example.com/lede-2x1.png"
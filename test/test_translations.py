@@ -0,0 +1,97 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from unittest.mock import Mock
+
+import pytest
+
+from pelican.plugins.enhanced_unfurls.tagging import insert_tags
+from pelican.plugins.enhanced_unfurls.translations import (
+    group_translations,
+    og_locale,
+    translation_key,
+)
+from pelican.tests.support import get_article, get_settings
+
+
+def article(slug, lang, **metadata):
+    content = get_article(slug.title(), "Content", slug=slug, lang=lang, **metadata)
+    content.metadata["url"] = f"http://example.com/{slug}-{lang}.html"
+    return content
+
+
+def test_translation_key():
+    content = article("test", "en")
+
+    assert translation_key(None) is None
+    assert translation_key("slug")(content) == "test"
+    assert translation_key(("slug", "lang"))(content) == ("test", "en")
+    assert translation_key("missing")(content) is None
+
+
+@pytest.mark.parametrize(
+    "lang, expected",
+    [
+        ["fr", "fr_FR"],
+        ["pt-br", "pt_BR"],
+        ["en_GB", "en_GB"],
+        ["xx", "xx"],
+    ],
+)
+def test_og_locale(lang, expected):
+    assert og_locale(lang) == expected
+
+
+def test_group_translations():
+    en = article("test", "en", locale="en_US")
+    fr = article("test", "fr", locale="fr_FR")
+    de = article("test", "de")
+    other = article("other", "en", locale="en_US")
+
+    group_translations([en, other, fr, de], "slug")
+
+    assert en.metadata["locale_alternates"] == ("fr_FR", "de_DE")
+    assert fr.metadata["locale_alternates"] == ("en_US", "de_DE")
+    assert de.metadata["locale_alternates"] == ("en_US", "fr_FR")
+    assert de.metadata["locale"] == "de_DE"
+    assert en.metadata["alternates"] == (
+        ("fr", "http://example.com/test-fr.html"),
+        ("de", "http://example.com/test-de.html"),
+    )
+    assert "locale_alternates" not in other.metadata
+    assert "alternates" not in other.metadata
+
+    unrelated = [article("test", "en"), article("test", "fr")]
+    group_translations(unrelated, None)
+    assert "alternates" not in unrelated[0].metadata
+    assert "locale" not in unrelated[0].metadata
+
+    # Without LOCALE, content in the default language is advertised, and
+    # advertises itself, by its language
+    (en, fr) = (article("test", "en"), article("test", "fr"))
+    group_translations([en, fr], "slug")
+    assert en.metadata["locale"] == fr.metadata["locale_alternates"][0] == "en_US"
+    assert fr.metadata["locale"] == en.metadata["locale_alternates"][0] == "fr_FR"
+
+
+def test_translation_tags():
+    mock_gen = Mock()
+    mock_gen.settings = get_settings(ENHANCED_UNFURLS={"alternate_links": True})
+    en = article("test", "en", locale="en_US")
+    fr = article("test", "fr", locale="fr_FR")
+    de = article("test", "de", locale="de_DE")
+
+    group_translations([en, fr, de], "slug")
+    insert_tags(mock_gen, en)
+
+    assert en.unfurl_og["og:locale:alternate"] == ("fr_FR", "de_DE")
+    assert '<meta property="og:locale:alternate" content="fr_FR" />' in en.unfurl_html
+    assert '<meta property="og:locale:alternate" content="de_DE" />' in en.unfurl_html
+    assert (
+        '<link rel="alternate" hreflang="fr" href="http://example.com/test-fr.html" />'
+        in en.unfurl_html
+    )
@@ -0,0 +1,194 @@
+################################################################################
+#                               enhanced-unfurls                               #
+#  Generate metadata for improved link unfurls in Facebook/Slack/Twitter/etc.  #
+#                             (C)2022 Jeremy Brown                             #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+
+from pelican.plugins.enhanced_unfurls.tagging import insert_tags
+from pelican.plugins.enhanced_unfurls.tracking import reset_tracked
+from pelican.plugins.enhanced_unfurls.validate import (
+    check_page,
+    check_pages,
+    main,
+    parse_head,
+    validate_output,
+)
+from pelican.tests.support import get_article, get_settings
+
+SITEURL = "http://example.com"
+LIMITS = {"og": 20, "twitter": None}
+
+GOOD_HEAD = """<!DOCTYPE html>
+<html><head>
+<title>Test</title>
+<link rel="alternate" type="application/json+oembed"
+      href="http://example.com/test.json" />
+<meta property="og:url" content="http://example.com/test.html" />
+<meta property="og:title" content="Fish &amp; Chips" />
+<meta property="og:type" content="article" />
+<meta property="og:image" content="http://example.com/images/test.png?v=1" />
+<meta property="og:description" content="Crispy" />
+</head>
+"""
+
+
+def write_site(root, head=GOOD_HEAD):
+    root.joinpath("images").mkdir(parents=True, exist_ok=True)
+    root.joinpath("images", "test.png").write_bytes(b"")
+    root.joinpath("test.json").write_text("{}")
+    page = root.joinpath("test.html")
+    page.write_text(head + "<body>" + "<p>Body</p>" * 1000 + "</body></html>")
+    return page
+
+
+def task(page, expected=None, oembed_url=None):
+    return (
+        page,
+        "http://example.com/test.html",
+        expected,
+        oembed_url,
+        SITEURL,
+        page.parent,
+        LIMITS,
+    )
+
+
+def test_parse_head(tmpdir):
+    page = write_site(Path(tmpdir), GOOD_HEAD + '<meta property="og:late" content="x">')
+
+    head = parse_head(page, chunk_size=64)
+    assert head.done
+    assert head.meta["og:title"] == ["Fish & Chips"]
+    assert head.oembed == ["http://example.com/test.json"]
+    assert "og:late" not in head.meta
+
+
+def test_check_page(tmpdir):
+    page = write_site(Path(tmpdir))
+    expected = {"og:title": "Fish & Chips", "og:description": "Crispy"}
+
+    assert check_page(task(page, expected, "http://example.com/test.json")) == (
+        "http://example.com/test.html",
+        [],
+    )
+
+    (_, problems) = check_page(
+        task(page, {"og:title": "Fish", "og:locale": "en_US"}, "http://x/o.json")
+    )
+    assert problems == [
+        "missing oEmbed link to http://x/o.json",
+        "og:title is 'Fish & Chips', expected 'Fish'",
+        "missing og:locale",
+    ]
+
+
+def test_check_page_broken(tmpdir):
+    head = """<html><head>
+<link type="application/json+oembed" href="http://example.com/missing.json" />
+<link type="application/json+oembed" href="http://example.com/oembed?url=x" />
+<meta property="og:title" content="Test" />
+<meta property="og:image" content="/images/test.png" />
+<meta name="twitter:image" content="http://example.com/images/missing.png" />
+<meta property="og:description" content="Far too long a description" />
+<meta name="twitter:description" content="Far too long a description" />
+</head>"""
+    page = write_site(Path(tmpdir), head)
+
+    (_, problems) = check_page(task(page))
+    assert problems == [
+        "missing og:url",
+        "missing og:type",
+        "og:image is not an absolute URL: /images/test.png",
+        "twitter:image does not exist: http://example.com/images/missing.png",
+        "og:description is 26 characters, over 20",
+        "oEmbed file does not exist: http://example.com/missing.json",
+    ]
+
+    # Pages without unfurl tags are not checked unless they were tagged
+    page.write_text("<html><head><title>Index</title></head></html>")
+    assert check_page(task(page)) == ("http://example.com/test.html", [])
+    assert check_page(task(page, {}))[1] == [
+        "missing og:url",
+        "missing og:title",
+        "missing og:type",
+    ]
+
+    assert check_page(task(Path(tmpdir).joinpath("missing.html")))[1][0].startswith(
+        "page could not be read"
+    )
+
+
+@pytest.mark.parametrize("workers", [1, 2], ids=["serial", "parallel"])
+def test_check_pages(workers, tmpdir):
+    good = write_site(Path(tmpdir).joinpath("good"))
+    bad = write_site(
+        Path(tmpdir).joinpath("bad"), "<head><meta property='og:x' content='x'>"
+    )
+
+    with patch("pelican.plugins.enhanced_unfurls.validate.PARALLEL_THRESHOLD", 1):
+        results = check_pages([task(good), task(bad)] * 3, workers)
+
+    assert len(results) == 3
+    assert all(problems[0] == "missing og:url" for (_, problems) in results)
+
+
+@patch("pelican.plugins.enhanced_unfurls.validate.logger")
+def test_validate_output(mock_logger, tmpdir):
+    output_path = Path(tmpdir)
+    settings = get_settings(
+        SITEURL=SITEURL,
+        OUTPUT_PATH=str(output_path),
+        ENHANCED_UNFURLS={"validate": True, "twitter": True},
+    )
+    mock_gen = Mock()
+    mock_gen.settings = settings
+
+    mock_category = Mock()
+    mock_category.slug = "test"
+
+    for (slug, broken) in (("good", False), ("bad", True)):
+        content = get_article(
+            "Test",
+            "Test content",
+            category=mock_category,
+            slug=slug,
+            url=f"{SITEURL}/{slug}.html",
+            type="article",
+        )
+        content.metadata["url"] = f"{SITEURL}/{slug}.html"
+        insert_tags(mock_gen, content)
+        html = str(content.unfurl_html)
+
+        if broken:
+            html = html.replace("twitter:title", "twitter:headline")
+
+        page = output_path.joinpath(content.save_as)
+        page.parent.mkdir(parents=True, exist_ok=True)
+        page.write_text(f"<html><head>{html}</head><body></body></html>")
+
+    mock_pelican = Mock()
+    mock_pelican.settings = settings
+    validate_output(mock_pelican)
+    reset_tracked()
+
+    mock_logger.warning.assert_called_once_with(
+        f"Unfurl problems in {SITEURL}/bad.html:\n  - missing twitter:title"
+    )
+    mock_logger.info.assert_called_once_with(
+        "Unfurl validation: 1 of 2 page(s) invalid"
+    )
+
+
+def test_main(tmpdir, capsys):
+    write_site(Path(tmpdir))
+    Path(tmpdir).joinpath("index.html").write_text("<html><head></head></html>")
+
+    assert main([str(tmpdir), "http://example.com/"]) == 0
+    assert main([str(tmpdir), "http://example.com", "--og-limit", "3"]) == 1
+    assert "1 of 2 page(s)" in capsys.readouterr().out